@@ -11,11 +11,23 @@ from typing import Dict, Optional, List
 from dataclasses import dataclass
 import json
 import os
+import time
+
+from .material_catalog import material_catalog
+from .file_utils import atomic_write_json
+from .metrics import LatencyHistogram
+from .cost_index import cost_index, PriceBook
+from .regions import region_registry
+from .config import settings
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Orígenes de precios que son relevamientos de mercado reales: solo con ellos se publican
+# factores de mercado (los valores simulados o derivados del índice no corrigen las cotizaciones)
+MARKET_PRICE_SOURCES = frozenset({"indec"})
+
 @dataclass
 class ConstructionPrices:
     """Precios de construcción por tipo y región"""
@@ -26,6 +38,7 @@ class ConstructionPrices:
     labor_m2: float        # USD por m2
     finishes_m2: float     # USD por m2
     last_updated: datetime
+    source: str = "indice"  # Origen de los valores (ver MARKET_PRICE_SOURCES)
 
 @dataclass
 class ExchangeRate:
@@ -35,32 +48,6 @@ class ExchangeRate:
     last_updated: datetime
     source: str
 
-@dataclass
-class RegionalMultipliers:
-    """Multiplicadores regionales por provincia"""
-    buenos_aires: float = 1.0
-    cordoba: float = 0.95
-    santa_fe: float = 0.92
-    mendoza: float = 0.88
-    tucuman: float = 0.85
-    entre_rios: float = 0.90
-    chaco: float = 0.83
-    corrientes: float = 0.87
-    misiones: float = 0.89
-    formosa: float = 0.82
-    chubut: float = 0.93
-    rio_negro: float = 0.91
-    neuquen: float = 0.94
-    la_pampa: float = 0.86
-    san_luis: float = 0.84
-    la_rioja: float = 0.81
-    catamarca: float = 0.83
-    santiago: float = 0.80
-    salta: float = 0.86
-    jujuy: float = 0.85
-    san_juan: float = 0.87
-    tierra_fuego: float = 1.15
-
 class ArgentinaAPIService:
     """Servicio principal para APIs de Argentina"""
     
@@ -70,6 +57,22 @@ class ArgentinaAPIService:
         self.cache_duration = timedelta(hours=12)
         self.last_update: Optional[datetime] = None
         
+        # Cache en memoria (nivel 1), respaldado por el archivo de cache (nivel 2)
+        self._cached_prices: Optional[ConstructionPrices] = None
+        self._cached_exchange_rate: Optional[ExchangeRate] = None
+        
+        # Tipo de cambio: carrera entre fuentes con orden de preferencia y plazo
+        self.fx_source_priority = self._parse_fx_source_priority(settings.FX_SOURCE_PRIORITY)
+        self.fx_deadline = settings.FX_DEADLINE_MS / 1000
+        self.fx_source_latency: Dict[str, LatencyHistogram] = {
+            source: LatencyHistogram() for source in self._get_exchange_sources()
+        }
+        # Fuentes canceladas sin responder, fuera del histograma: por plazo o porque ganó una preferida
+        self.fx_cancellations: Dict[str, Dict[str, int]] = {
+            source: {"deadline": 0, "superseded": 0} for source in self._get_exchange_sources()
+        }
+        self.last_exchange_selection: Optional[Dict] = None
+        
         # Precios base en USD (actualizados según mercado argentino real)
         self.base_prices = {
             "steel_frame": {
@@ -92,59 +95,112 @@ class ArgentinaAPIService:
             }
         }
         
-        # Multiplicadores regionales
-        self.regional_multipliers = RegionalMultipliers()
+        # Libro de precios base, re-cotizado con el índice de costo de construcción
+        self.base_price_book = PriceBook(
+            {
+                (tipo, componente): valor
+                for tipo, componentes in self.base_prices.items()
+                for componente, valor in componentes.items()
+            },
+            settings.ARGENTINA_BASE_PRICES_DATE,
+            cost_index
+        )
         
         # Inicializar
         self._load_cache()
     
     async def __aenter__(self):
         """Context manager entry"""
-        self.session = aiohttp.ClientSession()
+        await self._get_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
-        if self.session:
+        await self.close()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Sesión HTTP reutilizable, creada bajo demanda"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        return self.session
+    
+    async def close(self):
+        """Cerrar la sesión HTTP"""
+        if self.session and not self.session.closed:
             await self.session.close()
+        self.session = None
     
     def _load_cache(self):
-        """Cargar cache desde archivo"""
+        """Cargar cache desde archivo al nivel en memoria (arranque en caliente)"""
         try:
             if os.path.exists(self.cache_file):
                 with open(self.cache_file, 'r') as f:
                     cache_data = json.load(f)
-                    self.last_update = datetime.fromisoformat(cache_data.get('last_update', ''))
-                    logger.info(f"Cache cargado desde: {self.last_update}")
+                last_update = datetime.fromisoformat(cache_data.get('last_update', ''))
+                data = cache_data.get('data', {})
+                
+                prices = data.get('prices')
+                if prices:
+                    self._cached_prices = ConstructionPrices(
+                        steel_frame_m2=float(prices['steel_frame_m2']),
+                        industrial_m2=float(prices['industrial_m2']),
+                        container_m2=float(prices['container_m2']),
+                        materials_m2=float(prices['materials_m2']),
+                        labor_m2=float(prices['labor_m2']),
+                        finishes_m2=float(prices['finishes_m2']),
+                        last_updated=last_update,
+                        source=prices.get('source', 'cache')
+                    )
+                
+                exchange_rate = data.get('exchange_rate')
+                if exchange_rate:
+                    self._cached_exchange_rate = ExchangeRate(
+                        ars_usd=float(exchange_rate['ars_usd']),
+                        usd_ars=float(exchange_rate['usd_ars']),
+                        last_updated=last_update,
+                        source=exchange_rate.get('source', 'cache')
+                    )
+                
+                # Sin precios utilizables el cache no cuenta como vigente
+                self.last_update = last_update if self._cached_prices else None
+                logger.info(f"Cache cargado desde: {self.last_update}")
         except Exception as e:
             logger.warning(f"Error cargando cache: {e}")
             self.last_update = None
+            self._cached_prices = None
+            self._cached_exchange_rate = None
     
     def _save_cache(self, data: Dict):
-        """Guardar cache en archivo"""
+        """Guardar cache en archivo (escritura atómica)"""
         try:
             cache_data = {
-                'last_update': datetime.now().isoformat(),
+                'last_update': (self.last_update or datetime.now()).isoformat(),
                 'data': data
             }
-            with open(self.cache_file, 'w') as f:
-                json.dump(cache_data, f, default=str)
+            atomic_write_json(self.cache_file, cache_data)
             logger.info("Cache guardado exitosamente")
         except Exception as e:
             logger.error(f"Error guardando cache: {e}")
     
+    def _get_cached_prices(self) -> Optional[ConstructionPrices]:
+        """Precios del cache en memoria"""
+        return self._cached_prices
+    
+    def get_cached_exchange_rate(self) -> Optional[ExchangeRate]:
+        """Tipo de cambio usado en la última actualización de precios"""
+        return self._cached_exchange_rate
+    
+    def _is_cache_fresh(self) -> bool:
+        return (self._cached_prices is not None and self.last_update is not None and
+                datetime.now() - self.last_update < self.cache_duration)
+    
     async def get_exchange_rate(self) -> ExchangeRate:
         """Obtener tipo de cambio ARS/USD desde múltiples fuentes"""
         try:
-            # Intentar Banco Central de Argentina (API oficial)
-            bcra_rate = await self._get_bcra_rate()
-            if bcra_rate:
-                return bcra_rate
-            
-            # Fallback: API alternativa (dólar blue promedio)
-            blue_rate = await self._get_blue_rate()
-            if blue_rate:
-                return blue_rate
+            # Consultar todas las fuentes en paralelo; gana la preferida que responda a tiempo
+            rate = await self._race_exchange_sources()
+            if rate:
+                return rate
             
             # Fallback: Valor estimado basado en datos históricos
             logger.warning("Usando tipo de cambio estimado")
@@ -165,6 +221,95 @@ class ArgentinaAPIService:
                 source="emergencia"
             )
     
+    def _get_exchange_sources(self) -> Dict:
+        """Fuentes de tipo de cambio disponibles, por nombre"""
+        return {
+            "bcra": self._get_bcra_rate,
+            "blue": self._get_blue_rate
+        }
+    
+    def _parse_fx_source_priority(self, value: str) -> List[str]:
+        """Valida FX_SOURCE_PRIORITY al iniciar; sin ninguna fuente válida se usa el orden por defecto"""
+        sources = self._get_exchange_sources()
+        names = [source.strip().lower() for source in value.split(",") if source.strip()]
+        unknown = [name for name in names if name not in sources]
+        if unknown:
+            logger.warning(f"⚠️ FX_SOURCE_PRIORITY: fuentes desconocidas ignoradas {unknown} (disponibles: {list(sources)})")
+        order = list(dict.fromkeys(name for name in names if name in sources))
+        if not order:
+            default = type(settings).model_fields["FX_SOURCE_PRIORITY"].default
+            logger.warning(f"⚠️ FX_SOURCE_PRIORITY='{value}' no tiene fuentes válidas: se usa '{default}'")
+            order = [source.strip() for source in default.split(",")]
+        return order
+    
+    async def _race_exchange_sources(self) -> Optional[ExchangeRate]:
+        """Consulta las fuentes en paralelo y elige la de mayor preferencia disponible dentro del plazo"""
+        sources = self._get_exchange_sources()
+        order = [name for name in self.fx_source_priority if name in sources]
+        latencies: Dict[str, Optional[float]] = {name: None for name in order}
+        results: Dict[str, Optional[ExchangeRate]] = {}
+        
+        async def timed(name: str):
+            # Solo las llamadas que terminan cuentan en el histograma: una cancelada no midió nada
+            start = time.perf_counter()
+            result = await sources[name]()
+            elapsed = time.perf_counter() - start
+            latencies[name] = round(elapsed * 1000, 2)
+            self.fx_source_latency[name].record(elapsed)
+            return result
+        
+        tasks = {asyncio.create_task(timed(name)): name for name in order}
+        pending = set(tasks)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.fx_deadline
+        
+        try:
+            while pending:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results[tasks[task]] = None if task.exception() else task.result()
+                
+                # La fuente preferida que respondió gana si todas las anteriores ya fallaron
+                for name in order:
+                    if name not in results:
+                        break
+                    if results[name]:
+                        return self._select_exchange_rate(name, results[name], latencies)
+            
+            # Plazo agotado o todas terminaron: mejor respuesta disponible
+            for name in order:
+                if results.get(name):
+                    return self._select_exchange_rate(name, results[name], latencies)
+            
+            self._select_exchange_rate(None, None, latencies)
+            return None
+        finally:
+            reason = "deadline" if loop.time() >= deadline else "superseded"
+            for task in pending:
+                task.cancel()
+                self.fx_cancellations[tasks[task]][reason] += 1
+    
+    def _select_exchange_rate(self, name: Optional[str], rate: Optional[ExchangeRate],
+                              latencies: Dict[str, Optional[float]]) -> Optional[ExchangeRate]:
+        """Registra la fuente elegida y las latencias de la consulta"""
+        self.last_exchange_selection = {
+            'source': name or 'estimado',
+            'latencies_ms': dict(latencies),
+            'selected_at': datetime.now().isoformat()
+        }
+        logger.info(f"Tipo de cambio: fuente elegida {self.last_exchange_selection['source']}, latencias {latencies}")
+        return rate
+    
+    def get_exchange_source_stats(self) -> Dict:
+        """Histogramas de latencia por fuente de tipo de cambio y sus cancelaciones"""
+        return {
+            name: {**histogram.snapshot(), "cancellations": dict(self.fx_cancellations[name])}
+            for name, histogram in self.fx_source_latency.items()
+        }
+    
     async def _get_bcra_rate(self) -> Optional[ExchangeRate]:
         """Obtener tipo de cambio del Banco Central"""
         try:
@@ -192,7 +337,7 @@ class ArgentinaAPIService:
                             return ExchangeRate(
                                 ars_usd=ars_usd,
                                 usd_ars=last_value,
-                                last_update=datetime.now(),
+                                last_updated=datetime.now(),
                                 source="BCRA"
                             )
         except Exception as e:
@@ -228,12 +373,11 @@ class ArgentinaAPIService:
         
         return None
     
-    async def get_construction_prices(self) -> ConstructionPrices:
+    async def get_construction_prices(self, force_refresh: bool = False) -> ConstructionPrices:
         """Obtener precios de construcción actualizados"""
         try:
             # Verificar si necesitamos actualizar cache
-            if (self.last_update and 
-                datetime.now() - self.last_update < self.cache_duration):
+            if not force_refresh and self._is_cache_fresh():
                 logger.info("Usando precios en cache")
                 return self._get_cached_prices()
             
@@ -252,22 +396,29 @@ class ArgentinaAPIService:
                     materials_m2=indec_prices['materials'] * exchange_rate.ars_usd,
                     labor_m2=indec_prices['labor'] * exchange_rate.ars_usd,
                     finishes_m2=indec_prices['finishes'] * exchange_rate.ars_usd,
-                    last_updated=datetime.now()
+                    last_updated=datetime.now(),
+                    # _get_indec_prices todavía devuelve valores simulados: pasar a "indec"
+                    # cuando consulte la fuente oficial
+                    source="indec_simulado"
                 )
             else:
-                # Usar precios base actualizados con inflación
-                inflation_multiplier = self._calculate_inflation_multiplier()
+                # Usar precios base ajustados por el índice de costo a la fecha actual
+                book = self.base_price_book.current()
                 prices = ConstructionPrices(
-                    steel_frame_m2=self.base_prices['steel_frame']['total'] * inflation_multiplier,
-                    industrial_m2=self.base_prices['industrial']['total'] * inflation_multiplier,
-                    container_m2=self.base_prices['container']['total'] * inflation_multiplier,
-                    materials_m2=45.0 * inflation_multiplier,
-                    labor_m2=35.0 * inflation_multiplier,
-                    finishes_m2=25.0 * inflation_multiplier,
-                    last_updated=datetime.now()
+                    steel_frame_m2=book[('steel_frame', 'total')],
+                    industrial_m2=book[('industrial', 'total')],
+                    container_m2=book[('container', 'total')],
+                    materials_m2=book[('steel_frame', 'materials')],
+                    labor_m2=book[('steel_frame', 'labor')],
+                    finishes_m2=book[('steel_frame', 'finishes')],
+                    last_updated=datetime.now(),
+                    source="indice"
                 )
             
-            # Guardar en cache
+            # Actualizar cache en memoria y en disco
+            self.last_update = prices.last_updated
+            self._cached_prices = prices
+            self._cached_exchange_rate = exchange_rate
             self._save_cache({
                 'exchange_rate': {
                     'ars_usd': exchange_rate.ars_usd,
@@ -280,11 +431,11 @@ class ArgentinaAPIService:
                     'container_m2': prices.container_m2,
                     'materials_m2': prices.materials_m2,
                     'labor_m2': prices.labor_m2,
-                    'finishes_m2': prices.finishes_m2
+                    'finishes_m2': prices.finishes_m2,
+                    'source': prices.source
                 }
             })
             
-            self.last_update = datetime.now()
             return prices
             
         except Exception as e:
@@ -297,7 +448,8 @@ class ArgentinaAPIService:
                 materials_m2=45.0,
                 labor_m2=35.0,
                 finishes_m2=25.0,
-                last_updated=datetime.now()
+                last_updated=datetime.now(),
+                source="emergencia"
             )
     
     async def _get_indec_prices(self) -> Optional[Dict]:
@@ -328,57 +480,24 @@ class ArgentinaAPIService:
             logger.warning(f"Error obteniendo precios INDEC: {e}")
             return None
     
-    def _calculate_inflation_multiplier(self) -> float:
-        """Calcular multiplicador de inflación basado en datos históricos"""
-        # Basado en inflación promedio mensual de Argentina (aproximadamente 4-6%)
-        # Este valor debería actualizarse mensualmente
-        monthly_inflation = 0.05  # 5% mensual
-        months_since_base = 6     # 6 meses desde precios base
-        
-        return (1 + monthly_inflation) ** months_since_base
-    
     def get_regional_multiplier(self, province: str) -> float:
         """Obtener multiplicador regional por provincia"""
-        province_lower = province.lower().replace(' ', '_')
-        
-        if hasattr(self.regional_multipliers, province_lower):
-            return getattr(self.regional_multipliers, province_lower)
-        
-        # Valor por defecto para provincias no especificadas
-        return 0.90
+        return region_registry.multiplier("argentina", province)
     
     def get_material_price(self, material_id: str, quantity: float = 1.0) -> float:
-        """Obtener precio de material específico"""
-        # Precios base de materiales en USD (actualizados)
-        material_prices = {
-            'acero_estructural': 2.5,      # USD/kg
-            'perfiles_metalicos': 3.2,     # USD/m
-            'tornillos': 0.15,             # USD/unidad
-            'pintura': 8.5,                # USD/litro
-            'aislante': 12.0,              # USD/m2
-            'techo_metalico': 15.0,        # USD/m2
-            'piso_cemento': 18.0,          # USD/m2
-            'ventanas': 45.0,              # USD/unidad
-            'puertas': 120.0,              # USD/unidad
-            'instalacion_electrica': 25.0, # USD/m2
-            'instalacion_sanitaria': 30.0, # USD/m2
-            'ceramica': 22.0,              # USD/m2
-            'griferia': 85.0,              # USD/unidad
-            'iluminacion': 35.0,           # USD/unidad
-        }
-        
-        base_price = material_prices.get(material_id, 0.0)
+        """Obtener precio de material específico (USD, según el catálogo unificado)"""
+        base_price = material_catalog.get_price_usd(material_id) or 0.0
         return base_price * quantity
 
 # Instancia global del servicio
 argentina_api_service = ArgentinaAPIService()
 
-async def get_current_prices() -> ConstructionPrices:
-    """Función helper para obtener precios actuales"""
-    async with ArgentinaAPIService() as service:
-        return await service.get_construction_prices()
+async def get_current_prices(force_refresh: bool = False) -> ConstructionPrices:
+    """Función helper para obtener precios actuales (servidos desde el cache si está vigente)"""
+    await argentina_api_service._get_session()
+    return await argentina_api_service.get_construction_prices(force_refresh)
 
 async def get_current_exchange_rate() -> ExchangeRate:
     """Función helper para obtener tipo de cambio actual"""
-    async with ArgentinaAPIService() as service:
-        return await service.get_exchange_rate()
+    await argentina_api_service._get_session()
+    return await argentina_api_service.get_exchange_rate()
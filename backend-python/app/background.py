@@ -0,0 +1,130 @@
+"""
+Ejecutor de tareas en segundo plano sobre el event loop principal
+Concurrencia acotada, timeout por tarea y cancelación ordenada al cerrar la aplicación.
+La cola también es acotada: pasada la marca de agua alta se rechaza el trabajo no esencial
+(la API responde 503 con Retry-After) y solo se acepta el esencial hasta el máximo absoluto.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+from typing import Any, Callable, Dict, Optional, Set
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundQueueFullError(Exception):
+    """La cola de tareas en segundo plano no acepta más trabajo por ahora"""
+
+
+class BackgroundJobRunner:
+    """Corre corrutinas (y funciones bloqueantes en hilos) fuera del ciclo de la request"""
+
+    def __init__(self, max_concurrency: int, default_timeout: float, high_water_mark: int, max_queued: int):
+        self.max_concurrency = max_concurrency
+        self.default_timeout = default_timeout
+        self.high_water_mark = high_water_mark
+        self.max_queued = max(max_queued, high_water_mark)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    @property
+    def active(self) -> int:
+        """Tareas aceptadas que todavía no terminaron (en ejecución o esperando turno)"""
+        return len(self._tasks)
+
+    def accepting(self, essential: bool = False) -> bool:
+        """Indica si hay lugar para una tarea más (las esenciales pueden pasar la marca de agua alta)"""
+        return self.active < (self.max_queued if essential else self.high_water_mark)
+
+    def submit(self, func: Callable[..., Any], *args, name: Optional[str] = None,
+               timeout: Optional[float] = None, essential: bool = False, **kwargs) -> asyncio.Task:
+        """
+        Programa una tarea; las funciones síncronas se ejecutan en el threadpool del loop
+        Lanza BackgroundQueueFullError si la cola está por encima de su límite
+        """
+        name = name or getattr(func, "__name__", "tarea")
+        if not self.accepting(essential):
+            self.rejected += 1
+            raise BackgroundQueueFullError(f"{self.active} tareas pendientes, '{name}' rechazada")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        task = asyncio.get_running_loop().create_task(
+            self._run(func, args, kwargs, name, timeout or self.default_timeout), name=name
+        )
+        self.submitted += 1
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, func: Callable[..., Any], args: tuple, kwargs: Dict[str, Any], name: str, timeout: float):
+        async with self._semaphore:
+            self.running += 1
+            try:
+                if inspect.iscoroutinefunction(func):
+                    result = await asyncio.wait_for(func(*args, **kwargs), timeout)
+                else:
+                    # El timeout deja de esperar al hilo, pero no puede interrumpirlo
+                    call = functools.partial(func, *args, **kwargs)
+                    result = await asyncio.wait_for(asyncio.to_thread(call), timeout)
+                self.completed += 1
+                return result
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                logger.error(f"⏰ Tarea en segundo plano '{name}' superó {timeout:g}s y se canceló")
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                logger.warning(f"🛑 Tarea en segundo plano '{name}' cancelada")
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Error en tarea en segundo plano '{name}': {e}")
+            finally:
+                self.running -= 1
+
+    async def shutdown(self, grace: float):
+        """Espera a las tareas en curso hasta `grace` segundos y cancela el resto"""
+        if not self._tasks:
+            return
+        logger.info(f"⏳ Esperando {len(self._tasks)} tarea(s) en segundo plano...")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=grace)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"🛑 {len(pending)} tarea(s) en segundo plano canceladas al cerrar")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "high_water_mark": self.high_water_mark,
+            "max_queued": self.max_queued,
+            "shedding": not self.accepting(),
+            "running": self.running,
+            "waiting": self.active - self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected
+        }
+
+
+# Instancia global del ejecutor de tareas en segundo plano
+background_jobs = BackgroundJobRunner(
+    settings.BACKGROUND_MAX_CONCURRENCY,
+    settings.BACKGROUND_JOB_TIMEOUT_SECONDS,
+    settings.BACKGROUND_HIGH_WATER_MARK,
+    settings.BACKGROUND_MAX_QUEUED
+)
@@ -0,0 +1,123 @@
+"""
+Benchmark de envío de emails de cotización contra el SMTP sink local
+Envía N emails de cotización con el PDF adjunto a través de ImprovedEmailService, con varios
+hilos como los de asyncio.to_thread en la API, y reporta emails por segundo, conexiones SMTP
+abiertas y latencia de envío (p50/p95/p99).
+
+Uso:
+    python -m app.bench_email --emails 200 --concurrencia 8 --tls ssl --latencia-ms 100
+    python -m app.bench_email --emails 50 --generar-pdf   # incluye la generación del PDF en cada envío
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from .email_service_improved import ImprovedEmailService
+from .metrics import LatencyHistogram
+from .pdf_service import pdf_service
+from .smtp_sink import SmtpSink, add_config_arguments, config_from_args
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_CUSTOMER = {"nombre": "Cliente Benchmark", "email": "cliente@bench.local", "whatsapp": "1112345678"}
+SAMPLE_QUOTE = {
+    "tipo_construccion": "steel_frame",
+    "metros_cuadrados": 120,
+    "provincia": "Buenos Aires",
+    "pisos": 1,
+    "complejidad": "media",
+    "uso": "vivienda",
+    "terminaciones": "estandar",
+    "materiales_cost": 41000.0,
+    "mano_obra_cost": 23000.0,
+    "terminaciones_cost": 9000.0,
+    "instalaciones_cost": 7500.0,
+    "transporte_cost": 1800.0,
+    "impuestos_cost": 17178.0,
+    "total": 99478.0,
+    "materiales": [],
+    "observaciones": ["Valores de referencia para el benchmark"]
+}
+SAMPLE_EMAIL_QUOTE = {
+    "construction_type": "Steel Frame",
+    "area": "120 m²",
+    "floors": 1,
+    "finish_level": "Estándar",
+    "location": "Buenos Aires",
+    "estimated_time": "4 meses",
+    "total_cost": "U$D 99,478.00",
+    "breakdown": []
+}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    sink = SmtpSink(config_from_args(args))
+    port = await sink.start("127.0.0.1", 0)
+
+    service = ImprovedEmailService()
+    service.smtp_server = "127.0.0.1"
+    service.smtp_port = port
+    service.use_ssl = args.tls == "ssl"
+    service.use_tls = args.tls == "starttls"
+
+    shared_pdf = None if args.generar_pdf else pdf_service.generate_quote_pdf(SAMPLE_QUOTE, SAMPLE_CUSTOMER)
+    latency = LatencyHistogram()
+    results = {"sent": 0, "failed": 0}
+
+    def send_one(i: int):
+        start = time.perf_counter()
+        pdf_path = shared_pdf or pdf_service.generate_quote_pdf(SAMPLE_QUOTE, SAMPLE_CUSTOMER)
+        try:
+            ok = service.send_construction_quote_email(
+                f"cliente{i}@bench.local", f"Cliente {i}", SAMPLE_EMAIL_QUOTE, pdf_path
+            )
+        finally:
+            if pdf_path is not shared_pdf:
+                os.unlink(pdf_path)
+        latency.record(time.perf_counter() - start)
+        results["sent" if ok else "failed"] += 1
+
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrencia) as executor:
+        await asyncio.gather(*(loop.run_in_executor(executor, send_one, i) for i in range(args.emails)))
+    elapsed = time.perf_counter() - start
+
+    pdf_bytes = os.path.getsize(shared_pdf) if shared_pdf else None
+    if shared_pdf:
+        os.unlink(shared_pdf)
+    await sink.stop()
+
+    return {
+        "emails": args.emails,
+        "concurrencia": args.concurrencia,
+        "tls": args.tls,
+        "enviados": results["sent"],
+        "fallidos": results["failed"],
+        "segundos": round(elapsed, 3),
+        "emails_por_segundo": round(results["sent"] / elapsed, 2) if elapsed else None,
+        "pdf_bytes": pdf_bytes,
+        "latencia_envio": latency.snapshot(),
+        "smtp": sink.status()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.bench_email", description="Benchmark de envío de emails de cotización")
+    parser.add_argument("--emails", type=int, default=100)
+    parser.add_argument("--concurrencia", type=int, default=4, help="Hilos enviando a la vez")
+    parser.add_argument("--generar-pdf", action="store_true", help="Generar el PDF en cada envío en lugar de reutilizar uno")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark de escritura a NocoDB contra el servidor simulado
+Levanta app.fake_nocodb en un puerto local, registra N contactos con NocodbService (outbox,
+lotes bulk, limitador AIMD y circuit breaker) y mide cuánto tarda en vaciarse el outbox.
+El outbox y la réplica van a un directorio temporal: no toca los archivos de la aplicación.
+
+Uso:
+    python -m app.bench_nocodb --registros 2000 --productores 50 --latencia-ms 120 --tasa-errores 0.05 --limite-rps 15
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from aiohttp import web
+
+from .fake_nocodb import FakeNocodb, add_config_arguments, config_from_args, create_app
+
+logger = logging.getLogger(__name__)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    fake = FakeNocodb(config_from_args(args))
+    runner = web.AppRunner(create_app(fake))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    workdir = tempfile.mkdtemp(prefix="bench_nocodb_")
+    os.environ.update({
+        "NC_DB_URL": f"http://127.0.0.1:{port}",
+        "NOCODB_OUTBOX_PATH": os.path.join(workdir, "outbox.jsonl"),
+        "NOCODB_REPLICA_DIR": os.path.join(workdir, "replica")
+    })
+    if args.token:
+        os.environ["NC_TOKEN"] = args.token
+    # La configuración se lee al importar: el servicio se importa después de apuntarlo al simulador
+    from .metrics import LatencyHistogram
+    from .nocodb_service import nocodb_service
+
+    await nocodb_service.start()
+    enqueue_latency = LatencyHistogram()
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.registros):
+        queue.put_nowait(i)
+
+    async def producer():
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            await nocodb_service.save_customer_data({
+                "nombre": f"Cliente {i}",
+                "email": f"cliente{i}@bench.local",
+                "whatsapp": f"11{i:08d}",
+                "observaciones": "Benchmark",
+                "tipo_construccion": "steel_frame",
+                "metros_cuadrados": 100
+            })
+            enqueue_latency.record(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(producer() for _ in range(args.productores)))
+    enqueued = time.perf_counter() - start
+
+    deadline = time.monotonic() + args.timeout
+    while nocodb_service.outbox.status()["pending_bytes"] > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    drained = time.perf_counter() - start
+    pending = nocodb_service.outbox.status()["pending_bytes"]
+
+    stats = nocodb_service.get_write_stats()
+    await nocodb_service.close()
+    await runner.cleanup()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    server = fake.status()
+    return {
+        "registros": args.registros,
+        "encolado_segundos": round(enqueued, 3),
+        "encolado_latencia": enqueue_latency.snapshot(),
+        "vaciado_segundos": round(drained, 3),
+        "registros_por_segundo": round(fake.rows_inserted / drained, 1) if drained else None,
+        "completo": pending == 0,
+        "bytes_pendientes": pending,
+        "servidor": {key: server[key] for key in ("requests", "responses", "bulk_sizes", "rows_inserted", "max_inflight")},
+        "contactos": stats["contactos"],
+        "limiter": stats["limiter"],
+        "breaker": stats["breaker"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.bench_nocodb", description="Benchmark de escritura a NocoDB simulado")
+    parser.add_argument("--registros", type=int, default=1000)
+    parser.add_argument("--productores", type=int, default=20, help="Requests concurrentes registrando contactos")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Segundos máximos esperando que se vacíe el outbox")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -34,12 +34,116 @@ class Settings(BaseSettings):
     NOCODB_CONTACTOS_TABLE_ID: str = "m4fda5efk6fwth6"
     NOCODB_COTIZACIONES_TABLE_ID: str = "mo17k9bts54ou45"
     
+    # Conexiones a NocoDB (sesión persistente) y escritura en lote (cada N registros o T ms)
+    NOCODB_POOL_SIZE: int = 10
+    NOCODB_TIMEOUT_SECONDS: float = 10
+    NOCODB_BATCH_MAX_ITEMS: int = 50
+    NOCODB_BATCH_MAX_DELAY_MS: int = 250
+    
+    # Outbox local de escrituras a NocoDB (reintentos con backoff exponencial y jitter)
+    NOCODB_OUTBOX_PATH: str = "nocodb_outbox.jsonl"
+    NOCODB_OUTBOX_POLL_SECONDS: float = 1.0
+    NOCODB_OUTBOX_BACKOFF_BASE_SECONDS: float = 1.0
+    NOCODB_OUTBOX_BACKOFF_MAX_SECONDS: float = 300.0
+    # Intentos por entrada antes de apartarla como fallida (los 4xx del pedido se apartan al primero)
+    NOCODB_OUTBOX_MAX_ATTEMPTS: int = 12
+    # Con el cursor más allá de este tamaño, el log se compacta (solo quedan las altas pendientes)
+    NOCODB_OUTBOX_SEGMENT_BYTES: int = 8 * 1024 * 1024
+    # Columna opcional de NocoDB donde guardar la clave de idempotencia de cada alta
+    NOCODB_IDEMPOTENCY_FIELD: Optional[str] = None
+    
+    # Control de carga hacia NocoDB: concurrencia adaptativa (AIMD) y circuit breaker
+    NOCODB_CONCURRENCY_INITIAL: int = 4
+    NOCODB_CONCURRENCY_MIN: int = 1
+    NOCODB_CONCURRENCY_MAX: int = 10
+    NOCODB_LATENCY_TARGET_MS: int = 2000
+    NOCODB_BREAKER_FAILURE_THRESHOLD: int = 5
+    NOCODB_BREAKER_RESET_SECONDS: float = 30
+    
+    # Réplica local de contactos y cotizaciones (sincronización incremental por UpdatedAt)
+    NOCODB_REPLICA_DIR: str = "nocodb_replica"
+    NOCODB_REPLICA_SYNC_SECONDS: float = 60
+    NOCODB_REPLICA_PAGE_SIZE: int = 1000
+    NOCODB_REPLICA_FULL_SYNC_HOURS: float = 24
+    
+    # Código de país para normalizar teléfonos sin prefijo internacional (deduplicación de contactos)
+    DEFAULT_PHONE_COUNTRY_CODE: str = "54"
+    
+    # Tareas en segundo plano (NocoDB, PDFs y emails) sobre el event loop principal
+    BACKGROUND_MAX_CONCURRENCY: int = 16
+    BACKGROUND_JOB_TIMEOUT_SECONDS: float = 120
+    BACKGROUND_SHUTDOWN_GRACE_SECONDS: float = 10
+    # Cola acotada: pasada la marca alta se rechaza el trabajo no esencial (503 + Retry-After)
+    BACKGROUND_HIGH_WATER_MARK: int = 200
+    BACKGROUND_MAX_QUEUED: int = 1000
+    BACKGROUND_RETRY_AFTER_SECONDS: int = 5
+    
+    # Trabajos con seguimiento de estado (GET /jobs/{id} y eventos SSE)
+    # El estado se publica en JOBS_DIR, compartido por todos los workers
+    JOBS_DIR: str = "jobs"
+    JOBS_MAX_ENTRIES: int = 1000
+    JOBS_TTL_SECONDS: float = 900
+    JOBS_SSE_KEEPALIVE_SECONDS: float = 15
+    JOBS_POLL_SECONDS: float = 0.5
+    
     # Variables de entorno del contenedor NocoDB
     NC_DATABASE_URL: Optional[str] = None
     NC_REDIS_URL: Optional[str] = None
     NC_AUTH_JWT_SECRET: Optional[str] = None
     NC_PUBLIC_URL: Optional[str] = None
     
+    # Cache de precios de materiales (PriceService)
+    PRICE_CACHE_MAX_ENTRIES: int = 1024
+    PRICE_CACHE_TTL_HOURS: float = 24
+    PRICE_CACHE_NEGATIVE_TTL_MINUTES: float = 30
+    PRICE_BATCH_MAX_ITEMS: int = 200
+    PRICE_BATCH_SOURCE_CONCURRENCY: int = 8
+    PRICE_FETCH_DEADLINE_MS: int = 1500
+    # Plazo total de una consulta por lotes; lo que no termina se sirve vencido o con el precio base
+    PRICE_BATCH_DEADLINE_MS: int = 5000
+    PRICE_HEDGE_ENABLED: bool = True
+    PRICE_HEDGE_MIN_SAMPLES: int = 20
+    # Ventana de latencias recientes con la que se decide el hedge (p95 de la fuente)
+    PRICE_HEDGE_WINDOW_SECONDS: float = 300
+    
+    # Tipo de cambio: fuentes consultadas en paralelo, en orden de preferencia
+    FX_SOURCE_PRIORITY: str = "bcra,blue"
+    FX_DEADLINE_MS: int = 3000
+    
+    # Índice de costo de construcción (CSV mensual adicional, opcional)
+    COST_INDEX_PATH: Optional[str] = None
+    COST_INDEX_MONTHLY_EXTRAPOLATION: float = 0.0
+    # Fecha de referencia de los precios base de cada servicio
+    ARGENTINA_BASE_PRICES_DATE: str = "2024-01-01"
+    CALCULATOR_BASE_PRICES_DATE: str = "2024-07-01"
+    # Banda admitida para los factores de mercado que corrigen las cotizaciones
+    MARKET_FACTOR_MIN: float = 0.8
+    MARKET_FACTOR_MAX: float = 1.25
+    
+    # Catálogo de materiales (CSV adicional de proveedores, opcional)
+    MATERIAL_CATALOG_PATH: Optional[str] = None
+    MATERIAL_CATALOG_MAX_PAGE_SIZE: int = 1000
+    
+    # Historial de precios (series de tiempo locales)
+    PRICE_HISTORY_DIR: str = "price_history"
+    
+    # Elección de líder del programador de tareas (un solo worker ejecuta los jobs)
+    SCHEDULER_LOCK_PATH: str = "scheduler.lock"
+    SCHEDULER_LEADER_POLL_SECONDS: int = 15
+    
+    # Snapshot binario de los últimos precios y tipo de cambio (se carga al iniciar)
+    PRICE_SNAPSHOT_PATH: str = "price_snapshot.bin"
+    
+    # Transporte desde las plantas (USD por km de camión y m² cubiertos por camión)
+    TRANSPORT_COST_PER_KM_USD: float = 1.8
+    TRANSPORT_M2_PER_TRUCK: float = 120.0
+    
+    # Servidor de producción multi-worker (WEB_CONCURRENCY vacío = un worker por núcleo disponible)
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WEB_CONCURRENCY: Optional[int] = None
+    SHARED_TABLES_NAME: str = "cotizador_precios"
+    
     # Configuración de la aplicación
     APP_NAME: str = "Cotizador de Construcción - Sumpetrol"
     APP_VERSION: str = "1.0.0"
@@ -4,9 +4,16 @@ Basada en la lógica exitosa del cotizador solar
 """
 
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 
+from .config import settings
+from .cost_index import cost_index, PriceBook
+from .regions import region_registry
+from .gazetteer import gazetteer
+from .transport import estimate_transport_line
+from .events import price_events, PriceSnapshot, TOPIC_PRICES
+
 logger = logging.getLogger(__name__)
 
 class ConstructionCalculator:
@@ -38,33 +45,21 @@ class ConstructionCalculator:
             }
         }
         
-        # Multiplicadores por ubicación
-        self.location_multipliers = {
-            'buenos-aires': 1.2,
-            'ciudad-autonoma-buenos-aires': 1.3,
-            'cordoba': 1.1,
-            'santa-fe': 1.1,
-            'mendoza': 1.0,
-            'tucuman': 0.9,
-            'salta': 0.9,
-            'jujuy': 0.9,
-            'chaco': 0.8,
-            'formosa': 0.8,
-            'misiones': 0.9,
-            'corrientes': 0.9,
-            'entre-rios': 1.0,
-            'la-pampa': 0.9,
-            'rio-negro': 0.9,
-            'neuquen': 1.0,
-            'chubut': 0.9,
-            'santa-cruz': 0.8,
-            'tierra-del-fuego': 1.1,
-            'catamarca': 0.9,
-            'la-rioja': 0.9,
-            'san-juan': 0.9,
-            'san-luis': 0.9,
-            'santiago-del-estero': 0.9
-        }
+        # Libro de precios plano, ajustado por el índice de costo a la fecha de cada cotización
+        self.price_book = PriceBook(
+            {
+                (construction_type, usage_type, finish_level): price
+                for construction_type, usages in self.base_prices.items()
+                for usage_type, finishes in usages.items()
+                for finish_level, price in finishes.items()
+            },
+            settings.CALCULATOR_BASE_PRICES_DATE,
+            cost_index
+        )
+        
+        # Factor de mercado por tipo (precio publicado / precio base), reemplazado con cada actualización
+        self.market_factors: Dict[str, float] = {}
+        price_events.subscribe(TOPIC_PRICES, self._on_prices_published)
         
         # Tiempos estimados por tipo (meses)
         self.construction_times = {
@@ -93,10 +88,10 @@ class ConstructionCalculator:
             location = data.get('location', 'mendoza')
             
             # Calcular precio base
-            base_price_per_m2 = self.base_prices.get(construction_type, {}).get(usage_type, {}).get(finish_level, 1000)
+            base_price_per_m2 = self._get_base_price_per_m2(construction_type, usage_type, finish_level)
             
-            # Aplicar multiplicador de ubicación
-            location_multiplier = self.location_multipliers.get(location, 1.0)
+            # Aplicar multiplicador de ubicación (provincia y localidad)
+            location_multiplier = self._get_location_multiplier(data)
             
             # Calcular costo base
             base_cost = square_meters * base_price_per_m2 * location_multiplier
@@ -104,8 +99,10 @@ class ConstructionCalculator:
             # Aplicar multiplicador por pisos (cada piso adicional aumenta el costo)
             floor_multiplier = 1 + (floors - 1) * 0.3
             
-            # Calcular costo total
-            total_cost = base_cost * floor_multiplier
+            # Calcular costo de obra y transporte desde la planta más cercana
+            construction_cost = base_cost * floor_multiplier
+            transport, transport_cost = estimate_transport_line(data.get('city'), location, square_meters * floors)
+            total_cost = construction_cost + transport_cost
             
             # Calcular tiempo estimado
             estimated_months = self.construction_times.get(construction_type, {}).get(finish_level, 3)
@@ -118,11 +115,14 @@ class ConstructionCalculator:
                 'usage_type': self._format_usage_type(usage_type),
                 'finish_level': self._format_finish_level(finish_level),
                 'floors': floors,
-                'location': self._format_location(location),
+                'location': self._format_location(location, data.get('city')),
                 'estimated_cost': f"U$D {total_cost:,.0f}",
+                'construction_cost': f"U$D {construction_cost:,.0f}",
+                'transport': transport,
+                'transporte_cost': round(transport_cost, 2),
                 'estimated_time': estimated_time,
                 'base_price_per_m2': f"U$D {base_price_per_m2:,.0f}/m²",
-                'location_multiplier': f"{location_multiplier:.1f}x",
+                'location_multiplier': f"{location_multiplier:.2f}x",
                 'floor_multiplier': f"{floor_multiplier:.1f}x"
             }
             
@@ -158,9 +158,13 @@ class ConstructionCalculator:
             # Calcular costos adicionales
             additional_costs = self._calculate_additional_costs(data)
             
+            # Transporte desde la planta más cercana (ya calculado en la estimación rápida)
+            transport = quick_estimate['transport']
+            transport_cost = quick_estimate['transporte_cost']
+            
             # Calcular total
-            base_cost = self._extract_numeric_cost(quick_estimate['estimated_cost'])
-            total_cost = base_cost + additional_costs
+            base_cost = self._extract_numeric_cost(quick_estimate['construction_cost'])
+            total_cost = base_cost + additional_costs + transport_cost
             
             # Preparar resultado detallado
             result = {
@@ -172,11 +176,13 @@ class ConstructionCalculator:
                 'finish_level': self._format_finish_level(finish_level),
                 'area': f"{square_meters} m²",
                 'floors': floors,
-                'location': self._format_location(location),
+                'location': self._format_location(location, data.get('city')),
                 'total_cost': f"U$D {total_cost:,.0f}",
                 'estimated_time': quick_estimate['estimated_time'],
                 'breakdown': breakdown,
                 'additional_costs': f"U$D {additional_costs:,.0f}",
+                'transport': transport,
+                'transporte_cost': transport_cost,
                 'base_cost': f"U$D {base_cost:,.0f}",
                 'quote_date': datetime.now().strftime('%d/%m/%Y'),
                 'valid_until': (datetime.now() + timedelta(days=30)).strftime('%d/%m/%Y')
@@ -199,8 +205,8 @@ class ConstructionCalculator:
         location = data.get('location', 'mendoza')
         
         # Obtener precio base
-        base_price_per_m2 = self.base_prices.get(construction_type, {}).get(usage_type, {}).get(finish_level, 1000)
-        location_multiplier = self.location_multipliers.get(location, 1.0)
+        base_price_per_m2 = self._get_base_price_per_m2(construction_type, usage_type, finish_level)
+        location_multiplier = self._get_location_multiplier(data)
         
         # Calcular costos por categoría
         breakdown = []
@@ -239,6 +245,39 @@ class ConstructionCalculator:
         
         return breakdown
 
+    def _get_location_multiplier(self, data: Dict[str, Any]) -> float:
+        """Multiplicador provincial ajustado por el multiplicador de la localidad (si se conoce)"""
+        location = data.get('location', 'mendoza')
+        return (
+            region_registry.multiplier('cotizacion', location)
+            * gazetteer.city_multiplier(data.get('city'), location)
+        )
+
+    def _on_prices_published(self, snapshot: PriceSnapshot):
+        """Reemplaza los factores de mercado con los del snapshot publicado (acotados a la banda admitida)"""
+        factors = {tipo: self._clamp_market_factor(tipo, value) for tipo, value in snapshot.factores.items()}
+        steel_frame = factors.get('steel_frame', 1.0)
+        industrial = factors.get('industrial', 1.0)
+        # Un único reemplazo del diccionario: las cotizaciones en curso ven la tabla vieja o la nueva
+        self.market_factors = {
+            'steel-frame': steel_frame,
+            'industrial': industrial,
+            'contenedor': factors.get('container', 1.0),
+            'mixto': (steel_frame + industrial) / 2
+        }
+        self.logger.info(f"🔄 Factores de mercado actualizados (v{snapshot.version}): {self.market_factors}")
+
+    def _clamp_market_factor(self, tipo: str, factor: float) -> float:
+        clamped = min(max(factor, settings.MARKET_FACTOR_MIN), settings.MARKET_FACTOR_MAX)
+        if clamped != factor:
+            self.logger.warning(f"⚠️ Factor de mercado de {tipo} fuera de banda ({factor:.3f}): se usa {clamped:.3f}")
+        return clamped
+
+    def _get_base_price_per_m2(self, construction_type: str, usage_type: str, finish_level: str) -> float:
+        """Precio base por m² ajustado a la fecha actual y al último precio de mercado publicado"""
+        price = self.price_book.get((construction_type, usage_type, finish_level), 1000)
+        return price * self.market_factors.get(construction_type, 1.0)
+
     def _calculate_additional_costs(self, data: Dict[str, Any]) -> float:
         """Calcula costos adicionales"""
         floors = data.get('floors', 1)
@@ -291,32 +330,9 @@ class ConstructionCalculator:
         }
         return formats.get(finish_level, finish_level.title())
 
-    def _format_location(self, location: str) -> str:
+    def _format_location(self, location: str, city: Optional[str] = None) -> str:
         """Formatea la ubicación para mostrar"""
-        formats = {
-            'buenos-aires': 'Buenos Aires',
-            'ciudad-autonoma-buenos-aires': 'Ciudad Autónoma de Buenos Aires',
-            'cordoba': 'Córdoba',
-            'santa-fe': 'Santa Fe',
-            'mendoza': 'Mendoza',
-            'tucuman': 'Tucumán',
-            'salta': 'Salta',
-            'jujuy': 'Jujuy',
-            'chaco': 'Chaco',
-            'formosa': 'Formosa',
-            'misiones': 'Misiones',
-            'corrientes': 'Corrientes',
-            'entre-rios': 'Entre Ríos',
-            'la-pampa': 'La Pampa',
-            'rio-negro': 'Río Negro',
-            'neuquen': 'Neuquén',
-            'chubut': 'Chubut',
-            'santa-cruz': 'Santa Cruz',
-            'tierra-del-fuego': 'Tierra del Fuego',
-            'catamarca': 'Catamarca',
-            'la-rioja': 'La Rioja',
-            'san-juan': 'San Juan',
-            'san-luis': 'San Luis',
-            'santiago-del-estero': 'Santiago del Estero'
-        }
-        return formats.get(location, location.replace('-', ' ').title())
+        region = region_registry.find(location)
+        province = region.nombre if region else location.replace('-', ' ').title()
+        locality = gazetteer.resolve(city, location)
+        return f"{locality.nombre}, {province}" if locality else province
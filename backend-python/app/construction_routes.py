@@ -3,14 +3,18 @@ Rutas para el Cotizador de Construcción Simplificado
 Basado en la lógica exitosa del cotizador solar
 """
 
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Request, HTTPException
 from typing import Dict, Any
+import asyncio
 import logging
 from datetime import datetime, timedelta
 
 from .construction_calculator import ConstructionCalculator
 from .email_service_improved import ImprovedEmailService
-from .nocodb_service import NocodbService
+from .nocodb_service import nocodb_service
+from .background import background_jobs, BackgroundQueueFullError
+from .jobs import job_store, Progress
+from .config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +25,6 @@ try:
     logger.info("🏗️ Inicializando servicios de construcción...")
     construction_calculator = ConstructionCalculator()
     email_service = ImprovedEmailService()
-    nocodb_service = NocodbService()
     logger.info("✅ Servicios de construcción inicializados correctamente")
 except Exception as e:
     logger.error(f"❌ Error inicializando servicios de construcción: {e}")
@@ -77,6 +80,7 @@ async def quick_estimate(request: Request):
             'client_email': body.get('clientEmail'),
             'client_phone': body.get('clientPhone'),
             'location': body.get('location'),
+            'city': body.get('city'),
             'construction_type': body.get('constructionType'),
             'square_meters': float(body.get('squareMeters', 0)),
             'floors': int(body.get('floors', 1)),
@@ -107,7 +111,7 @@ async def quick_estimate(request: Request):
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.post("/quote")
-async def detailed_quote(request: Request, background_tasks: BackgroundTasks):
+async def detailed_quote(request: Request):
     """
     Cotización completa de construcción
     Similar al endpoint de cotización completa del cotizador solar
@@ -131,6 +135,7 @@ async def detailed_quote(request: Request, background_tasks: BackgroundTasks):
             'client_email': body.get('clientEmail'),
             'client_phone': body.get('clientPhone'),
             'location': body.get('location'),
+            'city': body.get('city'),
             'construction_type': body.get('constructionType'),
             'square_meters': float(body.get('squareMeters', 0)),
             'floors': int(body.get('floors', 1)),
@@ -146,19 +151,33 @@ async def detailed_quote(request: Request, background_tasks: BackgroundTasks):
         
         logger.info(f"✅ Cotización calculada: ${quote.get('total_cost', 'N/A')}")
         
-        # Guardar en NocoDB en background
-        background_tasks.add_task(save_quote_to_nocodb, quote_data, quote)
-        
-        # Enviar email en background
-        background_tasks.add_task(send_quote_email, quote_data, quote)
+        # Primero lo esencial: registrar la cotización para NocoDB
+        try:
+            background_jobs.submit(save_quote_to_nocodb, quote_data, quote, essential=True)
+        except BackgroundQueueFullError:
+            # Cola al máximo: el alta se registra en el outbox dentro de la request (milisegundos)
+            await save_quote_to_nocodb(quote_data, quote)
+        
+        # Enviar email como trabajo con seguimiento (GET /jobs/{id}); con la cola saturada se
+        # responde 503 con Retry-After, con la cotización ya registrada
+        try:
+            email_job = job_store.submit("email_cotizacion", send_quote_email, quote_data, quote)
+        except BackgroundQueueFullError as e:
+            logger.warning(f"⚠️ Email de cotización rechazado para {quote_data['client_email']}: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail="Cotización registrada; el email no pudo encolarse, reintentar en unos segundos",
+                headers={"Retry-After": str(settings.BACKGROUND_RETRY_AFTER_SECONDS)}
+            )
         
         return {
             "success": True,
             "quote": quote,
+            "email_job_id": email_job.id,
             "timestamp": datetime.now().isoformat()
         }
         
-    except HTTPException:
+    except (HTTPException, BackgroundQueueFullError):
         raise
     except Exception as e:
         logger.error(f"❌ Error en cotización completa: {e}")
@@ -191,44 +210,44 @@ async def save_quote_to_nocodb(client_data: Dict[str, Any], quote_data: Dict[str
         success = await nocodb_service.save_quote_data(nocodb_data)
         
         if success:
-            logger.info("✅ Cotización guardada en NocoDB exitosamente")
+            logger.info("✅ Cotización registrada para NocoDB")
         else:
             logger.error("❌ Error guardando cotización en NocoDB")
             
     except Exception as e:
         logger.error(f"❌ Error guardando en NocoDB: {e}")
 
-async def send_quote_email(client_data: Dict[str, Any], quote_data: Dict[str, Any]):
-    """Enviar email de cotización"""
-    try:
-        logger.info(f"📧 Enviando email de cotización a {client_data.get('client_email')}...")
-        
-        # Preparar datos para email
-        email_data = {
-            'client_name': client_data.get('client_name'),
-            'client_email': client_data.get('client_email'),
-            'client_phone': client_data.get('client_phone'),
-            'location': client_data.get('location'),
-            'construction_type': client_data.get('construction_type'),
-            'square_meters': client_data.get('square_meters'),
-            'floors': client_data.get('floors'),
-            'usage_type': client_data.get('usage_type'),
-            'finish_level': client_data.get('finish_level'),
-            'total_cost': quote_data.get('total_cost'),
-            'estimated_time': quote_data.get('estimated_time'),
-            'breakdown': quote_data.get('breakdown', [])
-        }
-        
-        success = email_service.send_construction_quote_email(
-            client_data.get('client_email'),
-            client_data.get('client_name'),
-            email_data
-        )
-        
-        if success:
-            logger.info("✅ Email de cotización enviado exitosamente")
-        else:
-            logger.error("❌ Error enviando email de cotización")
-            
-    except Exception as e:
-        logger.error(f"❌ Error enviando email: {e}")
+async def send_quote_email(progress: Progress, client_data: Dict[str, Any], quote_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Enviar email de cotización (trabajo con seguimiento: falla si el email no sale)"""
+    logger.info(f"📧 Enviando email de cotización a {client_data.get('client_email')}...")
+    
+    # Preparar datos para email
+    email_data = {
+        'client_name': client_data.get('client_name'),
+        'client_email': client_data.get('client_email'),
+        'client_phone': client_data.get('client_phone'),
+        'location': client_data.get('location'),
+        'construction_type': client_data.get('construction_type'),
+        'square_meters': client_data.get('square_meters'),
+        'floors': client_data.get('floors'),
+        'usage_type': client_data.get('usage_type'),
+        'finish_level': client_data.get('finish_level'),
+        'total_cost': quote_data.get('total_cost'),
+        'estimated_time': quote_data.get('estimated_time'),
+        'breakdown': quote_data.get('breakdown', []),
+        'transport': quote_data.get('transport'),
+        'transporte_cost': quote_data.get('transporte_cost', 0.0)
+    }
+    
+    progress("Enviando email", 20)
+    success = await asyncio.to_thread(
+        email_service.send_construction_quote_email,
+        client_data.get('client_email'),
+        client_data.get('client_name'),
+        email_data
+    )
+    
+    if not success:
+        raise RuntimeError(f"No se pudo enviar el email a {client_data.get('client_email')}")
+    logger.info("✅ Email de cotización enviado exitosamente")
+    return {"email": client_data.get('client_email')}
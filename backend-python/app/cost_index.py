@@ -0,0 +1,169 @@
+"""
+Índice de costo de construcción
+Serie mensual (estilo CAC / ICC-INDEC) para ajustar precios base a cualquier fecha
+"""
+
+import csv
+import logging
+import os
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "data", "indice_costo_construccion.csv")
+
+DateLike = Union[date, datetime, str]
+
+
+def _parse_date(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = value.strip()
+    if len(value) == 7:
+        value = f"{value}-01"
+    return date.fromisoformat(value[:10])
+
+
+def _month_position(value: DateLike) -> float:
+    """Posición continua en meses (el día interpola dentro del mes)"""
+    d = _parse_date(value)
+    return d.year * 12 + (d.month - 1) + (d.day - 1) / 31
+
+
+class ConstructionCostIndex:
+    """Serie mensual de índice de costo con interpolación lineal entre meses"""
+
+    def __init__(self, monthly_extrapolation: float = 0.0):
+        self._positions = array("d")
+        self._values = array("d")
+        # Crecimiento mensual supuesto después del último dato (0 = mantener el último valor)
+        self.monthly_extrapolation = monthly_extrapolation
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def load_csv(self, path: str) -> int:
+        """Carga valores mensuales desde un CSV con columnas fecha (YYYY-MM) y valor"""
+        with open(path, newline="", encoding="utf-8") as f:
+            lines = (line for line in f if line.strip() and not line.lstrip().startswith("#"))
+            rows = [(row["fecha"], float(row["valor"])) for row in csv.DictReader(lines)]
+        self.set_values(rows)
+        logger.info(f"📈 Índice de costo de construcción: {len(rows)} meses cargados desde {path}")
+        return len(rows)
+
+    def set_values(self, rows: Iterable[Tuple[DateLike, float]]):
+        """Reemplaza o agrega valores; la serie queda ordenada por fecha"""
+        merged: Dict[float, float] = dict(zip(self._positions, self._values))
+        for fecha, valor in rows:
+            if valor <= 0:
+                raise ValueError(f"Valor de índice inválido para {fecha}: {valor}")
+            merged[_month_position(fecha)] = valor
+        ordered = sorted(merged.items())
+        self._positions = array("d", (p for p, _ in ordered))
+        self._values = array("d", (v for _, v in ordered))
+        self.version += 1
+
+    def value_at(self, fecha: DateLike) -> float:
+        """Valor del índice en una fecha, interpolado linealmente"""
+        if not self._values:
+            raise ValueError("El índice de costo no tiene datos")
+
+        position = _month_position(fecha)
+        positions, values = self._positions, self._values
+        if position <= positions[0]:
+            return values[0]
+        if position >= positions[-1]:
+            months_after = position - positions[-1]
+            return values[-1] * (1 + self.monthly_extrapolation) ** months_after
+
+        i = bisect_right(positions, position)
+        p0, p1 = positions[i - 1], positions[i]
+        v0, v1 = values[i - 1], values[i]
+        return v0 + (v1 - v0) * (position - p0) / (p1 - p0)
+
+    def factor(self, base_date: DateLike, target_date: Optional[DateLike] = None) -> float:
+        """Multiplicador para llevar un precio de base_date a target_date (por defecto, hoy)"""
+        return self.value_at(target_date or date.today()) / self.value_at(base_date)
+
+    def adjust(self, prices: Sequence[float], base_dates: Union[DateLike, Sequence[DateLike]],
+               target_date: Optional[DateLike] = None) -> array:
+        """Ajusta un libro de precios completo en una pasada
+
+        Con una sola fecha base se aplica un único factor a todo el arreglo;
+        con una fecha por precio, cada factor se calcula una vez por fecha distinta.
+        """
+        target_value = self.value_at(target_date or date.today())
+        if isinstance(base_dates, (str, date)):
+            factor = target_value / self.value_at(base_dates)
+            return array("d", (price * factor for price in prices))
+
+        factors: Dict[date, float] = {}
+        adjusted = array("d")
+        for price, base in zip(prices, base_dates):
+            key = _parse_date(base)
+            if key not in factors:
+                factors[key] = target_value / self.value_at(key)
+            adjusted.append(price * factors[key])
+        return adjusted
+
+    def summary(self) -> Dict[str, Any]:
+        if not self._values:
+            return {"months": 0}
+        first, last = int(self._positions[0]), int(self._positions[-1])
+        return {
+            "months": len(self._values),
+            "from": f"{first // 12}-{first % 12 + 1:02d}",
+            "to": f"{last // 12}-{last % 12 + 1:02d}",
+            "last_value": self._values[-1],
+            "monthly_extrapolation": self.monthly_extrapolation
+        }
+
+
+class PriceBook:
+    """Libro de precios plano (claves + arreglo de valores) re-cotizable con el índice"""
+
+    def __init__(self, prices: Dict[Tuple[str, ...], float], base_date: DateLike,
+                 index: ConstructionCostIndex):
+        self.keys: List[Tuple[str, ...]] = list(prices)
+        self.base_values = array("d", prices.values())
+        self.base_date = _parse_date(base_date)
+        self.index = index
+        self._cache_key: Optional[Tuple[date, int]] = None
+        self._current: Dict[Tuple[str, ...], float] = {}
+
+    def current(self, target_date: Optional[DateLike] = None) -> Dict[Tuple[str, ...], float]:
+        """Precios ajustados a la fecha (se recalculan solo si cambia el día o el índice)"""
+        target = _parse_date(target_date or date.today())
+        cache_key = (target, self.index.version)
+        if cache_key != self._cache_key:
+            adjusted = self.index.adjust(self.base_values, self.base_date, target)
+            self._current = dict(zip(self.keys, adjusted))
+            self._cache_key = cache_key
+        return self._current
+
+    def get(self, key: Tuple[str, ...], default: Optional[float] = None) -> Optional[float]:
+        return self.current().get(key, default)
+
+
+def load_cost_index() -> ConstructionCostIndex:
+    """Carga la serie incluida y, si está configurada, la serie oficial"""
+    index = ConstructionCostIndex(settings.COST_INDEX_MONTHLY_EXTRAPOLATION)
+    index.load_csv(DEFAULT_INDEX_PATH)
+    if settings.COST_INDEX_PATH:
+        try:
+            index.load_csv(settings.COST_INDEX_PATH)
+        except Exception as e:
+            logger.error(f"Error cargando índice de costo {settings.COST_INDEX_PATH}: {e}")
+    return index
+
+
+# Instancia global del índice
+cost_index = load_cost_index()
@@ -0,0 +1,246 @@
+"""
+Índice local de clientes por email y teléfono normalizados
+Permite decidir entre alta y actualización de un contacto sin consultar NocoDB
+La réplica tarda hasta NOCODB_REPLICA_SYNC_SECONDS en reflejar lo escrito: mientras tanto,
+las altas y actualizaciones registradas en el outbox (por cualquier worker) forman una capa
+pendiente que se consulta antes que la réplica
+"""
+
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_NON_DIGITS = re.compile(r"\D")
+
+# Campo de una actualización que apunta a un alta todavía no entregada (clave del outbox)
+PENDING_INSERT_FIELD = "_alta_pendiente"
+
+# Altas entregadas cuyo Id se recuerda para resolver actualizaciones que las referencian
+_MAX_INSERTED_IDS = 10000
+
+# Id de la fila, o clave en el outbox de un alta todavía sin Id
+ContactRef = Union[int, str]
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Email en minúsculas y sin espacios; None si no parece un email"""
+    email = (email or "").strip().lower()
+    return email if "@" in email else None
+
+
+def normalize_phone(phone: Optional[str], country_code: str = "54") -> Optional[str]:
+    """
+    Teléfono en formato E.164
+    Los números argentinos se llevan a la forma móvil +54 9 <área> <número>: se quitan el 0
+    de larga distancia, el 15 de celulares y el 9 internacional, así "011 15 1234-5678",
+    "+54 9 11 1234 5678" y "11 1234 5678" dan la misma clave
+    """
+    raw = (phone or "").strip()
+    digits = _NON_DIGITS.sub("", raw)
+    if not digits:
+        return None
+
+    international = raw.startswith("+") or digits.startswith("00")
+    digits = digits.lstrip("0") if digits.startswith("00") else digits
+    if international and not digits.startswith(country_code):
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    if international or (digits.startswith(country_code) and len(digits) >= len(country_code) + 10):
+        digits = digits[len(country_code):]
+    if country_code != "54":
+        return f"+{country_code}{digits.lstrip('0')}"
+
+    national = digits.lstrip("0")
+    if len(national) == 11 and national.startswith("9"):
+        national = national[1:]
+    if len(national) == 12:
+        # <área de 2 a 4 dígitos> 15 <número>
+        for area_length in (2, 3, 4):
+            if national[area_length:area_length + 2] == "15":
+                national = national[:area_length] + national[area_length + 2:]
+                break
+    if len(national) != 10:
+        return None
+    return f"+549{national}"
+
+
+@dataclass
+class PendingContact:
+    """Contacto con escrituras en el outbox que la réplica todavía puede no reflejar"""
+    row: Dict[str, Any]
+    end: int                                 # fin de su última entrada en el log
+    key: str                                 # clave de su última entrada
+    delivered_version: Optional[int] = None  # versión de la réplica al verla entregada
+
+
+class CustomerIndex:
+    """Email y teléfono normalizados -> Id de la fila de contacto en NocoDB (o alta pendiente)"""
+
+    def __init__(self, table, email_field: str, phone_field: str, outbox=None,
+                 insert_kind: str = "contactos", update_kind: str = "contactos_actualizacion"):
+        self.table = table
+        self.email_field = email_field
+        self.phone_field = phone_field
+        self.outbox = outbox
+        self.insert_kind = insert_kind
+        self.update_kind = update_kind
+        self.by_email: Dict[str, int] = {}
+        self.by_phone: Dict[str, int] = {}
+        self.duplicates = 0
+        self._version = -1
+
+        # Capa pendiente, alimentada leyendo el outbox compartido
+        self.pending: Dict[ContactRef, PendingContact] = {}
+        self.pending_by_email: Dict[str, ContactRef] = {}
+        self.pending_by_phone: Dict[str, ContactRef] = {}
+        self.inserted_ids: "OrderedDict[str, int]" = OrderedDict()
+        self._outbox_offset: Optional[int] = None
+        self._outbox_inode: Optional[int] = None
+
+    def _keys(self, row: Dict[str, Any]):
+        return (normalize_email(row.get(self.email_field)),
+                normalize_phone(row.get(self.phone_field), settings.DEFAULT_PHONE_COUNTRY_CODE))
+
+    def _refresh(self):
+        """Reconstruye el índice en una pasada si la réplica cambió desde la última consulta"""
+        if self._version == self.table.version:
+            return
+        by_email: Dict[str, int] = {}
+        by_phone: Dict[str, int] = {}
+        duplicates = 0
+        # En filas duplicadas gana la más antigua (la que se sigue actualizando)
+        for row_id in sorted(self.table.rows, reverse=True):
+            email, phone = self._keys(self.table.rows[row_id])
+            if (email and email in by_email) or (phone and phone in by_phone):
+                duplicates += 1
+            if email:
+                by_email[email] = row_id
+            if phone:
+                by_phone[phone] = row_id
+        self.by_email, self.by_phone, self.duplicates = by_email, by_phone, duplicates
+        self._version = self.table.version
+        self._prune_pending()
+        logger.info(f"🗂️ Índice de clientes: {len(by_email)} emails, {len(by_phone)} teléfonos ({duplicates} duplicados)")
+
+    # --- Capa pendiente ---
+
+    def _observe_outbox(self):
+        """Incorpora las entradas de contactos escritas en el outbox desde la última consulta"""
+        if self.outbox is None:
+            return
+        inode = self.outbox.inode()
+        if self._outbox_offset is None:
+            # Al arrancar alcanza con lo no confirmado por el cursor
+            self._outbox_offset = self.outbox.load_cursor()[0]
+            self._outbox_inode = inode
+        elif inode != self._outbox_inode:
+            # Log compactado: lo pendiente quedó al principio del log nuevo
+            self._outbox_offset, self._outbox_inode = 0, inode
+        while True:
+            entries = self.outbox.read_from(self._outbox_offset, 1000)
+            for entry in entries:
+                self._apply(entry)
+            if entries:
+                self._outbox_offset = entries[-1].end
+            if len(entries) < 1000:
+                return
+
+    def _apply(self, entry):
+        fields = dict(entry.record)
+        if entry.kind == self.insert_kind:
+            target: Optional[ContactRef] = self.inserted_ids.get(entry.key, entry.key)
+        elif entry.kind == self.update_kind:
+            target = fields.pop("Id", None)
+            insert_key = fields.pop(PENDING_INSERT_FIELD, None)
+            if target is None and insert_key is not None:
+                target = self.inserted_ids.get(insert_key, insert_key)
+        else:
+            return
+        if target is None:
+            return
+        # Las actualizaciones ya traen los valores acumulados: aplicarlas de nuevo no cambia nada
+        self.pending[target] = PendingContact({**self.current_row(target), **fields}, entry.end, entry.key)
+        self._reindex_pending()
+
+    def _reindex_pending(self):
+        by_email: Dict[str, ContactRef] = {}
+        by_phone: Dict[str, ContactRef] = {}
+        for target, contact in self.pending.items():
+            email, phone = self._keys(contact.row)
+            if email:
+                by_email.setdefault(email, target)
+            if phone:
+                by_phone.setdefault(phone, target)
+        self.pending_by_email, self.pending_by_phone = by_email, by_phone
+
+    def _prune_pending(self):
+        """Descarta lo pendiente que ya se entregó y que la réplica sincronizó después"""
+        if not self.pending or self.outbox is None:
+            return
+        offset, delivered = self.outbox.load_cursor()
+        pruned = False
+        for target, contact in list(self.pending.items()):
+            if contact.delivered_version is None:
+                if contact.end <= offset or contact.key in delivered:
+                    contact.delivered_version = self._version
+            elif self._version > contact.delivered_version + 1:
+                # Hubo una sincronización completa empezada después de la entrega
+                del self.pending[target]
+                pruned = True
+        if pruned:
+            self._reindex_pending()
+
+    def confirm_insert(self, key: str, row_id: int):
+        """El alta `key` se entregó y NocoDB le asignó `row_id`"""
+        self.inserted_ids[key] = row_id
+        while len(self.inserted_ids) > _MAX_INSERTED_IDS:
+            self.inserted_ids.popitem(last=False)
+        contact = self.pending.pop(key, None)
+        if contact is not None:
+            self.pending[row_id] = contact
+            self._reindex_pending()
+
+    def current_row(self, target: ContactRef) -> Dict[str, Any]:
+        """Último estado conocido del contacto: lo pendiente en el outbox o, si no hay, la réplica"""
+        if target in self.pending:
+            return self.pending[target].row
+        if isinstance(target, int):
+            return self.table.rows.get(target, {})
+        return {}
+
+    # --- Consultas ---
+
+    def lookup(self, email: Optional[str], phone: Optional[str]) -> Optional[ContactRef]:
+        """
+        Contacto existente con ese email (o, si no, ese teléfono): Id de la fila, o la clave
+        en el outbox de un alta que todavía no tiene Id
+        """
+        self._observe_outbox()
+        self._refresh()
+        email = normalize_email(email)
+        phone = normalize_phone(phone, settings.DEFAULT_PHONE_COUNTRY_CODE)
+        for key, pending, replica in ((email, self.pending_by_email, self.by_email),
+                                      (phone, self.pending_by_phone, self.by_phone)):
+            if not key:
+                continue
+            if key in pending:
+                target = pending[key]
+                return self.inserted_ids.get(target, target) if isinstance(target, str) else target
+            if key in replica:
+                return replica[key]
+        return None
+
+    def status(self) -> Dict[str, Any]:
+        self._observe_outbox()
+        self._refresh()
+        return {
+            "emails": len(self.by_email),
+            "phones": len(self.by_phone),
+            "duplicates": self.duplicates,
+            "pending": len(self.pending)
+        }
@@ -279,6 +279,7 @@ class ImprovedEmailService:
                     <div class="quote-summary">
                         <h3>💰 Desglose de Costos</h3>
                         {self._format_breakdown_html(quote_data.get('breakdown', []))}
+                        {self._format_transport_html(quote_data.get('transport'))}
                         <div class="quote-item" style="border-top: 2px solid #dc2626; margin-top: 15px; padding-top: 15px;">
                             <span class="quote-label" style="font-size: 1.2em;">TOTAL ESTIMADO:</span>
                             <span class="quote-value" style="font-size: 1.2em; color: #dc2626;">{quote_data.get('total_cost', 'N/A')}</span>
@@ -334,6 +335,18 @@ class ImprovedEmailService:
         
         return items_html
     
+    def _format_transport_html(self, transport: Optional[Dict[str, Any]]) -> str:
+        """Formatear la línea de transporte desde la planta más cercana"""
+        if not transport:
+            return ""
+        
+        return f"""
+            <div class="breakdown-item">
+                <span class="quote-label">Transporte ({transport.get('plant')} → {transport.get('destination')}, {transport.get('distance_km')} km, {transport.get('trucks')} camión/es):</span>
+                <span class="quote-value">{transport.get('cost', 'N/A')}</span>
+            </div>
+            """
+    
     def _create_contact_confirmation_body(self, name: str) -> str:
         """Crear cuerpo del email de confirmación de contacto"""
         return f"""
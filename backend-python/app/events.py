@@ -0,0 +1,112 @@
+"""
+Bus de eventos en proceso para cambios de precios y tipo de cambio
+Los publicadores emiten snapshots inmutables; los suscriptores reemplazan
+sus tablas y descartan caches derivados
+"""
+
+import asyncio
+import inspect
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+TOPIC_PRICES = "precios"
+TOPIC_EXCHANGE = "tipo_cambio"
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """Snapshot publicado de precios o tipo de cambio"""
+    topic: str
+    version: int
+    valores: Dict[str, float]
+    # Factor de mercado por tipo de construcción (precio publicado / precio base a la fecha)
+    factores: Dict[str, float] = field(default_factory=dict)
+    fuente: str = ""
+    timestamp: datetime = field(default_factory=datetime.now)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "topic": self.topic,
+            "version": self.version,
+            "valores": self.valores,
+            "factores": self.factores,
+            "fuente": self.fuente,
+            "timestamp": self.timestamp.isoformat()
+        }
+
+
+Handler = Callable[[PriceSnapshot], Any]
+
+
+class PriceEventBus:
+    """Pub/sub en proceso: handlers síncronos en línea, corrutinas en segundo plano"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Handler]] = {}
+        self._latest: Dict[str, PriceSnapshot] = {}
+        self._background: Set[asyncio.Task] = set()
+        # Se incrementa con cada publicación (sirve para ETags de respuestas derivadas)
+        self.version = 0
+
+    def subscribe(self, topic: str, handler: Handler):
+        """Registra un handler; si ya hay un snapshot publicado se le entrega en el acto"""
+        self._subscribers.setdefault(topic, []).append(handler)
+        latest = self._latest.get(topic)
+        if latest is not None and not inspect.iscoroutinefunction(handler):
+            self._call(handler, latest)
+
+    def latest(self, topic: str) -> Optional[PriceSnapshot]:
+        return self._latest.get(topic)
+
+    def publish(self, topic: str, valores: Dict[str, float], factores: Optional[Dict[str, float]] = None,
+                fuente: str = "", timestamp: Optional[datetime] = None) -> PriceSnapshot:
+        """Publica un snapshot nuevo y lo entrega a los suscriptores del tópico"""
+        self.version += 1
+        snapshot = PriceSnapshot(
+            topic=topic,
+            version=self.version,
+            valores=dict(valores),
+            factores=dict(factores or {}),
+            fuente=fuente,
+            timestamp=timestamp or datetime.now()
+        )
+        self._latest[topic] = snapshot
+
+        handlers = self._subscribers.get(topic, [])
+        logger.info(f"📢 Publicando {topic} v{snapshot.version} a {len(handlers)} suscriptores")
+        for handler in handlers:
+            if inspect.iscoroutinefunction(handler):
+                self._spawn(handler, snapshot)
+            else:
+                self._call(handler, snapshot)
+        return snapshot
+
+    @staticmethod
+    def _call(handler: Handler, snapshot: PriceSnapshot):
+        try:
+            handler(snapshot)
+        except Exception as e:
+            logger.error(f"Error en suscriptor de {snapshot.topic} ({handler.__qualname__}): {e}")
+
+    def _spawn(self, handler: Handler, snapshot: PriceSnapshot):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning(f"Sin event loop: se omite {handler.__qualname__} para {snapshot.topic}")
+            return
+        task = loop.create_task(handler(snapshot))
+        self._background.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error en suscriptor en segundo plano: {task.exception()}")
+
+
+# Instancia global del bus de eventos
+price_events = PriceEventBus()
@@ -0,0 +1,433 @@
+"""
+NocoDB simulado para pruebas de carga locales
+Implementa sobre tablas en memoria las rutas de datos que usa NocodbService: alta, alta y
+actualización bulk, listado (where/sort/limit/offset, incluido el cursor por clave de la
+réplica) y actualización por Id. Latencia, errores y límite de requests son configurables,
+también en caliente, para medir lotes, reintentos y control de carga sin tocar producción.
+
+Uso:
+    python -m app.fake_nocodb --puerto 8090 --latencia-ms 80 --jitter-ms 40 --tasa-errores 0.05 --limite-rps 20
+    NC_DB_URL=http://127.0.0.1:8090 python -m app.server
+
+Control:
+    GET  /_fake/estado    contadores por ruta y filas por tabla
+    POST /_fake/config    {"latency_ms": 500, "error_rate": 0.2, "rate_limit": 5, ...}
+    POST /_fake/reset     vacía tablas y contadores
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DATA_PREFIX = "/api/v1/db/data"
+
+
+@dataclass
+class FakeNocodbConfig:
+    """Comportamiento del servidor simulado (modificable en caliente con POST /_fake/config)"""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    hang_rate: float = 0.0
+    hang_seconds: float = 30.0
+    rate_limit: float = 0.0
+    burst: int = 10
+    token: Optional[str] = None
+    max_page_size: int = 1000
+
+
+class TokenBucket:
+    """Límite de requests por segundo con ráfaga, como el de un gateway delante de NocoDB"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def take(self) -> float:
+        """0 si la request pasa; si no, segundos hasta el próximo token"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(float(self.burst), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def _timestamp() -> str:
+    """Formato de NocoDB con microsegundos: ordenable como texto"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f+00:00")
+
+
+class FakeTable:
+    """Tabla en memoria con Id autoincremental y CreatedAt/UpdatedAt como los de NocoDB"""
+
+    def __init__(self):
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+
+    def insert(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        now = _timestamp()
+        row = {**record, "Id": self._next_id, "CreatedAt": now, "UpdatedAt": now}
+        self.rows[self._next_id] = row
+        self._next_id += 1
+        return row
+
+    def update(self, row_id: int, values: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        row = self.rows.get(row_id)
+        if row is None:
+            return None
+        row.update({k: v for k, v in values.items() if k not in ("Id", "CreatedAt")})
+        row["UpdatedAt"] = _timestamp()
+        return row
+
+
+# --- Filtros where de NocoDB: (campo,op,valor) combinados con ~and / ~or y paréntesis ---
+
+Condition = Callable[[Dict[str, Any]], bool]
+
+
+def _compare(value: Any, op: str, raw: str) -> bool:
+    if op == "blank":
+        return value in (None, "")
+    if op == "notblank":
+        return value not in (None, "")
+    if value is None:
+        return op == "neq"
+    if op in ("like", "nlike"):
+        found = raw.strip("%").lower() in str(value).lower()
+        return found if op == "like" else not found
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            other: Any = float(raw)
+        except ValueError:
+            return op == "neq"
+    else:
+        value, other = str(value), raw
+    if op == "eq":
+        return value == other
+    if op == "neq":
+        return value != other
+    if op == "gt":
+        return value > other
+    if op == "ge":
+        return value >= other
+    if op == "lt":
+        return value < other
+    if op == "le":
+        return value <= other
+    raise ValueError(f"Operador no soportado: {op}")
+
+
+def parse_where(where: str) -> Condition:
+    """Convierte un where de NocoDB en un predicado; ~and tiene precedencia sobre ~or"""
+    position = 0
+
+    def expect(text: str):
+        nonlocal position
+        if not where.startswith(text, position):
+            raise ValueError(f"Se esperaba '{text}' en la posición {position} de: {where}")
+        position += len(text)
+
+    def group() -> Condition:
+        nonlocal position
+        expect("(")
+        if where.startswith("(", position):
+            condition = expression()
+            expect(")")
+            return condition
+        end = where.find(")", position)
+        if end < 0:
+            raise ValueError(f"Paréntesis sin cerrar en: {where}")
+        parts = where[position:end].split(",", 2)
+        position = end + 1
+        if len(parts) < 2:
+            raise ValueError(f"Condición inválida: {where}")
+        field, op, raw = parts[0].strip(), parts[1].strip(), parts[2] if len(parts) > 2 else ""
+        _compare("", op, raw)  # valida el operador al parsear
+        return lambda row: _compare(row.get(field), op, raw)
+
+    def conjunction() -> Condition:
+        terms = [group()]
+        while where.startswith("~and", position):
+            expect("~and")
+            terms.append(group())
+        return terms[0] if len(terms) == 1 else lambda row: all(term(row) for term in terms)
+
+    def expression() -> Condition:
+        terms = [conjunction()]
+        while where.startswith("~or", position):
+            expect("~or")
+            terms.append(conjunction())
+        return terms[0] if len(terms) == 1 else lambda row: any(term(row) for term in terms)
+
+    condition = expression()
+    if position != len(where):
+        raise ValueError(f"Texto sobrante en la posición {position} de: {where}")
+    return condition
+
+
+def _sort_rows(rows: List[Dict[str, Any]], sort: str) -> List[Dict[str, Any]]:
+    """sort=campo1,-campo2: ordenamientos estables del último criterio al primero"""
+    for key in reversed([k.strip() for k in sort.split(",") if k.strip()]):
+        field = key.lstrip("-")
+        rows.sort(key=lambda row: (row.get(field) is not None, row.get(field) if row.get(field) is not None else 0),
+                  reverse=key.startswith("-"))
+    return rows
+
+
+class FakeNocodb:
+    """Estado del servidor: tablas, configuración, limitador y contadores"""
+
+    def __init__(self, config: Optional[FakeNocodbConfig] = None):
+        self.config = config or FakeNocodbConfig()
+        self.tables: Dict[Tuple[str, str], FakeTable] = {}
+        self.bucket = TokenBucket(self.config.rate_limit, self.config.burst)
+        self.requests: Counter = Counter()
+        self.responses: Counter = Counter()
+        self.bulk_sizes: Counter = Counter()
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def table(self, request: web.Request) -> FakeTable:
+        key = (request.match_info["base"], request.match_info["table"])
+        if key not in self.tables:
+            self.tables[key] = FakeTable()
+        return self.tables[key]
+
+    def configure(self, values: Dict[str, Any]):
+        known = {f.name for f in fields(FakeNocodbConfig)}
+        unknown = set(values) - known
+        if unknown:
+            raise ValueError(f"Opciones desconocidas: {', '.join(sorted(unknown))}")
+        for name, value in values.items():
+            setattr(self.config, name, value)
+        self.bucket = TokenBucket(self.config.rate_limit, self.config.burst)
+
+    def reset(self):
+        self.tables.clear()
+        for counter in (self.requests, self.responses, self.bulk_sizes):
+            counter.clear()
+        self.rows_inserted = self.rows_updated = self.max_inflight = 0
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "config": asdict(self.config),
+            "requests": dict(self.requests),
+            "responses": {str(code): count for code, count in sorted(self.responses.items())},
+            "bulk_sizes": {str(size): count for size, count in sorted(self.bulk_sizes.items())},
+            "rows_inserted": self.rows_inserted,
+            "rows_updated": self.rows_updated,
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "tables": {f"{base}/{table}": len(t.rows) for (base, table), t in self.tables.items()}
+        }
+
+    # --- Fallas simuladas ---
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if not request.path.startswith(DATA_PREFIX):
+            return await handler(request)
+        route = f"{request.method} {getattr(request.match_info.route.resource, 'canonical', request.path)}"
+        self.requests[route] += 1
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            response = await self._simulate(request, handler)
+        finally:
+            self.inflight -= 1
+        self.responses[response.status] += 1
+        return response
+
+    async def _simulate(self, request: web.Request, handler) -> web.StreamResponse:
+        config = self.config
+        if config.token and request.headers.get("xc-token") != config.token:
+            return web.json_response({"msg": "Invalid token"}, status=401)
+
+        wait = self.bucket.take()
+        if wait:
+            return web.json_response(
+                {"msg": "Too many requests"}, status=429,
+                headers={"Retry-After": str(max(1, round(wait)))}
+            )
+
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if config.hang_rate and random.random() < config.hang_rate:
+            await asyncio.sleep(config.hang_seconds)
+        if config.error_rate and random.random() < config.error_rate:
+            return web.json_response({"msg": "Error simulado"}, status=config.error_status)
+
+        return await handler(request)
+
+    # --- Rutas de datos ---
+
+    async def _json_body(self, request: web.Request) -> Any:
+        try:
+            return await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text=json.dumps({"msg": "JSON inválido"}), content_type="application/json")
+
+    async def insert(self, request: web.Request) -> web.Response:
+        record = await self._json_body(request)
+        if not isinstance(record, dict):
+            return web.json_response({"msg": "Se esperaba un objeto"}, status=400)
+        row = self.table(request).insert(record)
+        self.rows_inserted += 1
+        return web.json_response(row)
+
+    async def list_rows(self, request: web.Request) -> web.Response:
+        table = self.table(request)
+        try:
+            limit = min(int(request.query.get("limit", 25)), self.config.max_page_size)
+            offset = int(request.query.get("offset", 0))
+            condition = parse_where(request.query["where"]) if request.query.get("where") else None
+        except ValueError as e:
+            return web.json_response({"msg": str(e)}, status=400)
+
+        rows = [row for row in table.rows.values() if condition is None or condition(row)]
+        _sort_rows(rows, request.query.get("sort", "Id"))
+        page = rows[offset:offset + limit]
+        return web.json_response({
+            "list": page,
+            "pageInfo": {
+                "totalRows": len(rows),
+                "page": offset // limit + 1 if limit else 1,
+                "pageSize": limit,
+                "isFirstPage": offset == 0,
+                "isLastPage": offset + limit >= len(rows)
+            }
+        })
+
+    async def read(self, request: web.Request) -> web.Response:
+        row = self.table(request).rows.get(int(request.match_info["row_id"]))
+        if row is None:
+            return web.json_response({"msg": "Record not found"}, status=404)
+        return web.json_response(row)
+
+    async def update(self, request: web.Request) -> web.Response:
+        values = await self._json_body(request)
+        if not isinstance(values, dict):
+            return web.json_response({"msg": "Se esperaba un objeto"}, status=400)
+        row = self.table(request).update(int(request.match_info["row_id"]), values)
+        if row is None:
+            return web.json_response({"msg": "Record not found"}, status=404)
+        self.rows_updated += 1
+        return web.json_response(row)
+
+    async def bulk_insert(self, request: web.Request) -> web.Response:
+        records = await self._json_body(request)
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            return web.json_response({"msg": "Se esperaba una lista de objetos"}, status=400)
+        table = self.table(request)
+        self.bulk_sizes[len(records)] += 1
+        self.rows_inserted += len(records)
+        return web.json_response([{"Id": table.insert(record)["Id"]} for record in records])
+
+    async def bulk_update(self, request: web.Request) -> web.Response:
+        records = await self._json_body(request)
+        if not isinstance(records, list) or not all(isinstance(r, dict) and "Id" in r for r in records):
+            return web.json_response({"msg": "Se esperaba una lista de objetos con Id"}, status=400)
+        table = self.table(request)
+        self.bulk_sizes[len(records)] += 1
+        updated = [row["Id"] for row in (table.update(int(r["Id"]), r) for r in records) if row is not None]
+        self.rows_updated += len(updated)
+        return web.json_response([{"Id": row_id} for row_id in updated])
+
+    # --- Control ---
+
+    async def get_status(self, request: web.Request) -> web.Response:
+        return web.json_response(self.status())
+
+    async def post_config(self, request: web.Request) -> web.Response:
+        try:
+            self.configure(await request.json())
+        except (ValueError, TypeError) as e:
+            return web.json_response({"msg": str(e)}, status=400)
+        logger.info(f"⚙️ Configuración del NocoDB simulado: {asdict(self.config)}")
+        return web.json_response(asdict(self.config))
+
+    async def post_reset(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({"reset": True})
+
+
+def create_app(fake: Optional[FakeNocodb] = None) -> web.Application:
+    fake = fake or FakeNocodb()
+    app = web.Application(middlewares=[fake.middleware])
+    app["fake"] = fake
+    rows = DATA_PREFIX + "/{org}/{base}/{table}"
+    bulk = DATA_PREFIX + "/bulk/{org}/{base}/{table}"
+    app.router.add_post(bulk, fake.bulk_insert)
+    app.router.add_patch(bulk, fake.bulk_update)
+    app.router.add_get(rows, fake.list_rows)
+    app.router.add_post(rows, fake.insert)
+    app.router.add_get(rows + "/{row_id:\\d+}", fake.read)
+    app.router.add_patch(rows + "/{row_id:\\d+}", fake.update)
+    app.router.add_get("/_fake/estado", fake.get_status)
+    app.router.add_post("/_fake/config", fake.post_config)
+    app.router.add_post("/_fake/reset", fake.post_reset)
+    return app
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """Opciones de comportamiento compartidas con el benchmark"""
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latencia media por request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Variación uniforme de la latencia (±)")
+    parser.add_argument("--tasa-errores", type=float, default=0.0, help="Fracción de requests que fallan (0-1)")
+    parser.add_argument("--estado-error", type=int, default=500, help="Código HTTP de los errores simulados")
+    parser.add_argument("--tasa-colgadas", type=float, default=0.0, help="Fracción de requests que no responden a tiempo")
+    parser.add_argument("--segundos-colgada", type=float, default=30.0)
+    parser.add_argument("--limite-rps", type=float, default=0.0, help="Requests por segundo antes de responder 429 (0 = sin límite)")
+    parser.add_argument("--rafaga", type=int, default=10, help="Requests permitidas de golpe por encima del límite")
+    parser.add_argument("--token", default=None, help="xc-token exigido (por defecto se acepta cualquiera)")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeNocodbConfig:
+    return FakeNocodbConfig(
+        latency_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.tasa_errores,
+        error_status=args.estado_error,
+        hang_rate=args.tasa_colgadas,
+        hang_seconds=args.segundos_colgada,
+        rate_limit=args.limite_rps,
+        burst=args.rafaga,
+        token=args.token
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.fake_nocodb", description="NocoDB simulado para pruebas de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8090)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    logger.info(f"🧪 NocoDB simulado en http://{args.host}:{args.puerto} ({asdict(config_from_args(args))})")
+    web.run_app(create_app(FakeNocodb(config_from_args(args))), host=args.host, port=args.puerto, print=None)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,63 @@
+"""
+Utilidades de archivos para los caches locales
+Escrituras atómicas: un corte a mitad de escritura nunca deja un archivo corrupto
+"""
+
+import json
+import os
+import struct
+import tempfile
+import zlib
+from typing import Any
+
+# Encabezado de archivos con checksum: magic de 8 bytes, largo y CRC32 del contenido
+_CHECKSUM_HEADER = struct.Struct("<8sII")
+
+
+def atomic_write_bytes(path: str, payload: bytes, fsync: bool = True):
+    """
+    Escribe en un archivo temporal del mismo directorio y lo renombra sobre el destino
+    Con fsync=False el reemplazo sigue siendo atómico para los lectores, pero un corte de
+    energía puede perderlo (para estado efímero)
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: str, data: Any, fsync: bool = True):
+    """Serializa a JSON y escribe de forma atómica"""
+    atomic_write_bytes(path, json.dumps(data, default=str).encode("utf-8"), fsync)
+
+
+def atomic_write_checksummed(path: str, magic: bytes, payload: bytes):
+    """Escribe de forma atómica el contenido precedido por magic, largo y CRC32"""
+    header = _CHECKSUM_HEADER.pack(magic, len(payload), zlib.crc32(payload))
+    atomic_write_bytes(path, header + payload)
+
+
+def read_checksummed(path: str, magic: bytes) -> bytes:
+    """Lee un archivo escrito con atomic_write_checksummed; ValueError si está truncado o corrupto"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _CHECKSUM_HEADER.size:
+        raise ValueError(f"{path}: archivo truncado")
+    file_magic, length, crc = _CHECKSUM_HEADER.unpack_from(data, 0)
+    if file_magic != magic:
+        raise ValueError(f"{path}: formato desconocido")
+    payload = data[_CHECKSUM_HEADER.size:]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise ValueError(f"{path}: checksum inválido")
+    return payload
@@ -0,0 +1,155 @@
+"""
+Nomenclátor offline de localidades de Argentina
+Índice de prefijos sobre un arreglo ordenado (bisect) para autocompletado
+y resolución de ciudad -> provincia / multiplicador de costo
+"""
+
+import csv
+import logging
+import os
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional
+
+from .regions import region_registry, normalize_region_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "localidades.csv")
+
+# Tipos de clave del índice: nombre o alias completo, o palabra interna del nombre
+_KEY_FULL = 0
+_KEY_WORD = 1
+
+
+@dataclass
+class Locality:
+    """Localidad del nomenclátor"""
+    id: int
+    nombre: str
+    provincia: str
+    region_id: int
+    lat: float
+    lon: float
+    multiplicador: float = 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data.pop("region_id")
+        data["provincia_nombre"] = region_registry.get(self.region_id).nombre
+        return data
+
+
+class Gazetteer:
+    """Nomenclátor con índice de prefijos ordenado"""
+
+    def __init__(self):
+        self.localities: List[Locality] = []
+        # Índice de prefijos: claves normalizadas ordenadas y columnas paralelas
+        self._keys: List[str] = []
+        self._key_localities = array("I")
+        self._key_kinds = array("B")
+        # Coincidencia exacta (nombre o alias) -> localidades con ese nombre
+        self._exact: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.localities)
+
+    def load_csv(self, path: str) -> int:
+        """Carga localidades desde un CSV y reconstruye el índice"""
+        with open(path, newline="", encoding="utf-8") as f:
+            lines = (line for line in f if line.strip() and not line.lstrip().startswith("#"))
+            rows = list(csv.DictReader(lines))
+
+        for row in rows:
+            region = region_registry.find(row["provincia"])
+            if region is None:
+                logger.warning(f"Provincia desconocida para {row['nombre']}: {row['provincia']}")
+                continue
+            locality = Locality(
+                id=len(self.localities),
+                nombre=row["nombre"],
+                provincia=region.slug,
+                region_id=region.id,
+                lat=float(row["lat"]),
+                lon=float(row["lon"]),
+                multiplicador=float(row["multiplicador"]) if row.get("multiplicador") else 1.0
+            )
+            self.localities.append(locality)
+            aliases = [a for a in (row.get("alias") or "").split("|") if a]
+            for name in [locality.nombre, *aliases]:
+                self._exact.setdefault(normalize_region_key(name), []).append(locality.id)
+
+        self._build_index()
+        logger.info(f"🏘️ Nomenclátor: {len(self.localities)} localidades, {len(self._keys)} claves de búsqueda")
+        return len(rows)
+
+    def _build_index(self):
+        entries = []
+        for key, locality_ids in self._exact.items():
+            for locality_id in locality_ids:
+                entries.append((key, _KEY_FULL, locality_id))
+                # Cada palabra interna también es un punto de entrada ("carlos paz", "paz")
+                words = key.split(" ")
+                for i in range(1, len(words)):
+                    entries.append((" ".join(words[i:]), _KEY_WORD, locality_id))
+        entries.sort()
+        self._keys = [key for key, _, _ in entries]
+        self._key_kinds = array("B", (kind for _, kind, _ in entries))
+        self._key_localities = array("I", (locality_id for _, _, locality_id in entries))
+
+    def autocomplete(self, prefix: str, provincia: Optional[str] = None,
+                     limit: int = 10) -> List[Locality]:
+        """Localidades cuyo nombre, alias o alguna palabra empieza con el prefijo"""
+        prefix = normalize_region_key(prefix)
+        if not prefix:
+            return []
+        region_id = region_registry.resolve(provincia) if provincia else None
+        if provincia and region_id is None:
+            return []
+
+        # Rango [lo, hi) de claves con el prefijo: dos búsquedas binarias
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + "\uffff", lo)
+
+        ranked: Dict[int, int] = {}
+        for i in range(lo, hi):
+            locality_id = self._key_localities[i]
+            if region_id is not None and self.localities[locality_id].region_id != region_id:
+                continue
+            kind = self._key_kinds[i]
+            if kind < ranked.get(locality_id, len(self._keys)):
+                ranked[locality_id] = kind
+
+        # Primero las coincidencias por inicio de nombre, luego por palabra interna
+        ordered = sorted(ranked, key=lambda lid: (ranked[lid], self.localities[lid].nombre))
+        return [self.localities[lid] for lid in ordered[:limit]]
+
+    def resolve(self, ciudad: Optional[str], provincia: Optional[str] = None) -> Optional[Locality]:
+        """Localidad exacta por nombre o alias; la provincia desambigua nombres repetidos"""
+        if not ciudad:
+            return None
+        candidates = self._exact.get(normalize_region_key(ciudad), [])
+        if provincia:
+            region_id = region_registry.resolve(provincia)
+            candidates = [lid for lid in candidates if self.localities[lid].region_id == region_id]
+        # Un nombre ambiguo sin provincia no se resuelve
+        if len(candidates) != 1:
+            return None
+        return self.localities[candidates[0]]
+
+    def city_multiplier(self, ciudad: Optional[str], provincia: Optional[str] = None) -> float:
+        """Multiplicador de costo de la localidad (1.0 si no se reconoce)"""
+        locality = self.resolve(ciudad, provincia)
+        return locality.multiplicador if locality else 1.0
+
+
+def load_gazetteer() -> Gazetteer:
+    gazetteer = Gazetteer()
+    gazetteer.load_csv(DEFAULT_GAZETTEER_PATH)
+    return gazetteer
+
+
+# Instancia global del nomenclátor
+gazetteer = load_gazetteer()
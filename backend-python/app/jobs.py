@@ -0,0 +1,277 @@
+"""
+Trabajos con seguimiento de estado para el trabajo pesado de las cotizaciones (PDF + email)
+El endpoint responde al instante con el id del trabajo; el cliente consulta GET /jobs/{id} o
+se suscribe a sus eventos (SSE) hasta que termina. Cada worker ejecuta y guarda en memoria
+sus trabajos (acotados y con vencimiento por TTL) y publica su estado en JOBS_DIR, así
+cualquier worker responde por un trabajo aunque lo haya recibido otro.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from .background import BackgroundQueueFullError, background_jobs
+from .config import settings
+from .file_utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# Callback de avance que recibe cada trabajo: (paso, porcentaje)
+Progress = Callable[[str, int], None]
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class JobStoreFullError(BackgroundQueueFullError):
+    """El almacén está lleno de trabajos sin terminar"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    state: str
+    step: str
+    progress: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    version: int = 0
+    _changed: Optional[asyncio.Event] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "step": self.step,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "finished_at": self.finished_at,
+            "version": self.version
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        return cls(**{name: data.get(name) for name in (
+            "id", "kind", "state", "step", "progress", "result", "error",
+            "created_at", "updated_at", "finished_at", "version"
+        )})
+
+
+class JobStore:
+    """
+    Trabajos por id en orden de creación; los terminados vencen `ttl` segundos después
+    Los propios se siguen en memoria; los de otros workers se leen del directorio compartido
+    """
+
+    PENDING = "pendiente"
+    RUNNING = "en_curso"
+    COMPLETED = "completado"
+    FAILED = "fallido"
+
+    def __init__(self, max_jobs: int, ttl: float, directory: str):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.directory = directory
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._last_sweep = 0.0
+        self.created = 0
+        self.completed = 0
+        self.failed = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def is_finished(self, job: Job) -> bool:
+        return job.state in (self.COMPLETED, self.FAILED)
+
+    def _expired(self, job: Job, now: float) -> bool:
+        return job.finished_at is not None and now - job.finished_at > self.ttl
+
+    # --- Estado compartido entre workers ---
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _publish(self, job: Job):
+        """Escribe el estado del trabajo para los demás workers (sin fsync: es estado efímero)"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write_json(self._path(job.id), job.to_dict(), fsync=False)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo publicar el estado del trabajo {job.id}: {e}")
+
+    def _unpublish(self, job_id: str):
+        try:
+            os.unlink(self._path(job_id))
+        except OSError:
+            pass
+
+    def _load(self, job_id: str) -> Optional[Job]:
+        """Trabajo de otro worker, leído del directorio compartido"""
+        try:
+            with open(self._path(job_id), "r") as f:
+                return Job.from_dict(json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _sweep(self, now: float):
+        """Borra estados vencidos que dejaron workers ya detenidos (como mucho una vez por minuto)"""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                # Un trabajo se publica en cada cambio: el que no cambió en 2 TTL está abandonado
+                if name.endswith(".json") and now - os.path.getmtime(path) > 2 * self.ttl:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Quita los vencidos; si sigue lleno, el terminado más antiguo (nunca uno en curso)"""
+        now = time.time()
+        for job_id in [job.id for job in self._jobs.values() if self._expired(job, now)]:
+            del self._jobs[job_id]
+            self._unpublish(job_id)
+            self.evicted += 1
+        self._sweep(now)
+        if len(self._jobs) < self.max_jobs:
+            return
+        oldest_finished = next((job.id for job in self._jobs.values() if self.is_finished(job)), None)
+        if oldest_finished is None:
+            self.rejected += 1
+            raise JobStoreFullError(f"{len(self._jobs)} trabajos en curso")
+        del self._jobs[oldest_finished]
+        self._unpublish(oldest_finished)
+        self.evicted += 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Trabajo propio o de otro worker; None si no existe o venció"""
+        job = self._jobs.get(job_id)
+        if job is None and _JOB_ID.fullmatch(job_id):
+            job = self._load(job_id)
+        if job is None or self._expired(job, time.time()):
+            return None
+        return job
+
+    def update(self, job: Job, **changes):
+        """Aplica cambios al trabajo y despierta a los suscriptores de sus eventos"""
+        for name, value in changes.items():
+            setattr(job, name, value)
+        job.updated_at = time.time()
+        job.version += 1
+        self._publish(job)
+        if job._changed is not None:
+            job._changed.set()
+            job._changed = None
+
+    def submit(self, kind: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Job:
+        """Crea el trabajo y lo ejecuta en el ejecutor de segundo plano; func(progress, *args)"""
+        self._evict()
+        job = Job(id=uuid.uuid4().hex, kind=kind, state=self.PENDING, step="En cola")
+        # Si la cola de tareas rechaza el trabajo (BackgroundQueueFullError), no se registra
+        background_jobs.submit(self._run, job, func, args, kwargs, name=f"{kind}:{job.id[:8]}")
+        self._jobs[job.id] = job
+        self._publish(job)
+        self.created += 1
+        return job
+
+    async def _run(self, job: Job, func: Callable[..., Awaitable[Any]], args: tuple, kwargs: Dict[str, Any]):
+        def progress(step: str, percent: int):
+            self.update(job, step=step, progress=max(job.progress, min(percent, 99)))
+
+        self.update(job, state=self.RUNNING, step="Iniciado")
+        try:
+            result = await func(progress, *args, **kwargs)
+        except asyncio.CancelledError:
+            self._finish(job, self.FAILED, error="Cancelado (tiempo máximo excedido o cierre del servidor)")
+            raise
+        except Exception as e:
+            self._finish(job, self.FAILED, error=str(e))
+            raise
+        self._finish(job, self.COMPLETED, result=result)
+        return result
+
+    def _finish(self, job: Job, state: str, result: Any = None, error: Optional[str] = None):
+        if state == self.COMPLETED:
+            self.completed += 1
+            self.update(job, state=state, step="Completado", progress=100, result=result, finished_at=time.time())
+        else:
+            self.failed += 1
+            self.update(job, state=state, step="Error", error=error, finished_at=time.time())
+
+    async def watch(self, job: Job, keepalive: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Estado del trabajo en cada cambio hasta que termina; None cada `keepalive` segundos sin cambios"""
+        if self._jobs.get(job.id) is not job:
+            async for snapshot in self._watch_remote(job, keepalive):
+                yield snapshot
+            return
+        version = -1
+        while True:
+            if job.version != version:
+                version = job.version
+                yield job.to_dict()
+                if self.is_finished(job):
+                    return
+            if job._changed is None:
+                job._changed = asyncio.Event()
+            try:
+                await asyncio.wait_for(job._changed.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+    async def _watch_remote(self, job: Job, keepalive: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Trabajo de otro worker: se relee su estado publicado cada JOBS_POLL_SECONDS"""
+        yield job.to_dict()
+        last_event = time.monotonic()
+        while not self.is_finished(job):
+            await asyncio.sleep(settings.JOBS_POLL_SECONDS)
+            current = self._load(job.id)
+            if current is None:
+                # Venció o lo descartó el worker que lo ejecuta
+                return
+            if current.version != job.version:
+                job = current
+                last_event = time.monotonic()
+                yield job.to_dict()
+            elif time.monotonic() - last_event >= keepalive:
+                last_event = time.monotonic()
+                yield None
+
+    def stats(self) -> Dict[str, Any]:
+        by_state: Dict[str, int] = {}
+        for job in self._jobs.values():
+            by_state[job.state] = by_state.get(job.state, 0) + 1
+        return {
+            "max_jobs": self.max_jobs,
+            "ttl_seconds": self.ttl,
+            "stored": len(self._jobs),
+            "by_state": by_state,
+            "created": self.created,
+            "completed": self.completed,
+            "failed": self.failed,
+            "evicted": self.evicted,
+            "rejected": self.rejected
+        }
+
+
+# Instancia global del almacén de trabajos
+job_store = JobStore(settings.JOBS_MAX_ENTRIES, settings.JOBS_TTL_SECONDS, settings.JOBS_DIR)
@@ -0,0 +1,120 @@
+"""
+Elección de líder entre workers mediante un lock de archivo del sistema operativo
+El lock lo libera el kernel cuando el proceso muere, así que otro worker puede tomarlo
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, cada proceso se considera líder
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class FileLeaderLock:
+    """Lock exclusivo no bloqueante sobre un archivo; el dueño del lock es el líder"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None
+
+    def _open(self) -> int:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _take(self, fd: int):
+        # PID del líder en el archivo, solo informativo
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        logger.info(f"👑 Proceso {os.getpid()} es líder ({self.path})")
+
+    def try_acquire(self) -> bool:
+        """Intenta tomar el liderazgo; retorna True si este proceso es (o ya era) el líder"""
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            logger.warning("fcntl no disponible: este proceso asume el liderazgo sin lock")
+            self._fd = -1
+            return True
+
+        fd = self._open()
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._take(fd)
+        return True
+
+    async def wait_acquire(self) -> bool:
+        """Espera el liderazgo con un flock bloqueante en un hilo daemon
+
+        El kernel entrega el lock en cuanto el líder lo libera o muere, sin esperar a un sondeo.
+        Si la espera se cancela, el hilo suelta el lock apenas lo obtiene.
+        """
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            return self.try_acquire()
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+
+        def deliver(fd: Optional[int]):
+            if future.done():
+                # Espera cancelada (por ejemplo, el worker se está deteniendo)
+                if fd is not None:
+                    os.close(fd)
+            else:
+                future.set_result(fd)
+
+        def wait():
+            fd: Optional[int] = self._open()
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except OSError as e:
+                logger.error(f"Error esperando el lock de liderazgo: {e}")
+                os.close(fd)
+                fd = None
+            try:
+                loop.call_soon_threadsafe(deliver, fd)
+            except RuntimeError:
+                # Event loop cerrado: el proceso se está deteniendo
+                if fd is not None:
+                    os.close(fd)
+
+        threading.Thread(target=wait, name="leader-wait", daemon=True).start()
+        fd = await future
+        if fd is None:
+            return False
+        self._take(fd)
+        return True
+
+    def leader_pid(self) -> Optional[int]:
+        """PID registrado por el líder actual (puede quedar desactualizado si murió)"""
+        try:
+            with open(self.path, "r") as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def release(self):
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+        logger.info(f"Proceso {os.getpid()} liberó el liderazgo ({self.path})")
@@ -1,17 +1,19 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from pydantic import ValidationError
 import uvicorn
+import asyncio
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import json
 import os
+import uuid
 from datetime import datetime
 
 from .models import (
     CotizacionRequest, CotizacionResponse, Material, 
-    PrecioMaterial, CalculoCostos
+    PrecioMaterial, CalculoCostos, PreciosBatchRequest
 )
 from .price_service import PriceService
 from .email_service_improved import improved_email_service
@@ -19,42 +21,37 @@ from .nocodb_service import nocodb_service
 from .pdf_service import pdf_service
 from .argentina_apis import argentina_api_service, get_current_prices, get_current_exchange_rate
 from .price_updater import price_updater_service, start_price_updater, get_price_updater_status
+from .price_history import price_history
+from .material_catalog import material_catalog
+from .cost_index import cost_index
+from .regions import region_registry
+from .gazetteer import gazetteer
+from .events import price_events
+from .shared_tables import shared_tables
+from .background import background_jobs, BackgroundQueueFullError
+from .jobs import job_store, Progress
+from .transport import estimate_transport_line
 from .config import settings
 
-# Función wrapper para guardar datos en NocoDB
-def save_data_to_nocodb(data_type: str, data: Dict[str, Any]):
-    """Wrapper síncrono para guardar datos en NocoDB"""
-    import asyncio
-    try:
-        logger.info(f"🔄 Guardando {data_type} en NocoDB: {data.get('nombre', data.get('customer_name', 'Sin nombre'))}")
-        logger.info(f"📊 Datos recibidos: {data}")
-        
-        # Crear nuevo loop de eventos para la tarea async
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            if data_type == "contact":
-                success = loop.run_until_complete(nocodb_service.save_customer_data(data))
-            elif data_type == "quote":
-                success = loop.run_until_complete(nocodb_service.save_quote_data(data))
-            else:
-                logger.error(f"❌ Tipo de datos no reconocido: {data_type}")
-                return False
-                
-            if success:
-                logger.info(f"✅ {data_type} guardado exitosamente en NocoDB")
-            else:
-                logger.error(f"❌ Error guardando {data_type} en NocoDB")
-            return success
-        finally:
-            loop.close()
-            
-    except Exception as e:
-        logger.error(f"❌ Error en wrapper de guardado de {data_type}: {e}")
-        import traceback
-        logger.error(f"❌ Traceback: {traceback.format_exc()}")
+# Guardado en NocoDB desde tareas en segundo plano
+async def save_data_to_nocodb(data_type: str, data: Dict[str, Any]) -> bool:
+    """Guarda contactos o cotizaciones en NocoDB (corre en el event loop principal)"""
+    logger.info(f"🔄 Guardando {data_type} en NocoDB: {data.get('nombre', data.get('customer_name', 'Sin nombre'))}")
+    logger.info(f"📊 Datos recibidos: {data}")
+    
+    if data_type == "contact":
+        success = await nocodb_service.save_customer_data(data)
+    elif data_type == "quote":
+        success = await nocodb_service.save_quote_data(data)
+    else:
+        logger.error(f"❌ Tipo de datos no reconocido: {data_type}")
         return False
+    
+    if success:
+        logger.info(f"✅ {data_type} registrado para NocoDB")
+    else:
+        logger.error(f"❌ Error guardando {data_type} en NocoDB")
+    return success
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
@@ -78,9 +75,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(BackgroundQueueFullError)
+async def cola_llena_handler(request: Request, exc: BackgroundQueueFullError):
+    """Cola de tareas en segundo plano saturada: 503 con Retry-After en lugar de acumular trabajo"""
+    logger.warning(f"⚠️ Trabajo rechazado en {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado, reintentar en unos segundos"},
+        headers={"Retry-After": str(settings.BACKGROUND_RETRY_AFTER_SECONDS)}
+    )
+
 # Instanciar servicios
 price_service = PriceService()
 
+def _build_cotizacion(request: CotizacionRequest) -> CotizacionResponse:
+    """Cotización de /cotizar a partir de la calculadora de construcción (la misma de /api/construction)"""
+    square_meters = request.metros_cuadrados
+    quote = construction_calculator.calculate_detailed_quote({
+        'client_name': request.nombre,
+        'client_email': request.email,
+        'client_phone': request.whatsapp or request.telefono,
+        'location': request.provincia,
+        'city': request.ciudad,
+        'construction_type': request.tipo_construccion.value.replace('_', '-'),
+        'square_meters': square_meters,
+        'floors': request.pisos,
+        'usage_type': request.tipo_uso.value,
+        'finish_level': request.nivel_terminacion.value
+    })
+    extract = construction_calculator._extract_numeric_cost
+    
+    desglose = {item['category']: extract(item['cost']) for item in quote['breakdown']}
+    desglose['Costos Adicionales'] = extract(quote['additional_costs'])
+    desglose['Transporte'] = quote['transporte_cost']
+    materiales = [
+        Material(
+            nombre=item['category'],
+            precio_por_m2=round(extract(item['cost']) / square_meters, 2),
+            unidad="m²",
+            categoria=item['category']
+        )
+        for item in quote['breakdown']
+    ]
+    observaciones = [f"Ubicación: {quote['location']}", f"Válida hasta el {quote['valid_until']}"]
+    transport = quote['transport']
+    if transport:
+        observaciones.append(
+            f"Transporte desde {transport['plant']} a {transport['destination']} "
+            f"({transport['distance_km']} km, {transport['trucks']} camión/es): {transport['cost']}"
+        )
+    if request.observaciones:
+        observaciones.append(request.observaciones)
+    
+    return CotizacionResponse(
+        id=f"COT-{uuid.uuid4().hex[:8].upper()}",
+        cliente=request.nombre,
+        total_estimado=extract(quote['total_cost']),
+        desglose=desglose,
+        materiales_utilizados=materiales,
+        tiempo_estimado=quote['estimated_time'],
+        observaciones=observaciones
+    )
+
 @app.get("/")
 async def root():
     """Endpoint raíz"""
@@ -97,7 +153,7 @@ async def health_check():
     return {"status": "healthy", "service": "cotizador_construccion", "company": "Sumpetrol"}
 
 @app.post("/cotizar", response_model=CotizacionResponse)
-async def crear_cotizacion(request: CotizacionRequest, background_tasks: BackgroundTasks):
+async def crear_cotizacion(request: CotizacionRequest):
     """Crea una nueva cotización de construcción"""
     try:
         logger.info(f"Nueva cotización solicitada por: {request.nombre}")
@@ -110,32 +166,41 @@ async def crear_cotizacion(request: CotizacionRequest, background_tasks: Backgro
             raise HTTPException(status_code=400, detail="El número de pisos debe estar entre 1 y 10")
         
         # Calcular cotización
-        cotizacion = await calculator.calculate_quote(request)
-        
-        # Guardar en Nocodb en background
-        background_tasks.add_task(
-            nocodb_service.save_customer_data,
-            {
-                "fecha": datetime.now().strftime("%Y-%m-%d"),
-                "nombre": request.nombre,
-                "email": request.email,
-                "whatsapp": request.whatsapp,
-                "tipo_construccion": request.tipo_construccion,
-                "metros_cuadrados": request.metros_cuadrados,
-                "provincia": request.provincia,
-                "pisos": request.pisos,
-                "uso": request.tipo_uso,
-                "terminaciones": request.nivel_terminacion,
-                "total_cotizacion": cotizacion.total_estimado,
-                "materiales": str(cotizacion.materiales_utilizados),
-                "observaciones": request.observaciones
-            }
-        )
+        cotizacion = _build_cotizacion(request)
+        
+        # Guardar en Nocodb en background (esencial: se acepta aun por encima de la marca de agua alta)
+        customer_data = {
+            "fecha": datetime.now().strftime("%Y-%m-%d"),
+            "nombre": request.nombre,
+            "email": request.email,
+            "whatsapp": request.whatsapp,
+            "tipo_construccion": request.tipo_construccion,
+            "metros_cuadrados": request.metros_cuadrados,
+            "provincia": request.provincia,
+            "pisos": request.pisos,
+            "uso": request.tipo_uso,
+            "terminaciones": request.nivel_terminacion,
+            "total_cotizacion": cotizacion.total_estimado,
+            "materiales": str(cotizacion.materiales_utilizados),
+            "observaciones": request.observaciones
+        }
+        try:
+            background_jobs.submit(nocodb_service.save_customer_data, customer_data, essential=True)
+        except BackgroundQueueFullError:
+            # Cola al máximo: el alta se registra en el outbox dentro de la request (milisegundos)
+            # en lugar de perder el contacto o rechazar la cotización
+            try:
+                await nocodb_service.save_customer_data(customer_data)
+            except Exception as e:
+                # La cotización ya está calculada: se responde igual
+                logger.error(f"❌ No se pudo registrar el contacto de {request.email}: {e}")
         
         logger.info(f"Cotización creada exitosamente. ID: {cotizacion.id}")
         
         return cotizacion
         
+    except HTTPException:
+        raise
     except ValidationError as e:
         logger.error(f"Error de validación: {e}")
         raise HTTPException(status_code=422, detail=str(e))
@@ -144,10 +209,7 @@ async def crear_cotizacion(request: CotizacionRequest, background_tasks: Backgro
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 @app.post("/cotizar/enviar-email")
-async def enviar_cotizacion_email(
-    request: Request,
-    background_tasks: BackgroundTasks
-):
+async def enviar_cotizacion_email(request: Request):
     """Envía la cotización por email al cliente"""
     try:
         logger.info("📧 Recibiendo solicitud de envío de email de cotización...")
@@ -180,26 +242,33 @@ async def enviar_cotizacion_email(
             'tiempo_estimado': body.get('tiempo_estimado')
         }
         
+        quote_data['ciudad'] = body.get('ciudad')
+        _add_transport(quote_data)
+        
         logger.info(f"👤 Cliente: {customer_name}, Email: {customer_email}")
         logger.info(f"📊 Tipo construcción: {quote_data.get('tipo_construccion')}, Área: {quote_data.get('metros_cuadrados')} m²")
         
-        # Generar PDF en background
-        background_tasks.add_task(
+        # PDF y email como trabajo con seguimiento: el cliente consulta /jobs/{id} o sus eventos
+        job = job_store.submit(
+            "email_cotizacion",
             _generate_and_send_pdf_email,
             customer_email,
             customer_name,
             quote_data
         )
         
-        logger.info("✅ Tarea de envío de email agregada a background tasks")
+        logger.info(f"✅ Envío de email registrado como trabajo {job.id}")
         
-        return {
+        return JSONResponse(status_code=202, content={
             "success": True,
-            "message": "Email de cotización enviado exitosamente",
-            "status": "enviado"
-        }
-        
-    except HTTPException:
+            "message": "Cotización en proceso de envío",
+            "status": job.state,
+            "job_id": job.id,
+            "estado_url": f"/jobs/{job.id}",
+            "eventos_url": f"/jobs/{job.id}/eventos"
+        })
+        
+    except (HTTPException, BackgroundQueueFullError):
         raise
     except Exception as e:
         logger.error(f"❌ Error enviando email: {e}")
@@ -207,38 +276,50 @@ async def enviar_cotizacion_email(
         logger.error(f"❌ Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
-async def _generate_and_send_pdf_email(customer_email: str, customer_name: str, quote_data: Dict[str, Any]):
-    """Función helper para generar PDF y enviar email en background"""
+def _add_transport(quote_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Completa la línea y el costo de transporte de una cotización (para el PDF y el email)"""
+    if quote_data.get('transport') is None:
+        try:
+            square_meters = float(quote_data.get('metros_cuadrados') or 0) * int(quote_data.get('pisos') or 1)
+        except (TypeError, ValueError):
+            square_meters = 0.0
+        transport, transport_cost = estimate_transport_line(
+            quote_data.get('ciudad'), quote_data.get('provincia'), square_meters
+        ) if square_meters > 0 else (None, 0.0)
+        quote_data['transport'] = transport
+        quote_data.setdefault('transporte_cost', transport_cost)
+    return quote_data
+
+async def _generate_and_send_pdf_email(progress: Progress, customer_email: str, customer_name: str,
+                                      quote_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Trabajo de envío de cotización: genera el PDF y lo envía adjunto; falla si el email no sale"""
+    logger.info(f"📧 Generando PDF y enviando email a {customer_email}...")
+    
+    # Generar PDF (bloqueante: en un hilo para no frenar el event loop)
+    progress("Generando PDF", 10)
+    pdf_path = await asyncio.to_thread(
+        pdf_service.generate_quote_pdf, quote_data, {"nombre": customer_name, "email": customer_email}
+    )
+    logger.info(f"✅ PDF generado: {pdf_path}")
+    
     try:
-        logger.info(f"📧 Generando PDF y enviando email a {customer_email}...")
-        
-        # Generar PDF
-        pdf_path = pdf_service.generate_quote_pdf(quote_data, {"nombre": customer_name, "email": customer_email})
-        logger.info(f"✅ PDF generado: {pdf_path}")
-        
-        # Enviar email usando el servicio mejorado
-        success = improved_email_service.send_construction_quote_email(customer_email, customer_name, quote_data)
-        
+        progress("Enviando email", 50)
+        success = await asyncio.to_thread(
+            improved_email_service.send_construction_quote_email, customer_email, customer_name, quote_data, pdf_path
+        )
+    finally:
         # Limpiar archivo temporal
         if os.path.exists(pdf_path):
             os.remove(pdf_path)
             logger.info("🗑️ Archivo temporal PDF eliminado")
-            
-        if success:
-            logger.info(f"✅ Email de cotización enviado exitosamente a {customer_email}")
-        else:
-            logger.error(f"❌ Error enviando email a {customer_email}")
-            
-    except Exception as e:
-        logger.error(f"❌ Error en proceso de email con PDF: {e}")
-        import traceback
-        logger.error(f"❌ Traceback: {traceback.format_exc()}")
+    
+    if not success:
+        raise RuntimeError(f"No se pudo enviar el email a {customer_email}")
+    logger.info(f"✅ Email de cotización enviado exitosamente a {customer_email}")
+    return {"email": customer_email, "pdf_adjunto": True}
 
 @app.post("/contacto/enviar")
-async def enviar_contacto(
-    request: Request,
-    background_tasks: BackgroundTasks
-):
+async def enviar_contacto(request: Request):
     """Envía formulario de contacto"""
     try:
         logger.info("📧 Recibiendo formulario de contacto...")
@@ -257,27 +338,37 @@ async def enviar_contacto(
             logger.error("❌ Faltan datos requeridos")
             raise HTTPException(status_code=400, detail="Faltan datos requeridos")
         
-        # Enviar email usando el servicio mejorado
-        background_tasks.add_task(
-            improved_email_service.send_contact_form_email,
-            nombre,
-            email,
-            telefono,
-            mensaje
-        )
+        # Primero lo esencial: guardar el contacto en Nocodb
+        contact_data = {
+            "fecha": datetime.now().strftime("%Y-%m-%d"),
+            "nombre": nombre,
+            "email": email,
+            "telefono": telefono,
+            "mensaje": mensaje
+        }
+        try:
+            background_jobs.submit(save_data_to_nocodb, "contact", contact_data, essential=True)
+        except BackgroundQueueFullError:
+            # Cola al máximo: el alta se registra en el outbox dentro de la request (milisegundos)
+            await save_data_to_nocodb("contact", contact_data)
         
-        # Guardar en Nocodb usando wrapper
-        background_tasks.add_task(
-            save_data_to_nocodb,
-            "contact",
-            {
-                "fecha": datetime.now().strftime("%Y-%m-%d"),
-                "nombre": nombre,
-                "email": email,
-                "telefono": telefono,
-                "mensaje": mensaje
-            }
-        )
+        # Enviar email usando el servicio mejorado; con la cola saturada se responde 503 con
+        # Retry-After (el contacto ya quedó registrado: al reintentar se actualiza la misma fila)
+        try:
+            background_jobs.submit(
+                improved_email_service.send_contact_form_email,
+                nombre,
+                email,
+                telefono,
+                mensaje
+            )
+        except BackgroundQueueFullError as e:
+            logger.warning(f"⚠️ Email de contacto rechazado para {email}: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail="Consulta registrada; el email de confirmación no pudo encolarse, reintentar en unos segundos",
+                headers={"Retry-After": str(settings.BACKGROUND_RETRY_AFTER_SECONDS)}
+            )
         
         logger.info("✅ Formulario de contacto procesado exitosamente")
         
@@ -287,7 +378,7 @@ async def enviar_contacto(
             "status": "enviado"
         }
         
-    except HTTPException:
+    except (HTTPException, BackgroundQueueFullError):
         raise
     except Exception as e:
         logger.error(f"Error enviando contacto: {e}")
@@ -306,7 +397,7 @@ async def descargar_cotizacion_pdf(request: Request):
         
         customer_name = body.get('customer_name', 'Cliente')
         customer_email = body.get('customer_email', '')
-        quote_data = body.get('quote_data', {})
+        quote_data = _add_transport(body.get('quote_data', {}))
         
         logger.info(f"👤 Cliente: {customer_name}, Email: {customer_email}")
         
@@ -339,7 +430,7 @@ async def crear_cliente(customer_data: dict):
         if success:
             return {
                 "success": True,
-                "message": "Cliente creado exitosamente en NocoDB",
+                "message": "Cliente registrado; se guardará en NocoDB",
                 "data": customer_data
             }
         else:
@@ -349,20 +440,70 @@ async def crear_cliente(customer_data: dict):
         logger.error(f"Error creando cliente: {e}")
         raise HTTPException(status_code=500, detail=f"Error creando cliente: {str(e)}")
 
+def ndjson_stream(rows, chunk_size: int = 500):
+    """Serializa filas como NDJSON en bloques (exportaciones grandes sin armar todo en memoria)"""
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, ensure_ascii=False, default=str))
+        if len(chunk) >= chunk_size:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+def replica_listing(table, key: str, limit: int, offset: int, formato: Optional[str], filters: Dict[str, Any]):
+    """Listado paginado desde la réplica local, o exportación completa en NDJSON"""
+    if formato == "ndjson":
+        return StreamingResponse(ndjson_stream(table.iter_rows(**filters)), media_type="application/x-ndjson")
+    total, rows = table.query(offset=offset, limit=limit, **filters)
+    return {
+        key: rows,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "sincronizado_en": datetime.fromtimestamp(table.synced_at).isoformat() if table.synced_at else None
+    }
+
 @app.get("/nocodb/clientes")
-async def obtener_clientes(limit: int = 100):
-    """Obtiene lista de clientes desde Nocodb"""
+async def obtener_clientes(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    estado: Optional[str] = None,
+    email: Optional[str] = None,
+    q: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    formato: Optional[str] = Query(None, pattern="^(json|ndjson)$")
+):
+    """Obtiene lista de clientes desde la réplica local de Nocodb (formato=ndjson para exportar)"""
     try:
-        clientes = await nocodb_service.get_customers(limit)
-        return {
-            "clientes": clientes,
-            "total": len(clientes) if clientes else 0
-        }
+        filters = {"estado": estado, "email": email, "q": q, "desde": desde, "hasta": hasta}
+        return replica_listing(nocodb_service.contactos, "clientes", limit, offset, formato, filters)
         
     except Exception as e:
         logger.error(f"Error obteniendo clientes: {e}")
         raise HTTPException(status_code=500, detail="Error obteniendo clientes")
 
+@app.get("/nocodb/cotizaciones")
+async def obtener_cotizaciones_nocodb(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    estado: Optional[str] = None,
+    email: Optional[str] = None,
+    q: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    formato: Optional[str] = Query(None, pattern="^(json|ndjson)$")
+):
+    """Obtiene lista de cotizaciones desde la réplica local de Nocodb (formato=ndjson para exportar)"""
+    try:
+        filters = {"estado": estado, "email": email, "q": q, "desde": desde, "hasta": hasta}
+        return replica_listing(nocodb_service.cotizaciones, "cotizaciones", limit, offset, formato, filters)
+        
+    except Exception as e:
+        logger.error(f"Error obteniendo cotizaciones: {e}")
+        raise HTTPException(status_code=500, detail="Error obteniendo cotizaciones")
+
 @app.patch("/nocodb/clientes/{customer_id}/estado")
 async def actualizar_estado_cliente(customer_id: int, estado: str):
     """Actualiza el estado de un cliente en Nocodb"""
@@ -378,6 +519,59 @@ async def actualizar_estado_cliente(customer_id: int, estado: str):
         logger.error(f"Error actualizando estado: {e}")
         raise HTTPException(status_code=500, detail="Error actualizando estado")
 
+@app.get("/nocodb/metricas")
+async def obtener_metricas_nocodb():
+    """Obtiene las métricas de escritura en lote hacia NocoDB"""
+    return {
+        "tablas": nocodb_service.get_write_stats(),
+        "lote_max_registros": settings.NOCODB_BATCH_MAX_ITEMS,
+        "lote_max_espera_ms": settings.NOCODB_BATCH_MAX_DELAY_MS
+    }
+
+@app.get("/api/tareas/estado")
+async def obtener_estado_tareas():
+    """Obtiene el estado del ejecutor de tareas en segundo plano y del almacén de trabajos"""
+    return {
+        "success": True,
+        "data": {
+            **background_jobs.stats(),
+            "jobs": job_store.stats()
+        }
+    }
+
+@app.get("/jobs/{job_id}")
+async def obtener_trabajo(job_id: str):
+    """Estado de un trabajo (pendiente, en_curso, completado o fallido)"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o vencido")
+    return {
+        "success": True,
+        "data": job.to_dict()
+    }
+
+@app.get("/jobs/{job_id}/eventos")
+async def eventos_trabajo(job_id: str):
+    """Progreso de un trabajo como Server-Sent Events; el evento 'fin' cierra el stream"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o vencido")
+    
+    async def stream():
+        async for snapshot in job_store.watch(job, settings.JOBS_SSE_KEEPALIVE_SECONDS):
+            if snapshot is None:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ": keepalive\n\n"
+                continue
+            event = "fin" if snapshot["state"] in (job_store.COMPLETED, job_store.FAILED) else "progreso"
+            yield f"id: {snapshot['version']}\nevent: {event}\ndata: {json.dumps(snapshot, default=str)}\n\n"
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/costos/desglose")
 async def obtener_desglose_costos(
     metros_cuadrados: float,
@@ -455,21 +649,47 @@ async def obtener_precio_material(material: str):
         logger.error(f"Error obteniendo precio de {material}: {e}")
         raise HTTPException(status_code=500, detail="Error obteniendo precio")
 
+@app.post("/materiales/precios/batch")
+async def obtener_precios_materiales_batch(request: PreciosBatchRequest):
+    """Obtiene los precios de varios materiales en una sola solicitud"""
+    if len(request.materiales) > settings.PRICE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se permiten hasta {settings.PRICE_BATCH_MAX_ITEMS} materiales por solicitud"
+        )
+    
+    try:
+        precios = await price_service.get_material_prices(request.materiales)
+        
+        return {
+            "precios": [
+                {"material": material, **resultado}
+                for material, resultado in precios.items()
+            ],
+            "total_materiales": len(precios),
+            "no_encontrados": [m for m, r in precios.items() if r["precio"] is None]
+        }
+        
+    except Exception as e:
+        logger.error(f"Error obteniendo precios en lote: {e}")
+        raise HTTPException(status_code=500, detail="Error obteniendo precios")
+
+@app.get("/materiales/fuentes/latencia")
+async def obtener_latencia_fuentes():
+    """Obtiene los histogramas de latencia de las fuentes de precios"""
+    return {
+        "fuentes": price_service.get_source_latency_stats(),
+        "plazo_ms": settings.PRICE_FETCH_DEADLINE_MS
+    }
+
 @app.get("/regiones/multiplicadores")
 async def obtener_multiplicadores_regionales():
     """Obtiene los multiplicadores de precio por región"""
     try:
-        # Obtener multiplicadores de todas las provincias
-        provincias = [
-            "buenos_aires", "caba", "cordoba", "santa_fe", "mendoza",
-            "tucuman", "salta", "jujuy", "chaco", "formosa", "misiones",
-            "corrientes", "entre_rios", "la_pampa", "rio_negro", "neuquen",
-            "chubut", "santa_cruz", "tierra_del_fuego"
-        ]
-        
-        multiplicadores = {}
-        for provincia in provincias:
-            multiplicadores[provincia] = price_service.get_price_multiplier_by_region(provincia)
+        multiplicadores = {
+            region.slug: price_service.get_price_multiplier_by_region(region.slug)
+            for region in region_registry.regions
+        }
         
         return {
             "multiplicadores": multiplicadores,
@@ -608,7 +828,8 @@ async def obtener_tipo_cambio():
                 "ars_usd": exchange_rate.ars_usd,
                 "usd_ars": exchange_rate.usd_ars,
                 "last_updated": exchange_rate.last_updated.isoformat(),
-                "source": exchange_rate.source
+                "source": exchange_rate.source,
+                "selection": argentina_api_service.last_exchange_selection
             },
             "message": "Tipo de cambio obtenido exitosamente"
         }
@@ -617,21 +838,27 @@ async def obtener_tipo_cambio():
         logger.error(f"Error obteniendo tipo de cambio: {e}")
         raise HTTPException(status_code=500, detail="Error obteniendo tipo de cambio")
 
+@app.get("/api/argentina/tipo-cambio/fuentes")
+async def obtener_latencia_fuentes_tipo_cambio():
+    """Obtiene las latencias por fuente de tipo de cambio y la última fuente elegida"""
+    return {
+        "success": True,
+        "data": {
+            "priority": argentina_api_service.fx_source_priority,
+            "deadline_ms": settings.FX_DEADLINE_MS,
+            "last_selection": argentina_api_service.last_exchange_selection,
+            "sources": argentina_api_service.get_exchange_source_stats()
+        }
+    }
+
 @app.get("/api/argentina/multiplicadores-regionales")
 async def obtener_multiplicadores_regionales():
     """Obtiene multiplicadores de precio por región de Argentina"""
     try:
-        multipliers = {}
-        provinces = [
-            "Buenos Aires", "Córdoba", "Santa Fe", "Mendoza", "Tucumán",
-            "Entre Ríos", "Chaco", "Corrientes", "Misiones", "Formosa",
-            "Chubut", "Río Negro", "Neuquén", "La Pampa", "San Luis",
-            "La Rioja", "Catamarca", "Santiago", "Salta", "Jujuy",
-            "San Juan", "Tierra del Fuego"
-        ]
-        
-        for province in provinces:
-            multipliers[province] = argentina_api_service.get_regional_multiplier(province)
+        multipliers = {
+            region.nombre: argentina_api_service.get_regional_multiplier(region.slug)
+            for region in region_registry.regions
+        }
         
         return {
             "success": True,
@@ -647,17 +874,12 @@ async def obtener_multiplicadores_regionales():
 async def obtener_precios_materiales():
     """Obtiene precios actualizados de materiales de construcción"""
     try:
-        # Lista de materiales disponibles
-        materiales = [
-            "acero_estructural", "perfiles_metalicos", "tornillos", "pintura",
-            "aislante", "techo_metalico", "piso_cemento", "ventanas",
-            "puertas", "instalacion_electrica", "instalacion_sanitaria",
-            "ceramica", "griferia", "iluminacion"
-        ]
+        _, materiales = material_catalog.search(moneda="USD", limit=settings.MATERIAL_CATALOG_MAX_PAGE_SIZE)
         
-        precios = {}
-        for material in materiales:
-            precios[material] = argentina_api_service.get_material_price(material)
+        precios = {
+            material.id: argentina_api_service.get_material_price(material.id)
+            for material in materiales
+        }
         
         return {
             "success": True,
@@ -721,7 +943,7 @@ async def forzar_actualizacion():
         logger.info("Forzando actualización inmediata de precios...")
         
         # Actualizar precios
-        prices = await get_current_prices()
+        prices = await get_current_prices(force_refresh=True)
         
         # Actualizar tipo de cambio
         exchange_rate = await get_current_exchange_rate()
@@ -751,6 +973,97 @@ async def forzar_actualizacion():
         logger.error(f"Error en actualización forzada: {e}")
         raise HTTPException(status_code=500, detail="Error en actualización forzada")
 
+@app.get("/api/indice-costo")
+async def obtener_indice_costo(desde: Optional[str] = None, hasta: Optional[str] = None):
+    """Obtiene el índice de costo de construcción y el factor de ajuste entre dos fechas"""
+    try:
+        data = {"serie": cost_index.summary()}
+        if desde:
+            data.update({
+                "desde": desde,
+                "hasta": hasta or datetime.now().date().isoformat(),
+                "factor": cost_index.factor(desde, hasta)
+            })
+        return {"success": True, "data": data}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida: {e}")
+    except Exception as e:
+        logger.error(f"Error calculando índice de costo: {e}")
+        raise HTTPException(status_code=500, detail="Error calculando índice de costo")
+
+# ============================================================================
+# ENDPOINTS DE HISTORIAL DE PRECIOS
+# ============================================================================
+
+@app.get("/api/historial/series")
+async def listar_series_historial():
+    """Lista las series de precios y tipo de cambio con historial"""
+    return {
+        "success": True,
+        "data": price_history.list_series()
+    }
+
+@app.get("/api/historial/{serie}")
+async def obtener_historial(serie: str, desde: Optional[datetime] = None, hasta: Optional[datetime] = None):
+    """Obtiene los puntos de una serie en el rango indicado"""
+    try:
+        puntos = price_history.query(serie, desde, hasta)
+        return {
+            "success": True,
+            "serie": serie,
+            "data": [
+                {"fecha": datetime.fromtimestamp(ts).isoformat(), "valor": valor}
+                for ts, valor in puntos
+            ]
+        }
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail=f"Serie '{serie}' no encontrada")
+    except Exception as e:
+        logger.error(f"Error obteniendo historial de {serie}: {e}")
+        raise HTTPException(status_code=500, detail="Error obteniendo historial")
+
+@app.get("/api/historial/{serie}/tendencia")
+async def obtener_tendencia(serie: str, desde: Optional[datetime] = None, hasta: Optional[datetime] = None):
+    """Obtiene la tendencia (inicial, final, extremos, promedio y variación) de una serie"""
+    try:
+        return {
+            "success": True,
+            "data": price_history.trend(serie, desde, hasta)
+        }
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail=f"Serie '{serie}' no encontrada")
+    except Exception as e:
+        logger.error(f"Error calculando tendencia de {serie}: {e}")
+        raise HTTPException(status_code=500, detail="Error calculando tendencia")
+
+@app.get("/api/historial/{serie}/media-movil")
+async def obtener_media_movil(
+    serie: str,
+    ventana_horas: float = 24 * 7,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+):
+    """Obtiene la media móvil de una serie sobre una ventana de tiempo"""
+    if ventana_horas <= 0:
+        raise HTTPException(status_code=400, detail="La ventana debe ser mayor a 0")
+    
+    try:
+        puntos = price_history.moving_average(serie, int(ventana_horas * 3600), desde, hasta)
+        return {
+            "success": True,
+            "serie": serie,
+            "ventana_horas": ventana_horas,
+            "data": [
+                {"fecha": datetime.fromtimestamp(ts).isoformat(), "media_movil": valor}
+                for ts, valor in puntos
+            ]
+        }
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail=f"Serie '{serie}' no encontrada")
+    except Exception as e:
+        logger.error(f"Error calculando media móvil de {serie}: {e}")
+        raise HTTPException(status_code=500, detail="Error calculando media móvil")
+
 # ============================================================================
 # ENDPOINTS ADICIONALES PARA COMPATIBILIDAD CON FRONTEND
 # ============================================================================
@@ -770,179 +1083,95 @@ async def api_tipos_uso():
     """Endpoint API para tipos de uso"""
     return await obtener_tipos_uso()
 
+def catalog_etag() -> str:
+    """ETag del catálogo: cambia con cada edición del catálogo y con cada precio publicado
+    (con varios workers se usan los contadores compartidos, iguales en todos los procesos)"""
+    data_version = shared_tables.snapshot_seq() if shared_tables.attached else price_events.version
+    return f'W/"catalogo-{material_catalog.version}-{data_version}"'
+
 @app.get("/api/materiales/precios")
-async def api_precios_materiales():
-    """Endpoint API para precios de materiales"""
+async def api_precios_materiales(
+    request: Request,
+    response: Response,
+    categoria: Optional[str] = None,
+    unidad: Optional[str] = None,
+    q: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1)
+):
+    """Endpoint API para precios de materiales (catálogo paginado y filtrable)"""
+    etag = catalog_etag()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
     try:
-        logger.info("📦 Obteniendo precios de materiales desde API de cámara de construcción...")
+        limit = min(limit, settings.MATERIAL_CATALOG_MAX_PAGE_SIZE)
+        total, materiales = material_catalog.search(
+            categoria=categoria, unidad=unidad, texto=q, offset=offset, limit=limit
+        )
+        
+        # Metadatos de paginación en headers: el cuerpo sigue siendo la lista que espera el frontend
+        response.headers["X-Total-Count"] = str(total)
+        response.headers["X-Offset"] = str(offset)
+        response.headers["X-Limit"] = str(limit)
+        response.headers["ETag"] = etag
+        
+        return [format_catalog_material(mat) for mat in materiales]
         
-        # Intentar obtener materiales de la API de la cámara de construcción
-        try:
-            materiales_data = await get_materials_from_camara_api()
-            
-            if materiales_data and len(materiales_data) > 0:
-                logger.info(f"✅ {len(materiales_data)} materiales obtenidos de la API de cámara")
-                return materiales_data
-            else:
-                logger.warning("⚠️ API de cámara no retornó materiales, usando materiales base")
-                return get_materials_from_base_service()
-                
-        except Exception as e:
-            logger.warning(f"⚠️ Error obteniendo materiales de API de cámara: {e}")
-            # Retornar materiales del servicio base
-            return get_materials_from_base_service()
-            
     except Exception as e:
         logger.error(f"❌ Error en endpoint de materiales: {e}")
-        return get_default_materials()
+        raise HTTPException(status_code=500, detail="Error obteniendo materiales")
 
-async def get_materials_from_camara_api():
-    """Obtiene materiales de la API de la cámara de construcción"""
-    try:
-        import aiohttp
-        
-        # URL de la API de la cámara de construcción
-        api_url = "https://api.camaraconstruccion.com.ar/materiales"
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api_url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # Procesar datos de la API
-                    materiales = []
-                    for item in data.get('materiales', []):
-                        materiales.append({
-                            "id": f"cam_{item.get('id', '')}",
-                            "nombre": item.get('nombre', 'Material'),
-                            "categoria": item.get('categoria', 'general'),
-                            "descripcion": item.get('descripcion', 'Material de construcción'),
-                            "precio": float(item.get('precio', 0)),
-                            "unidad": item.get('unidad', 'unidad'),
-                            "marca": item.get('marca', 'N/A'),
-                            "modelo": item.get('modelo', 'N/A'),
-                            "dimensiones": item.get('dimensiones', 'N/A'),
-                            "peso": item.get('peso', 'N/A')
-                        })
-                    
-                    return materiales
-                else:
-                    logger.warning(f"⚠️ API de cámara retornó status {response.status}")
-                    return None
-                    
-    except Exception as e:
-        logger.error(f"❌ Error llamando API de cámara: {e}")
-        return None
+@app.get("/api/materiales/{material_id}")
+async def api_obtener_material(material_id: str, request: Request, response: Response):
+    """Endpoint API para obtener un material del catálogo"""
+    etag = catalog_etag()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    material = material_catalog.get(material_id)
+    if material is None:
+        raise HTTPException(status_code=404, detail=f"Material '{material_id}' no encontrado")
+    response.headers["ETag"] = etag
+    return format_catalog_material(material)
 
-def get_materials_from_base_service():
-    """Obtiene materiales del servicio base"""
-    try:
-        materiales = price_service.get_all_base_prices()
-        materiales_data = [
-            {
-                "id": f"mat_{i}",
-                "nombre": mat.nombre,
-                "categoria": mat.categoria,
-                "descripcion": f"Material {mat.nombre} para construcción",
-                "precio": mat.precio_por_m2,
-                "unidad": mat.unidad,
-                "marca": "Sumpetrol",
-                "modelo": f"MOD-{i}",
-                "dimensiones": "Estándar",
-                "peso": "Variable"
-            }
-            for i, mat in enumerate(materiales.values())
-        ]
-        
-        logger.info(f"✅ {len(materiales_data)} materiales obtenidos del servicio base")
-        return materiales_data
-        
-    except Exception as e:
-        logger.error(f"❌ Error obteniendo materiales del servicio base: {e}")
-        return get_default_materials()
-
-def get_default_materials():
-    """Retorna materiales por defecto si falla la API"""
-    return [
-        {
-            "id": "mat_1",
-            "nombre": "Perfil C 100x50x2mm",
-            "categoria": "estructura",
-            "descripcion": "Perfil de acero galvanizado para estructura steel frame",
-            "precio": 25.50,
-            "unidad": "metro lineal",
-            "marca": "Sumpetrol",
-            "modelo": "C-100-50-2",
-            "dimensiones": "100x50x2mm",
-            "peso": "2.5 kg/m"
-        },
-        {
-            "id": "mat_2",
-            "nombre": "Panel OSB 15mm",
-            "categoria": "estructura",
-            "descripcion": "Panel estructural OSB para revestimiento",
-            "precio": 18.75,
-            "unidad": "m²",
-            "marca": "Standard",
-            "modelo": "OSB-15",
-            "dimensiones": "1220x2440x15mm",
-            "peso": "12 kg/m²"
-        },
-        {
-            "id": "mat_3",
-            "nombre": "Aislante Lana de Vidrio 100mm",
-            "categoria": "aislamiento",
-            "descripcion": "Aislante térmico y acústico de lana de vidrio",
-            "precio": 8.90,
-            "unidad": "m²",
-            "marca": "Knauf",
-            "modelo": "LV-100",
-            "dimensiones": "1200x600x100mm",
-            "peso": "1.2 kg/m²"
-        },
-        {
-            "id": "mat_4",
-            "nombre": "Membrana Hidrófuga",
-            "categoria": "cubierta",
-            "descripcion": "Membrana impermeabilizante para techos",
-            "precio": 12.30,
-            "unidad": "m²",
-            "marca": "Sika",
-            "modelo": "MB-200",
-            "dimensiones": "1x10m",
-            "peso": "0.8 kg/m²"
-        },
-        {
-            "id": "mat_5",
-            "nombre": "Placa de Yeso 12.5mm",
-            "categoria": "interior",
-            "descripcion": "Placa de yeso para revestimiento interior",
-            "precio": 6.45,
-            "unidad": "m²",
-            "marca": "Knauf",
-            "modelo": "PY-12.5",
-            "dimensiones": "1200x2400x12.5mm",
-            "peso": "8.5 kg/m²"
-        },
-        {
-            "id": "mat_6",
-            "nombre": "Pintura Acrílica Interior",
-            "categoria": "terminacion",
-            "descripcion": "Pintura acrílica de alta calidad para interiores",
-            "precio": 15.80,
-            "unidad": "litro",
-            "marca": "Sherwin Williams",
-            "modelo": "AI-200",
-            "dimensiones": "1 litro",
-            "peso": "1.2 kg"
-        }
-    ]
+def format_catalog_material(material) -> Dict[str, Any]:
+    """Formatea un material del catálogo para el frontend
+
+    El precio va en USD si está disponible y si no en ARS: "moneda" indica cuál de las dos es
+    (el frontend muestra el símbolo según ese campo).
+    """
+    en_usd = material.precio_usd is not None
+    return {
+        "id": material.id,
+        "nombre": material.nombre,
+        "categoria": material.categoria,
+        "descripcion": material.descripcion or f"Material {material.nombre} para construcción",
+        "precio": material.precio_usd if en_usd else material.precio_ars,
+        "moneda": "USD" if en_usd else "ARS",
+        "unidad": material.unidad,
+        "marca": material.marca or "N/A",
+        "modelo": material.modelo or "N/A",
+        "dimensiones": material.dimensiones or "N/A",
+        "peso": material.peso or "N/A"
+    }
 
 @app.get("/api/regiones/multiplicadores")
 async def api_multiplicadores_regionales():
     """Endpoint API para multiplicadores regionales"""
     return await obtener_multiplicadores_regionales()
 
+@app.get("/api/localidades/autocompletar")
+async def autocompletar_localidades(
+    q: str = Query(..., min_length=1, max_length=80),
+    provincia: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Autocompletado de localidades desde el nomenclátor offline"""
+    localidades = gazetteer.autocomplete(q, provincia=provincia, limit=limit)
+    return {
+        "success": True,
+        "data": [localidad.to_dict() for localidad in localidades]
+    }
+
 @app.get("/api/costos/desglose")
 async def api_desglose_costos(
     metros_cuadrados: float,
@@ -961,9 +1190,9 @@ async def api_desglose_costos(
     )
 
 @app.post("/api/cotizaciones")
-async def api_crear_cotizacion(request: CotizacionRequest, background_tasks: BackgroundTasks):
+async def api_crear_cotizacion(request: CotizacionRequest):
     """Endpoint API para crear cotización"""
-    return await crear_cotizacion(request, background_tasks)
+    return await crear_cotizacion(request)
 
 @app.get("/api/cotizaciones/{cotizacion_id}")
 async def api_obtener_cotizacion(cotizacion_id: str):
@@ -989,6 +1218,13 @@ async def startup_event():
     try:
         logger.info("🚀 Iniciando Cotizador de Construcción API...")
         
+        # Modo multi-worker: usar las tablas de precios compartidas creadas por el lanzador
+        if shared_tables.attach():
+            material_catalog.attach_shared_prices(shared_tables)
+        
+        # Sesión persistente y escritura en lote hacia NocoDB
+        await nocodb_service.start()
+        
         # Iniciar servicio de actualización automática
         await start_price_updater()
         
@@ -1006,6 +1242,11 @@ async def shutdown_event():
         
         # Detener servicio de actualización automática
         price_updater_service.stop()
+        await background_jobs.shutdown(settings.BACKGROUND_SHUTDOWN_GRACE_SECONDS)
+        await argentina_api_service.close()
+        await price_service.close()
+        await nocodb_service.close()
+        shared_tables.close()
         
         logger.info("✅ Servicio de actualización automática detenido")
         logger.info("✅ API cerrada correctamente")
@@ -1014,7 +1255,7 @@ async def shutdown_event():
         logger.error(f"❌ Error en evento de cierre: {e}")
 
 # Incluir rutas de construcción simplificada
-from .construction_routes import router as construction_router
+from .construction_routes import router as construction_router, construction_calculator
 app.include_router(construction_router, prefix="/api/construction", tags=["construction"])
 
 if __name__ == "__main__":
@@ -0,0 +1,312 @@
+"""
+Catálogo unificado de materiales de construcción
+Única fuente de IDs, unidades, categorías y precios base de materiales.
+Se carga una vez en una estructura columnar con índices secundarios.
+"""
+
+import csv
+import logging
+import math
+import os
+import sys
+from array import array
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), "data", "materiales.csv")
+
+# Unidades canónicas (las variantes se normalizan al cargar)
+UNIT_ALIASES = {
+    "m²": "m2",
+    "metro cuadrado": "m2",
+    "metro lineal": "m",
+    "ml": "m",
+    "u": "unidad",
+    "un": "unidad",
+    "l": "litro",
+    "lt": "litro",
+}
+
+_DETAIL_FIELDS = ("descripcion", "marca", "modelo", "dimensiones", "peso")
+
+
+@dataclass
+class MaterialRecord:
+    """Material del catálogo"""
+    id: str
+    nombre: str
+    categoria: str
+    unidad: str
+    precio_ars: Optional[float] = None
+    precio_usd: Optional[float] = None
+    descripcion: str = ""
+    marca: str = ""
+    modelo: str = ""
+    dimensiones: str = ""
+    peso: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def normalize_unit(unit: str) -> str:
+    unit = (unit or "unidad").strip().lower()
+    return UNIT_ALIASES.get(unit, unit)
+
+
+def _parse_price(value: Optional[str]) -> float:
+    """Precio como float; NaN representa un precio ausente"""
+    if value is None or str(value).strip() == "":
+        return math.nan
+    return float(value)
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+class MaterialCatalog:
+    """Catálogo columnar: búsqueda O(1) por ID e índices por categoría y unidad"""
+
+    def __init__(self):
+        self._index: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._names: List[str] = []
+        # Categorías y unidades codificadas como enteros contra un diccionario
+        self._category_codes = array("H")
+        self._unit_codes = array("H")
+        self._categories: List[str] = []
+        self._units: List[str] = []
+        self._category_lookup: Dict[str, int] = {}
+        self._unit_lookup: Dict[str, int] = {}
+        self._prices_ars = array("d")
+        self._prices_usd = array("d")
+        self._details: Dict[str, List[str]] = {field: [] for field in _DETAIL_FIELDS}
+        # Índices secundarios: código -> filas (sets: reclasificar una fila es O(1))
+        self._by_category: Dict[int, Set[int]] = {}
+        self._by_unit: Dict[int, Set[int]] = {}
+        # Se incrementa con cada cambio (sirve para ETags y caches dependientes)
+        self._version = 0
+        # Columnas de precios en memoria compartida (modo multi-worker) para las primeras filas;
+        # conectado el catálogo, las columnas locales guardan solo las filas agregadas después
+        self._shared = None
+        self._shared_rows = 0
+        self._shared_ars: Optional[memoryview] = None
+        self._shared_usd: Optional[memoryview] = None
+
+    @property
+    def version(self) -> int:
+        if self._shared is not None:
+            return self._version + self._shared.catalog_version()
+        return self._version
+
+    def ids(self) -> List[str]:
+        """IDs en orden de fila"""
+        return list(self._ids)
+
+    def attach_shared_prices(self, tables) -> bool:
+        """
+        Lee y escribe los precios de las filas existentes en las tablas compartidas entre workers
+        Solo los precios se comparten: nombres, detalles e índices siguen siendo de cada worker
+        """
+        from .shared_tables import catalog_fingerprint
+        if self._shared is not None:
+            return True
+        if tables.catalog_fingerprint() != catalog_fingerprint(self._ids):
+            logger.warning("El catálogo del worker no coincide con el compartido: se usan precios locales")
+            return False
+        self._shared_ars, self._shared_usd = tables.catalog_columns()
+        self._shared_rows = len(self._shared_ars)
+        self._shared = tables
+        # Las filas compartidas ya no se duplican en las columnas locales
+        self._prices_ars = array("d", self._prices_ars[self._shared_rows:])
+        self._prices_usd = array("d", self._prices_usd[self._shared_rows:])
+        return True
+
+    def _price_ars(self, row: int) -> float:
+        if row < self._shared_rows:
+            return self._shared_ars[row]
+        return self._prices_ars[row - self._shared_rows]
+
+    def _price_usd(self, row: int) -> float:
+        if row < self._shared_rows:
+            return self._shared_usd[row]
+        return self._prices_usd[row - self._shared_rows]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, material_id: str) -> bool:
+        return material_id in self._index
+
+    @staticmethod
+    def _encode(value: str, values: List[str], lookup: Dict[str, int]) -> int:
+        code = lookup.get(value)
+        if code is None:
+            code = len(values)
+            values.append(value)
+            lookup[value] = code
+        return code
+
+    def load_csv(self, path: str) -> int:
+        """Carga (o actualiza) materiales desde un CSV; retorna la cantidad de filas leídas"""
+        with open(path, newline="", encoding="utf-8") as f:
+            count = self.upsert_many(csv.DictReader(f))
+        logger.info(f"📦 Catálogo de materiales: {count} filas cargadas desde {path}")
+        return count
+
+    def upsert_many(self, rows: Iterable[Dict[str, Any]]) -> int:
+        count = 0
+        for row in rows:
+            self.upsert(
+                row["id"],
+                nombre=row.get("nombre") or row["id"],
+                categoria=row.get("categoria") or "general",
+                unidad=row.get("unidad") or "unidad",
+                precio_ars=_parse_price(row.get("precio_ars")),
+                precio_usd=_parse_price(row.get("precio_usd")),
+                **{field: row.get(field) or "" for field in _DETAIL_FIELDS}
+            )
+            count += 1
+        return count
+
+    def upsert(self, material_id: str, nombre: str, categoria: str, unidad: str,
+               precio_ars: float = math.nan, precio_usd: float = math.nan, **details: str):
+        """Agrega o reemplaza un material manteniendo los índices"""
+        categoria = sys.intern(categoria.strip().lower())
+        unidad = normalize_unit(unidad)
+        category_code = self._encode(categoria, self._categories, self._category_lookup)
+        unit_code = self._encode(unidad, self._units, self._unit_lookup)
+        precio_ars = math.nan if precio_ars is None else float(precio_ars)
+        precio_usd = math.nan if precio_usd is None else float(precio_usd)
+
+        row = self._index.get(material_id)
+        if row is None:
+            row = len(self._ids)
+            self._index[material_id] = row
+            self._ids.append(material_id)
+            self._names.append(nombre)
+            self._category_codes.append(category_code)
+            self._unit_codes.append(unit_code)
+            self._prices_ars.append(precio_ars)
+            self._prices_usd.append(precio_usd)
+            for field in _DETAIL_FIELDS:
+                self._details[field].append(sys.intern(details.get(field, "")))
+        else:
+            self._remove_from_index(self._by_category, self._category_codes[row], row)
+            self._remove_from_index(self._by_unit, self._unit_codes[row], row)
+            self._names[row] = nombre
+            self._category_codes[row] = category_code
+            self._unit_codes[row] = unit_code
+            if row >= self._shared_rows:
+                self._prices_ars[row - self._shared_rows] = precio_ars
+                self._prices_usd[row - self._shared_rows] = precio_usd
+            for field in _DETAIL_FIELDS:
+                if field in details:
+                    self._details[field][row] = sys.intern(details[field])
+
+        self._by_category.setdefault(category_code, set()).add(row)
+        self._by_unit.setdefault(unit_code, set()).add(row)
+
+        if row < self._shared_rows:
+            # Fila compartida: el cambio (y su versión) lo ven todos los workers
+            self._shared_ars[row] = precio_ars
+            self._shared_usd[row] = precio_usd
+            self._shared.bump_catalog_version()
+        else:
+            self._version += 1
+
+    @staticmethod
+    def _remove_from_index(index: Dict[int, Set[int]], code: int, row: int):
+        rows = index.get(code)
+        if rows is not None:
+            rows.discard(row)
+
+    def _record(self, row: int) -> MaterialRecord:
+        return MaterialRecord(
+            id=self._ids[row],
+            nombre=self._names[row],
+            categoria=self._categories[self._category_codes[row]],
+            unidad=self._units[self._unit_codes[row]],
+            precio_ars=_optional(self._price_ars(row)),
+            precio_usd=_optional(self._price_usd(row)),
+            **{field: self._details[field][row] for field in _DETAIL_FIELDS}
+        )
+
+    def get(self, material_id: str) -> Optional[MaterialRecord]:
+        row = self._index.get(material_id)
+        return self._record(row) if row is not None else None
+
+    def get_price_usd(self, material_id: str) -> Optional[float]:
+        row = self._index.get(material_id)
+        return _optional(self._price_usd(row)) if row is not None else None
+
+    def get_price_ars(self, material_id: str) -> Optional[float]:
+        row = self._index.get(material_id)
+        return _optional(self._price_ars(row)) if row is not None else None
+
+    def categories(self) -> Dict[str, int]:
+        return {self._categories[code]: len(rows) for code, rows in self._by_category.items() if rows}
+
+    def units(self) -> Dict[str, int]:
+        return {self._units[code]: len(rows) for code, rows in self._by_unit.items() if rows}
+
+    def search(self, categoria: Optional[str] = None, unidad: Optional[str] = None,
+               texto: Optional[str] = None, moneda: Optional[str] = None,
+               offset: int = 0, limit: int = 100) -> Tuple[int, List[MaterialRecord]]:
+        """Filtra y pagina el catálogo; retorna (total de coincidencias, página)"""
+        candidates: Optional[Iterable[int]] = None
+        if categoria is not None:
+            code = self._category_lookup.get(categoria.strip().lower())
+            candidates = self._by_category.get(code, ()) if code is not None else ()
+        if unidad is not None:
+            code = self._unit_lookup.get(normalize_unit(unidad))
+            rows = self._by_unit.get(code, ()) if code is not None else ()
+            # Intersección recorriendo el índice más chico
+            if candidates is None:
+                candidates = rows
+            else:
+                smaller, larger = sorted((candidates, rows), key=len)
+                larger = larger if isinstance(larger, set) else set(larger)
+                candidates = [row for row in smaller if row in larger]
+        if candidates is None:
+            candidates = range(len(self._ids))
+        else:
+            candidates = sorted(candidates)
+
+        if texto:
+            texto = texto.strip().lower()
+            candidates = [row for row in candidates
+                          if texto in self._names[row].lower() or texto in self._ids[row]]
+        if moneda == "ARS":
+            candidates = [row for row in candidates if not math.isnan(self._price_ars(row))]
+        elif moneda == "USD":
+            candidates = [row for row in candidates if not math.isnan(self._price_usd(row))]
+
+        if not isinstance(candidates, (list, range)):
+            candidates = list(candidates)
+        page = candidates[offset:offset + limit]
+        return len(candidates), [self._record(row) for row in page]
+
+    def all(self) -> List[MaterialRecord]:
+        return [self._record(row) for row in range(len(self._ids))]
+
+
+def load_material_catalog() -> MaterialCatalog:
+    """Carga el catálogo incluido y, si está configurado, el catálogo de proveedores"""
+    catalog = MaterialCatalog()
+    catalog.load_csv(DEFAULT_CATALOG_PATH)
+    if settings.MATERIAL_CATALOG_PATH:
+        try:
+            catalog.load_csv(settings.MATERIAL_CATALOG_PATH)
+        except Exception as e:
+            logger.error(f"Error cargando catálogo de proveedores {settings.MATERIAL_CATALOG_PATH}: {e}")
+    return catalog
+
+
+# Instancia global del catálogo
+material_catalog = load_material_catalog()
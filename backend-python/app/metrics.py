@@ -0,0 +1,114 @@
+"""
+Métricas en proceso para el Cotizador de Construcción
+Histogramas de latencia livianos, sin dependencias externas
+"""
+
+import time
+from bisect import bisect_left
+from typing import Dict, Any, Optional, Sequence
+
+
+class LatencyHistogram:
+    """Histograma de latencias con buckets fijos (en segundos)"""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # Un bucket extra para las muestras mayores al último límite
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        """Registra una muestra de latencia"""
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Estima el percentil q (0-1) interpolando dentro del bucket"""
+        if self.count == 0:
+            return None
+
+        target = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= target:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = min(self.buckets[i], self.max)
+                fraction = (target - cumulative) / bucket_count
+                return lower + (max(upper, lower) - lower) * fraction
+            cumulative += bucket_count
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Resumen serializable del histograma"""
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum / self.count * 1000, 2) if self.count else None,
+            "p50_ms": _to_ms(self.percentile(0.50)),
+            "p95_ms": _to_ms(self.percentile(0.95)),
+            "p99_ms": _to_ms(self.percentile(0.99)),
+            "max_ms": round(self.max * 1000, 2),
+            "buckets": {
+                **{f"le_{bound}": n for bound, n in zip(self.buckets, self.counts)},
+                "inf": self.counts[-1]
+            }
+        }
+
+
+class WindowedLatencyHistogram:
+    """Latencias de los últimos `window` a `2 * window` segundos (dos ventanas que rotan)
+
+    A diferencia de LatencyHistogram, las muestras viejas dejan de pesar: los percentiles
+    siguen a la fuente cuando se recupera de un período lento.
+    """
+
+    def __init__(self, window: float, buckets: Sequence[float] = LatencyHistogram.DEFAULT_BUCKETS):
+        self.window = window
+        self.buckets = tuple(sorted(buckets))
+        self._current = LatencyHistogram(self.buckets)
+        self._previous = LatencyHistogram(self.buckets)
+        self._rotated_at = time.monotonic()
+
+    def _rotate(self):
+        elapsed = time.monotonic() - self._rotated_at
+        if elapsed < self.window:
+            return
+        # Pasadas dos ventanas sin rotar, la anterior también quedó vieja
+        self._previous = self._current if elapsed < 2 * self.window else LatencyHistogram(self.buckets)
+        self._current = LatencyHistogram(self.buckets)
+        self._rotated_at = time.monotonic()
+
+    def record(self, seconds: float):
+        self._rotate()
+        self._current.record(seconds)
+
+    def _merged(self) -> LatencyHistogram:
+        self._rotate()
+        merged = LatencyHistogram(self.buckets)
+        for part in (self._previous, self._current):
+            merged.counts = [a + b for a, b in zip(merged.counts, part.counts)]
+            merged.count += part.count
+            merged.sum += part.sum
+            merged.max = max(merged.max, part.max)
+        return merged
+
+    @property
+    def count(self) -> int:
+        return self._merged().count
+
+    def percentile(self, q: float) -> Optional[float]:
+        return self._merged().percentile(q)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"window_seconds": self.window, **self._merged().snapshot()}
+
+
+def _to_ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
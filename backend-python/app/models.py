@@ -75,6 +75,9 @@ class PrecioMaterial(BaseModel):
     fecha_actualizacion: str
     fuente: str
 
+class PreciosBatchRequest(BaseModel):
+    materiales: List[str] = Field(..., min_length=1)
+
 class CalculoCostos(BaseModel):
     materiales: float
     mano_obra: float
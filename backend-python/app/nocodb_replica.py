@@ -0,0 +1,234 @@
+"""
+Réplica local de las tablas de contactos y cotizaciones de NocoDB
+Sincronización incremental con cursor (UpdatedAt, Id): cada pasada trae solo las filas
+modificadas desde la anterior. Los listados, filtros y paginado se sirven desde memoria.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import settings
+from .file_utils import atomic_write_json
+from .leader import FileLeaderLock
+
+logger = logging.getLogger(__name__)
+
+# Llamada HTTP a NocoDB: (método, url, **kwargs) -> (status, cuerpo)
+Fetch = Callable[..., Awaitable[Tuple[int, str]]]
+
+
+class TableReplica:
+    """Copia en memoria de una tabla, persistida en JSON junto con su cursor de sincronización"""
+
+    def __init__(self, name: str, api_url: str, fields: Dict[str, str], directory: str):
+        self.name = name
+        self.api_url = api_url
+        # Campos lógicos (estado, email, fecha, ...) -> columna de la tabla en NocoDB
+        self.fields = fields
+        self.path = os.path.join(directory, f"{name}.json")
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self.cursor: Optional[Tuple[str, int]] = None
+        self.synced_at: Optional[float] = None
+        self.version = 0
+        self._mtime: Optional[float] = None
+        self._sorted: Optional[List[Dict[str, Any]]] = None
+
+    def load(self):
+        """Carga la réplica persistida si el archivo cambió desde la última lectura"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Réplica de {self.name} inválida, se resincroniza completa: {e}")
+            return
+        self.rows = {row["Id"]: row for row in data.get("rows", [])}
+        cursor = data.get("cursor")
+        self.cursor = (cursor[0], int(cursor[1])) if cursor else None
+        self.synced_at = data.get("synced_at")
+        self._mtime = mtime
+        self._changed()
+        logger.info(f"📇 Réplica de {self.name} cargada: {len(self.rows)} filas")
+
+    def save(self):
+        atomic_write_json(self.path, {
+            "cursor": list(self.cursor) if self.cursor else None,
+            "synced_at": self.synced_at,
+            "rows": list(self.rows.values())
+        })
+        self._mtime = os.path.getmtime(self.path)
+
+    def _changed(self):
+        self.version += 1
+        self._sorted = None
+
+    def upsert(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self.rows[row["Id"]] = row
+            key = (str(row.get("UpdatedAt") or ""), int(row["Id"]))
+            if self.cursor is None or key > self.cursor:
+                self.cursor = key
+        if rows:
+            self._changed()
+
+    def replace(self, rows: List[Dict[str, Any]]):
+        """Reemplaza todo el contenido (sincronización completa: elimina filas borradas en NocoDB)"""
+        self.rows = {}
+        self.cursor = None
+        self.upsert(rows)
+        self._changed()
+
+    def patch(self, row_id: int, values: Dict[str, Any]):
+        """Aplica localmente una modificación ya confirmada por NocoDB"""
+        row = self.rows.get(row_id)
+        if row is not None:
+            row.update(values)
+            self._changed()
+
+    def _by_date(self) -> List[Dict[str, Any]]:
+        """Filas ordenadas por fecha descendente (se recalcula solo si la réplica cambió)"""
+        if self._sorted is None:
+            date_field = self.fields.get("fecha", "UpdatedAt")
+            self._sorted = sorted(
+                self.rows.values(),
+                key=lambda row: (str(row.get(date_field) or ""), row["Id"]),
+                reverse=True
+            )
+        return self._sorted
+
+    def iter_rows(self, estado: Optional[str] = None, email: Optional[str] = None,
+                  q: Optional[str] = None, desde: Optional[str] = None,
+                  hasta: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Filas que cumplen los filtros, de la más reciente a la más antigua"""
+        estado_field = self.fields.get("estado")
+        email_field = self.fields.get("email")
+        date_field = self.fields.get("fecha", "UpdatedAt")
+        estado = estado.lower() if estado else None
+        email = email.lower() if email else None
+        q = q.lower() if q else None
+
+        for row in self._by_date():
+            if estado and str(row.get(estado_field) or "").lower() != estado:
+                continue
+            if email and str(row.get(email_field) or "").lower() != email:
+                continue
+            fecha = str(row.get(date_field) or "")
+            if desde and fecha < desde:
+                continue
+            if hasta and fecha[:len(hasta)] > hasta:
+                continue
+            if q and not any(q in str(value).lower() for value in row.values() if isinstance(value, str)):
+                continue
+            yield row
+
+    def query(self, offset: int = 0, limit: int = 100, **filters) -> Tuple[int, List[Dict[str, Any]]]:
+        """(total filtrado, página pedida)"""
+        matches = list(self.iter_rows(**filters))
+        return len(matches), matches[offset:offset + limit]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "rows": len(self.rows),
+            "cursor": list(self.cursor) if self.cursor else None,
+            "synced_at": self.synced_at
+        }
+
+
+class NocodbReplica:
+    """Mantiene las réplicas al día; solo el worker líder consulta NocoDB, el resto relee los archivos"""
+
+    def __init__(self, tables: Dict[str, TableReplica], fetch: Fetch, directory: str):
+        self.tables = tables
+        self._fetch = fetch
+        self.directory = directory
+        self.lock = FileLeaderLock(os.path.join(directory, "sync.lock"))
+        self._task: Optional[asyncio.Task] = None
+        self._last_full_sync = 0.0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for table in self.tables.values():
+            table.load()
+        # Con réplicas persistidas alcanza la sincronización incremental; la completa queda para más tarde
+        if all(table.cursor is not None for table in self.tables.values()):
+            self._last_full_sync = time.time()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.lock.release()
+
+    async def _run(self):
+        while True:
+            try:
+                if self.lock.try_acquire():
+                    full = time.time() - self._last_full_sync > settings.NOCODB_REPLICA_FULL_SYNC_HOURS * 3600
+                    await self.sync(full=full)
+                else:
+                    for table in self.tables.values():
+                        table.load()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"⚠️ Error sincronizando réplica de NocoDB: {e}")
+            await asyncio.sleep(settings.NOCODB_REPLICA_SYNC_SECONDS)
+
+    async def sync(self, full: bool = False):
+        """Trae los cambios de cada tabla; con full=True reconstruye la réplica (detecta borrados)"""
+        for table in self.tables.values():
+            rows = await self._fetch_changes(table, None if full else table.cursor)
+            if full:
+                table.replace(rows)
+            else:
+                table.upsert(rows)
+            table.synced_at = time.time()
+            if rows or full or not os.path.exists(table.path):
+                table.save()
+            if rows:
+                logger.info(f"🔄 Réplica de {table.name}: {len(rows)} fila(s) {'cargadas' if full else 'actualizadas'}")
+        if full:
+            self._last_full_sync = time.time()
+
+    async def _fetch_changes(self, table: TableReplica, cursor: Optional[Tuple[str, int]]) -> List[Dict[str, Any]]:
+        """Pagina por clave (UpdatedAt, Id): estable aunque otras filas se modifiquen durante la sincronización"""
+        rows: List[Dict[str, Any]] = []
+        page_size = settings.NOCODB_REPLICA_PAGE_SIZE
+        while True:
+            params = {"sort": "UpdatedAt,Id", "limit": page_size}
+            if cursor is not None:
+                updated_at, row_id = cursor
+                params["where"] = f"(UpdatedAt,gt,{updated_at})~or((UpdatedAt,eq,{updated_at})~and(Id,gt,{row_id}))"
+            status, body = await self._fetch("GET", table.api_url, params=params)
+            if status != 200:
+                raise RuntimeError(f"{table.name}: NocoDB respondió {status} - {body[:200]}")
+            page = json.loads(body).get("list", [])
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+            last = page[-1]
+            cursor = (str(last.get("UpdatedAt") or ""), int(last["Id"]))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "leader": self.lock.is_leader,
+            "last_error": self.last_error,
+            "tables": {name: table.status() for name, table in self.tables.items()}
+        }
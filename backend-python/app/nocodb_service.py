@@ -1,16 +1,161 @@
 """
 Servicio de Nocodb para Cotizador de Construcción
 Guarda los datos de los clientes en la base de datos
+Usa una sesión HTTP persistente y agrupa las altas con el bulk insert de NocoDB
 """
 
 import aiohttp
 import asyncio
+import json
 import logging
-from typing import Dict, Any, Optional
+import random
+import time
+from bisect import bisect_left
+from typing import Dict, Any, Optional, List, Tuple, Set, Callable, Awaitable, Union
 from .config import settings
+from .metrics import LatencyHistogram
+from .leader import FileLeaderLock
+from .outbox import Outbox, OutboxEntry, outbox
+from .resilience import AIMDLimiter, CircuitBreaker
+from .nocodb_replica import NocodbReplica, TableReplica
+from .customer_index import PENDING_INSERT_FIELD, ContactRef, CustomerIndex
 
 logger = logging.getLogger(__name__)
 
+
+class NocodbUnavailableError(Exception):
+    """NocoDB marcado como no disponible por el circuit breaker (la llamada no se envió)"""
+
+
+class NocodbRejectedError(Exception):
+    """NocoDB rechazó el pedido por su contenido (4xx): reintentarlo no sirve"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"{status} - {body[:300]}")
+        self.status = status
+
+
+# 4xx que no dependen del registro (credenciales, tabla, timeout, límite): se reintentan
+RETRYABLE_CLIENT_STATUSES = frozenset({401, 403, 404, 408, 429})
+
+
+class BulkWriteBatcher:
+    """Buffer write-behind: acumula registros y los envía juntos cada N registros o T milisegundos"""
+
+    BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250)
+
+    def __init__(self, name: str, flush: Callable[[List[Dict[str, Any]]], Awaitable[Union[bool, list]]],
+                 max_items: int, max_delay_ms: int):
+        self.name = name
+        self._flush_fn = flush
+        self.max_items = max_items
+        self.max_delay = max_delay_ms / 1000
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Task] = set()
+
+        # Métricas
+        self.flush_latency = LatencyHistogram()
+        self.batch_sizes = [0] * (len(self.BATCH_SIZE_BUCKETS) + 1)
+        self.batches = 0
+        self.records = 0
+        self.failed_batches = 0
+        self.max_batch_size = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def add(self, record: Dict[str, Any]) -> Any:
+        """
+        Encola un registro; cuando el lote que lo contiene se guardó retorna un valor verdadero
+        (la respuesta de NocoDB para ese registro, p. ej. {"Id": 7}, o True) y si no, False
+        Lanza NocodbRejectedError si NocoDB rechaza el registro en sí
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((record, future))
+        if len(self._pending) >= self.max_items:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._flush(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        start = time.perf_counter()
+        try:
+            outcome = await self._flush_fn([record for record, _ in batch])
+        except NocodbRejectedError as e:
+            if len(batch) > 1:
+                # Lote rechazado: se reenvía registro por registro para apartar solo los inválidos
+                logger.warning(f"⚠️ Lote de {self.name} rechazado ({e}); se reenvía de a un registro")
+                outcome = None
+                await asyncio.gather(*(self._flush([item]) for item in batch))
+            else:
+                outcome = e
+        except Exception as e:
+            logger.error(f"❌ Error enviando lote de {self.name} a NocoDB: {e}")
+            outcome = False
+        if outcome is None:
+            return
+        success = outcome is not False and not isinstance(outcome, NocodbRejectedError)
+        # Con una respuesta por registro cada uno recibe la suya (p. ej. el Id asignado)
+        if isinstance(outcome, list) and len(outcome) == len(batch):
+            results = [result or True for result in outcome]
+        else:
+            results = [outcome if success else False] * len(batch)
+        self.flush_latency.record(time.perf_counter() - start)
+
+        size = len(batch)
+        self.batches += 1
+        self.records += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.batch_sizes[bisect_left(self.BATCH_SIZE_BUCKETS, size)] += 1
+        if not success:
+            self.failed_batches += 1
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(outcome, NocodbRejectedError):
+                future.set_exception(outcome)
+            else:
+                future.set_result(result)
+
+    async def drain(self):
+        """Envía lo pendiente y espera los lotes en curso (al cerrar la aplicación)"""
+        self._start_flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Resumen serializable de las métricas del batcher"""
+        return {
+            "pending": self.pending,
+            "batches": self.batches,
+            "records": self.records,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": round(self.records / self.batches, 2) if self.batches else None,
+            "max_batch_size": self.max_batch_size,
+            "batch_sizes": {
+                **{f"le_{bound}": n for bound, n in zip(self.BATCH_SIZE_BUCKETS, self.batch_sizes)},
+                "inf": self.batch_sizes[-1]
+            },
+            "flush_latency": self.flush_latency.snapshot()
+        }
+
+
 class NocodbService:
     def __init__(self):
         # Usar nuevas variables primero, fallback a legacy
@@ -25,6 +170,10 @@ class NocodbService:
         # URLs para cada tabla
         self.contactos_api_url = f"{self.base_url}/api/v1/db/data/v1/{self.base_id}/{self.contactos_table_id}"
         self.cotizaciones_api_url = f"{self.base_url}/api/v1/db/data/v1/{self.base_id}/{self.cotizaciones_table_id}"
+        self.contactos_bulk_url = f"{self.base_url}/api/v1/db/data/bulk/v1/{self.base_id}/{self.contactos_table_id}"
+        self.cotizaciones_bulk_url = f"{self.base_url}/api/v1/db/data/bulk/v1/{self.base_id}/{self.cotizaciones_table_id}"
+        # Tabla original del formulario de contacto (columnas Fecha/Nombre/Email/Mensaje)
+        self.api_url = f"{self.base_url}/api/v1/db/data/v1/{self.base_id}/{settings.NOCODB_TABLE_ID}"
         
         logger.info(f"🔗 NocoDB configurado:")
         logger.info(f"   URL: {self.base_url}")
@@ -39,22 +188,404 @@ class NocodbService:
             "xc-token": self.token,
             "Content-Type": "application/json"
         }
+        
+        # Sesión persistente, ligada al event loop de la aplicación (se crea en start)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Escritura en lote por tabla
+        self.contactos_writer = BulkWriteBatcher(
+            "contactos",
+            lambda records: self._bulk_write("POST", self.contactos_bulk_url, records),
+            settings.NOCODB_BATCH_MAX_ITEMS,
+            settings.NOCODB_BATCH_MAX_DELAY_MS
+        )
+        self.cotizaciones_writer = BulkWriteBatcher(
+            "cotizaciones",
+            lambda records: self._bulk_write("POST", self.cotizaciones_bulk_url, records),
+            settings.NOCODB_BATCH_MAX_ITEMS,
+            settings.NOCODB_BATCH_MAX_DELAY_MS
+        )
+        # Clientes que vuelven: actualización en lote de la fila existente (bulk update)
+        self.contactos_update_writer = BulkWriteBatcher(
+            "contactos_actualizacion",
+            lambda records: self._bulk_write("PATCH", self.contactos_bulk_url, records),
+            settings.NOCODB_BATCH_MAX_ITEMS,
+            settings.NOCODB_BATCH_MAX_DELAY_MS
+        )
+        self._writers = {
+            "contactos": self.contactos_writer,
+            "contactos_actualizacion": self.contactos_update_writer,
+            "cotizaciones": self.cotizaciones_writer
+        }
+        
+        # Outbox durable: las altas se registran en disco y el worker líder las reenvía
+        self.outbox: Outbox = outbox
+        self.outbox_lock = FileLeaderLock(outbox.lock_path)
+        self._outbox_task: Optional[asyncio.Task] = None
+        self._outbox_wakeup: Optional[asyncio.Event] = None
+        self._outbox_loaded = False
+        self._outbox_offset = 0
+        self._outbox_delivered: Set[str] = set()
+        self._outbox_backoff = 0.0
+        # Reintentos por entrada: intentos fallidos y momento del próximo intento
+        self._outbox_attempts: Dict[str, int] = {}
+        self._outbox_retry_at: Dict[str, float] = {}
+        self.dead_letters = 0
+        
+        # Control de carga: concurrencia adaptativa y corte rápido mientras NocoDB no responde
+        self.limiter = AIMDLimiter(
+            settings.NOCODB_CONCURRENCY_INITIAL,
+            settings.NOCODB_CONCURRENCY_MIN,
+            settings.NOCODB_CONCURRENCY_MAX,
+            settings.NOCODB_LATENCY_TARGET_MS / 1000
+        )
+        self.breaker = CircuitBreaker(
+            settings.NOCODB_BREAKER_FAILURE_THRESHOLD,
+            settings.NOCODB_BREAKER_RESET_SECONDS
+        )
+        
+        # Réplica local para listados: sincronización incremental en segundo plano
+        self.contactos = TableReplica(
+            "contactos", self.contactos_api_url,
+            {"estado": "estado_consulta", "email": "email_cliente", "fecha": "fecha_consulta"},
+            settings.NOCODB_REPLICA_DIR
+        )
+        self.cotizaciones = TableReplica(
+            "cotizaciones", self.cotizaciones_api_url,
+            {"estado": "estado", "email": "cliente_email", "fecha": "fecha_cotizacion"},
+            settings.NOCODB_REPLICA_DIR
+        )
+        self.replica = NocodbReplica(
+            {"contactos": self.contactos, "cotizaciones": self.cotizaciones},
+            self._send,
+            settings.NOCODB_REPLICA_DIR
+        )
+        # Deduplicación de contactos por email y teléfono, sobre la réplica y lo pendiente en el outbox
+        self.customer_index = CustomerIndex(self.contactos, "email_cliente", "telefono_cliente", self.outbox)
+    
+    def _new_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=settings.NOCODB_TIMEOUT_SECONDS),
+            connector=aiohttp.TCPConnector(limit=settings.NOCODB_POOL_SIZE)
+        )
+    
+    async def start(self):
+        """Crear la sesión persistente en el event loop de la aplicación"""
+        self._loop = asyncio.get_running_loop()
+        await self._get_session()
+        self._outbox_wakeup = asyncio.Event()
+        self._outbox_task = self._loop.create_task(self._run_outbox())
+        self.replica.start()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Sesión HTTP reutilizable, creada bajo demanda"""
+        if self.session is None or self.session.closed:
+            self.session = self._new_session()
+        return self.session
+    
+    async def close(self):
+        """Detener el worker del outbox, enviar los lotes pendientes y cerrar la sesión HTTP"""
+        if self._outbox_task is not None:
+            # Lo que no llegó a confirmarse queda en el outbox y se reenvía al reiniciar
+            self._outbox_task.cancel()
+            try:
+                await self._outbox_task
+            except asyncio.CancelledError:
+                pass
+            self._outbox_task = None
+        await self.replica.stop()
+        for writer in self._writers.values():
+            await writer.drain()
+        self.outbox_lock.release()
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+        self._loop = None
+    
+    def get_write_stats(self) -> Dict[str, Any]:
+        """Métricas de los lotes enviados por tabla y estado del outbox"""
+        return {
+            **{kind: writer.snapshot() for kind, writer in self._writers.items()},
+            "outbox": {
+                **self.outbox.status(),
+                "leader": self.outbox_lock.is_leader,
+                "backoff_seconds": self._outbox_backoff,
+                "retrying": len(self._outbox_retry_at),
+                "dead_lettered": self.dead_letters
+            },
+            "limiter": self.limiter.snapshot(),
+            "breaker": self.breaker.snapshot(),
+            "replica": self.replica.status(),
+            "customer_index": self.customer_index.status()
+        }
+    
+    async def _enqueue(self, kind: str, record: Dict[str, Any]) -> bool:
+        """Registrar el alta en el outbox (fsync agrupado fuera del event loop) y despertar al worker"""
+        try:
+            key = await self.outbox.append_async(kind, record)
+        except OSError as e:
+            logger.error(f"❌ Error registrando {kind} en el outbox: {e}")
+            return False
+        logger.info(f"📥 Alta de {kind} registrada en el outbox ({key})")
+        self._wake_outbox()
+        return True
+    
+    def _wake_outbox(self):
+        if self._loop is None or self._outbox_wakeup is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._outbox_wakeup.set()
+        else:
+            # Llamada desde otro hilo/loop: el evento solo se toca desde el loop de la aplicación
+            try:
+                self._loop.call_soon_threadsafe(self._outbox_wakeup.set)
+            except RuntimeError:
+                pass
+    
+    async def _run_outbox(self):
+        """Worker del outbox: reenvía las altas pendientes con backoff exponencial y jitter"""
+        while True:
+            self._outbox_wakeup.clear()
+            try:
+                delay = await self._process_outbox()
+            except Exception as e:
+                logger.error(f"❌ Error en el worker del outbox: {e}")
+                delay = settings.NOCODB_OUTBOX_POLL_SECONDS
+            if delay <= 0:
+                continue
+            if self._outbox_backoff:
+                await asyncio.sleep(delay)
+            else:
+                try:
+                    await asyncio.wait_for(self._outbox_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+    
+    async def _process_outbox(self) -> float:
+        """Una pasada del worker; retorna cuántos segundos esperar antes de la próxima"""
+        if not self.outbox_lock.try_acquire():
+            return settings.NOCODB_OUTBOX_POLL_SECONDS
+        if self.breaker.retry_after() > 0:
+            # Circuito abierto: las altas esperan en el outbox sin gastar reintentos
+            return self.breaker.retry_after()
+        if not self._outbox_loaded:
+            self._outbox_offset, self._outbox_delivered = self.outbox.load_cursor()
+            self._outbox_loaded = True
+        
+        replay = self.outbox.take_replay_request()
+        if replay is not None:
+            logger.info(f"🔁 Reprocesando el outbox desde el offset {replay}")
+            self._outbox_offset, self._outbox_delivered = replay, set()
+            self.outbox.save_cursor(self._outbox_offset, self._outbox_delivered)
+        
+        now = time.monotonic()
+        entries, ready, waiting_until = self._read_ready(now)
+        if not entries:
+            return settings.NOCODB_OUTBOX_POLL_SECONDS
+        if not ready:
+            # Todo lo pendiente espera su reintento
+            return min(settings.NOCODB_OUTBOX_POLL_SECONDS, max(waiting_until - now, 0.05))
+        
+        # Primero las altas: las actualizaciones de un contacto recién dado de alta necesitan su Id
+        updates = [entry for entry in ready if entry.kind == "contactos_actualizacion"]
+        inserts = [entry for entry in ready if entry.kind != "contactos_actualizacion"]
+        results = []
+        for group in (inserts, updates):
+            group_results = await asyncio.gather(*(self._deliver(entry) for entry in group))
+            for entry, success in zip(group, group_results):
+                if success:
+                    self._outbox_delivered.add(entry.key)
+                    self._outbox_attempts.pop(entry.key, None)
+                    self._outbox_retry_at.pop(entry.key, None)
+                else:
+                    self._schedule_retry(entry)
+            results.extend(group_results)
+        
+        # El cursor avanza sobre el prefijo entregado; lo entregado más adelante se recuerda por clave
+        for entry in entries:
+            if entry.key not in self._outbox_delivered:
+                break
+            self._outbox_offset = entry.end
+            self._outbox_delivered.discard(entry.key)
+        self.outbox.save_cursor(self._outbox_offset, self._outbox_delivered)
+        self._outbox_offset = self.outbox.compact(self._outbox_offset, self._outbox_delivered)
+        
+        if any(results):
+            # Lo que falló espera su propio reintento; el resto de la cola sigue
+            self._outbox_backoff = 0.0
+            return 0.0
+        self._outbox_backoff = min(
+            max(self._outbox_backoff * 2, settings.NOCODB_OUTBOX_BACKOFF_BASE_SECONDS),
+            settings.NOCODB_OUTBOX_BACKOFF_MAX_SECONDS
+        )
+        logger.warning(f"⏳ {len(results)} alta(s) sin entregar; reintento en hasta {self._outbox_backoff:.1f}s")
+        # Jitter completo: los workers no reintentan todos a la vez
+        return random.uniform(0, self._outbox_backoff)
+    
+    def _read_ready(self, now: float) -> Tuple[List[OutboxEntry], List[OutboxEntry], float]:
+        """
+        Entradas desde el cursor hasta juntar una ventana de listas para enviar
+        Las ya entregadas o en espera de reintento no ocupan lugar: una entrada trabada
+        no impide leer las siguientes. Retorna (leídas, listas, próximo reintento)
+        """
+        window = settings.NOCODB_BATCH_MAX_ITEMS * 4
+        entries: List[OutboxEntry] = []
+        ready: List[OutboxEntry] = []
+        waiting_until = float("inf")
+        offset = self._outbox_offset
+        while len(ready) < window:
+            chunk = self.outbox.read_from(offset, window)
+            for entry in chunk:
+                entries.append(entry)
+                if entry.key in self._outbox_delivered:
+                    continue
+                retry_at = self._outbox_retry_at.get(entry.key, 0.0)
+                if retry_at > now:
+                    waiting_until = min(waiting_until, retry_at)
+                elif len(ready) < window:
+                    ready.append(entry)
+            if len(chunk) < window:
+                break
+            offset = chunk[-1].end
+        return entries, ready, waiting_until
+    
+    def _schedule_retry(self, entry: OutboxEntry):
+        """Backoff exponencial con jitter por entrada; agotados los intentos, se aparta"""
+        attempts = self._outbox_attempts.get(entry.key, 0) + 1
+        if attempts >= settings.NOCODB_OUTBOX_MAX_ATTEMPTS:
+            self._dead_letter(entry, f"{attempts} intentos sin éxito")
+            return
+        self._outbox_attempts[entry.key] = attempts
+        delay = min(
+            settings.NOCODB_OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1),
+            settings.NOCODB_OUTBOX_BACKOFF_MAX_SECONDS
+        )
+        self._outbox_retry_at[entry.key] = time.monotonic() + random.uniform(delay / 2, delay)
+    
+    def _dead_letter(self, entry: OutboxEntry, reason: str):
+        """Aparta la entrada al archivo de fallidas y la da por resuelta para que el cursor avance"""
+        self.outbox.dead_letter(entry, reason)
+        self.dead_letters += 1
+        self._outbox_delivered.add(entry.key)
+        self._outbox_attempts.pop(entry.key, None)
+        self._outbox_retry_at.pop(entry.key, None)
+        logger.error(f"🪦 Entrada del outbox apartada como fallida ({entry.kind}, {entry.key}): {reason}")
+    
+    async def _deliver(self, entry: OutboxEntry) -> bool:
+        writer = self._writers.get(entry.kind)
+        if writer is None:
+            logger.error(f"❌ Entrada del outbox descartada (offset {entry.offset}, tipo '{entry.kind}')")
+            return True
+        record = entry.record
+        if PENDING_INSERT_FIELD in record:
+            record = self._resolve_pending_insert(record)
+            if record is None:
+                return False
+        if settings.NOCODB_IDEMPOTENCY_FIELD:
+            record = {**record, settings.NOCODB_IDEMPOTENCY_FIELD: entry.key}
+        try:
+            result = await writer.add(record)
+        except NocodbRejectedError as e:
+            self._dead_letter(entry, f"rechazada por NocoDB: {e}")
+            return True
+        if entry.kind == "contactos" and isinstance(result, dict) and result.get("Id") is not None:
+            self.customer_index.confirm_insert(entry.key, result["Id"])
+        return bool(result)
+    
+    def _resolve_pending_insert(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Actualización que apunta a un alta del outbox: se reemplaza la clave por el Id de la fila"""
+        record = dict(record)
+        insert_key = record.pop(PENDING_INSERT_FIELD)
+        row_id = self.customer_index.inserted_ids.get(insert_key)
+        if row_id is None:
+            # Alta entregada antes de un reinicio: se busca en la réplica por email/teléfono
+            inserted = self.customer_index.current_row(insert_key)
+            found = self.customer_index.lookup(inserted.get("email_cliente"), inserted.get("telefono_cliente"))
+            row_id = found if isinstance(found, int) else None
+        if row_id is None:
+            logger.info(f"⏳ Actualización en espera del Id del alta {insert_key}")
+            return None
+        return {"Id": row_id, **record}
+    
+    async def _send(self, method: str, url: str, **kwargs) -> Tuple[int, str]:
+        """Llamada a NocoDB a través del circuit breaker y el limitador AIMD; retorna (status, cuerpo)"""
+        if not self.breaker.allow():
+            raise NocodbUnavailableError(f"circuito abierto, reintentar en {self.breaker.retry_after():.0f}s")
+        async with self.limiter:
+            session = await self._get_session()
+            start = time.perf_counter()
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    body = await response.text()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.limiter.record(time.perf_counter() - start, overloaded=True)
+                self.breaker.record_failure()
+                raise
+        # 429 y 5xx son sobrecarga; otros 4xx son errores del pedido con NocoDB sano
+        overloaded = status == 429 or status >= 500
+        self.limiter.record(time.perf_counter() - start, overloaded)
+        if overloaded:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return status, body
+    
+    async def _bulk_write(self, method: str, bulk_url: str, records: List[Dict[str, Any]]) -> bool:
+        """Envía un lote con los endpoints bulk de NocoDB (POST = altas, PATCH = actualizaciones por Id)"""
+        try:
+            logger.info(f"🌐 Enviando {len(records)} registro(s) ({method}) a: {bulk_url}")
+            status, body = await self._send(method, bulk_url, json=records)
+            if status == 200:
+                logger.info(f"✅ {len(records)} registro(s) guardados exitosamente en NocoDB")
+                try:
+                    # Respuesta por registro ([{"Id": n}, ...]): el batcher la reparte
+                    results = json.loads(body)
+                except ValueError:
+                    return True
+                return results if isinstance(results, list) and results else True
+            elif status == 401:
+                logger.error("❌ Error de autenticación en NocoDB - Token inválido")
+                return False
+            elif status == 404:
+                logger.error("❌ Tabla no encontrada en NocoDB - Verificar base_id y table_id")
+                return False
+            elif 400 <= status < 500 and status not in RETRYABLE_CLIENT_STATUSES:
+                logger.error(f"❌ NocoDB rechazó el lote: {status} - {body}")
+                raise NocodbRejectedError(status, body)
+            else:
+                logger.error(f"❌ Error guardando en NocoDB: {status} - {body}")
+                return False
+        except NocodbUnavailableError as e:
+            logger.warning(f"⚡ NocoDB no disponible, el lote queda en el outbox: {e}")
+            return False
+        except aiohttp.ClientError as e:
+            logger.error(f"🌐 Error de conexión con NocoDB: {e}")
+            return False
+        except asyncio.TimeoutError:
+            logger.error("⏰ Timeout en conexión con NocoDB")
+            return False
     
     async def save_customer_data(self, customer_data: Dict[str, Any]) -> bool:
         """
         Guarda los datos del cliente en Nocodb (tabla de contactos)
+        Retorna True cuando el alta quedó registrada en el outbox; el envío es asíncrono
         """
         try:
             logger.info(f"🔄 Intentando guardar cliente en NocoDB: {customer_data.get('nombre', 'Sin nombre')}")
-            logger.info(f"📊 URL de API: {self.contactos_api_url}")
-            logger.info(f"🔑 Token: {self.token[:10]}...")
             
             # Preparar datos para Nocodb (formato de tabla contactos_csv)
             nocodb_data = {
                 "nombre_cliente": customer_data.get("nombre", ""),
                 "email_cliente": customer_data.get("email", ""),
-                "telefono_cliente": customer_data.get("whatsapp", ""),
-                "mensaje_consulta": customer_data.get("observaciones", ""),
+                "telefono_cliente": customer_data.get("whatsapp") or customer_data.get("telefono", ""),
+                "mensaje_consulta": customer_data.get("observaciones") or customer_data.get("mensaje", ""),
                 "fecha_consulta": customer_data.get("fecha", ""),
                 "estado_consulta": "Nuevo",
                 "origen_consulta": "Web Construcción",
@@ -63,45 +594,39 @@ class NocodbService:
             
             logger.info(f"📝 Datos preparados para NocoDB: {nocodb_data}")
             
-            async with aiohttp.ClientSession() as session:
-                logger.info(f"🌐 Enviando POST a: {self.contactos_api_url}")
-                logger.info(f"📋 Headers: {self.headers}")
-                
-                async with session.post(
-                    self.contactos_api_url,
-                    json=nocodb_data,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    logger.info(f"📡 Respuesta recibida: {response.status}")
-                    
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.info(f"✅ Cliente guardado exitosamente en NocoDB: {result}")
-                        return True
-                    elif response.status == 401:
-                        logger.error("❌ Error de autenticación en NocoDB - Token inválido")
-                        return False
-                    elif response.status == 404:
-                        logger.error("❌ Tabla no encontrada en NocoDB - Verificar base_id y table_id")
-                        return False
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ Error guardando en NocoDB: {response.status} - {error_text}")
-                        logger.error(f"📋 Headers de respuesta: {dict(response.headers)}")
-                        return False
-                        
-        except aiohttp.ClientError as e:
-            logger.error(f"🌐 Error de conexión con NocoDB: {e}")
-            return False
-        except asyncio.TimeoutError:
-            logger.error("⏰ Timeout en conexión con NocoDB")
-            return False
+            # Cliente que vuelve (ya en NocoDB o todavía en el outbox): se actualiza su fila en lugar de crear otra
+            existing = self.customer_index.lookup(nocodb_data["email_cliente"], nocodb_data["telefono_cliente"])
+            if existing is not None:
+                logger.info(f"👥 Cliente existente ({existing}): se actualiza")
+                return await self._enqueue("contactos_actualizacion", self._merge_contact(existing, nocodb_data))
+            
+            return await self._enqueue("contactos", nocodb_data)
+            
         except Exception as e:
             logger.error(f"❌ Error inesperado en servicio NocoDB: {e}")
             return False
     
+    def _merge_contact(self, target: ContactRef, nocodb_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Actualización de un contacto existente: no borra datos, completa email/teléfono y acumula consultas y notas
+        Se combina con el último estado conocido (incluidas las escrituras aún en el outbox), así dos
+        consultas seguidas no se pisan las notas; `target` es el Id o la clave del alta pendiente
+        """
+        current = self.customer_index.current_row(target)
+        update: Dict[str, Any] = {"Id": target} if isinstance(target, int) else {PENDING_INSERT_FIELD: target}
+        for field, value in nocodb_data.items():
+            if value in ("", None):
+                continue
+            if field in ("email_cliente", "telefono_cliente") and current.get(field):
+                # Las claves de deduplicación de la fila existente no se pisan
+                continue
+            if field in ("mensaje_consulta", "notas_Internas") and current.get(field):
+                if value in current[field]:
+                    continue
+                value = f"{current[field]}\n---\n{value}"
+            update[field] = value
+        return update
+    
     async def save_contact_form(self, contact_data: Dict[str, Any]) -> bool:
         """
         Guarda los datos del formulario de contacto
@@ -117,77 +642,41 @@ class NocodbService:
                 "Estado": "Nuevo"
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.api_url,
-                    json=nocodb_data,
-                    headers=self.headers
-                ) as response:
+            status, body = await self._send("POST", self.api_url, json=nocodb_data)
+            if status == 200:
+                logger.info(f"Contacto guardado en Nocodb: {json.loads(body).get('Id')}")
+                return True
+            else:
+                logger.error(f"Error guardando contacto en Nocodb: {status} - {body}")
+                return False
                     
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.info(f"Contacto guardado en Nocodb: {result.get('Id')}")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Error guardando contacto en Nocodb: {response.status} - {error_text}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"Error guardando contacto en Nocodb: {e}")
             return False
     
     async def get_customers(self, limit: int = 100) -> Optional[list]:
         """
-        Obtiene la lista de clientes desde Nocodb
+        Obtiene la lista de clientes (los más recientes primero) desde la réplica local
         """
-        try:
-            params = {
-                "limit": limit,
-                "sort": "-Fecha"
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    self.api_url,
-                    params=params,
-                    headers=self.headers
-                ) as response:
-                    
-                    if response.status == 200:
-                        result = await response.json()
-                        return result.get("list", [])
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Error obteniendo clientes: {response.status} - {error_text}")
-                        return None
-                        
-        except Exception as e:
-            logger.error(f"Error obteniendo clientes: {e}")
-            return None
+        _, clientes = self.contactos.query(limit=limit)
+        return clientes
     
     async def update_customer_status(self, customer_id: int, status: str) -> bool:
         """
         Actualiza el estado de un cliente
         """
         try:
-            update_data = {"Estado": status}
+            update_data = {"estado_consulta": status}
             
-            async with aiohttp.ClientSession() as session:
-                async with session.patch(
-                    f"{self.api_url}/{customer_id}",
-                    json=update_data,
-                    headers=self.headers
-                ) as response:
+            response_status, body = await self._send("PATCH", f"{self.contactos_api_url}/{customer_id}", json=update_data)
+            if response_status == 200:
+                self.contactos.patch(customer_id, update_data)
+                logger.info(f"Estado del cliente {customer_id} actualizado a: {status}")
+                return True
+            else:
+                logger.error(f"Error actualizando estado: {response_status} - {body}")
+                return False
                     
-                    if response.status == 200:
-                        logger.info(f"Estado del cliente {customer_id} actualizado a: {status}")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Error actualizando estado: {response.status} - {error_text}")
-                        return False
-                        
         except Exception as e:
             logger.error(f"Error actualizando estado del cliente: {e}")
             return False
@@ -195,10 +684,10 @@ class NocodbService:
     async def save_quote_data(self, quote_data: Dict[str, Any]) -> bool:
         """
         Guarda los datos de la cotización en Nocodb (tabla de cotizaciones)
+        Retorna True cuando el alta quedó registrada en el outbox; el envío es asíncrono
         """
         try:
             logger.info(f"🔄 Intentando guardar cotización en NocoDB: {quote_data.get('client_name', 'Sin nombre')}")
-            logger.info(f"📊 URL de API: {self.cotizaciones_api_url}")
             
             # Preparar datos para Nocodb (formato de tabla cotizaciones)
             nocodb_data = {
@@ -222,25 +711,7 @@ class NocodbService:
             
             logger.info(f"📝 Datos de cotización preparados para NocoDB: {nocodb_data}")
             
-            async with aiohttp.ClientSession() as session:
-                logger.info(f"🌐 Enviando POST a: {self.cotizaciones_api_url}")
-                
-                async with session.post(
-                    self.cotizaciones_api_url,
-                    json=nocodb_data,
-                    headers=self.headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    response_text = await response.text()
-                    logger.info(f"📡 Respuesta de NocoDB: {response.status} - {response_text}")
-                    
-                    if response.status == 200:
-                        logger.info("✅ Cotización guardada exitosamente en NocoDB")
-                        return True
-                    else:
-                        logger.error(f"❌ Error guardando cotización: {response.status} - {response_text}")
-                        return False
+            return await self._enqueue("cotizaciones", nocodb_data)
                         
         except Exception as e:
             logger.error(f"❌ Error guardando cotización en NocoDB: {e}")
@@ -0,0 +1,350 @@
+"""
+Outbox local para las escrituras a NocoDB
+Cada alta se registra primero en un log append-only (JSON por línea, con fsync); un worker
+la reenvía a NocoDB y avanza un cursor persistido. El offset de cada entrada es su posición
+en bytes dentro del log. Desde el event loop, el fsync corre en un hilo y se agrupa: las
+altas que llegan mientras hay uno en curso comparten el siguiente. Cuando el cursor pasa
+NOCODB_OUTBOX_SEGMENT_BYTES, el log se compacta: solo queda lo pendiente y los offsets
+vuelven a empezar (lo ya entregado deja de poder reprocesarse).
+Las entradas que NocoDB rechaza (4xx del pedido) o que agotan NOCODB_OUTBOX_MAX_ATTEMPTS
+pasan a un archivo de fallidas para no bloquear el cursor; se revisan y se reencolan a mano.
+
+Administración:
+    python -m app.outbox estado
+    python -m app.outbox listar --desde 0 --limite 20
+    python -m app.outbox reprocesar --desde 0
+    python -m app.outbox fallidas --limite 20
+    python -m app.outbox reencolar
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from .config import settings
+from .file_utils import atomic_write_bytes, atomic_write_json
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, la compactación no se coordina con las altas
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutboxEntry:
+    """Entrada del outbox: [offset, end) es su rango de bytes en el log"""
+    offset: int
+    end: int
+    key: str
+    kind: str
+    record: Dict[str, Any]
+    timestamp: str
+
+
+class Outbox:
+    """Log append-only compartido entre procesos, con cursor de entrega y pedidos de reproceso"""
+
+    def __init__(self, path: str, segment_bytes: Optional[int] = None):
+        self.path = path
+        self.cursor_path = f"{path}.cursor"
+        self.replay_path = f"{path}.replay"
+        self.lock_path = f"{path}.lock"
+        self.dead_letter_path = f"{path}.fallidas.jsonl"
+        # Altas (compartido) contra compactación (exclusivo), entre todos los workers
+        self.append_lock_path = f"{path}.append.lock"
+        self.segment_bytes = segment_bytes or settings.NOCODB_OUTBOX_SEGMENT_BYTES
+        # Commit agrupado: altas escritas / cubiertas por un fsync, y el fsync en curso
+        self._written = 0
+        self._synced = 0
+        self._sync_task: Optional[asyncio.Task] = None
+        self.fsyncs = 0
+        self.compactions = 0
+
+    @contextmanager
+    def _append_lock(self, exclusive: bool = False) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.append_lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def _write(self, kind: str, record: Dict[str, Any], fsync: bool) -> str:
+        key = uuid.uuid4().hex
+        line = json.dumps({
+            "key": key,
+            "kind": kind,
+            "ts": datetime.now().isoformat(),
+            "record": record
+        }, default=str, ensure_ascii=False) + "\n"
+        # Una sola escritura con O_APPEND: las líneas de distintos workers no se intercalan
+        with self._append_lock():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+                if fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+        return key
+
+    def append(self, kind: str, record: Dict[str, Any]) -> str:
+        """Agrega una entrada de forma durable; retorna su clave de idempotencia (fuera del event loop)"""
+        return self._write(kind, record, fsync=True)
+
+    async def append_async(self, kind: str, record: Dict[str, Any]) -> str:
+        """Como append, pero el fsync corre en un hilo y se comparte con las altas concurrentes"""
+        key = self._write(kind, record, fsync=False)
+        self._written += 1
+        sequence = self._written
+        while self._synced < sequence:
+            if self._sync_task is None:
+                self._sync_task = asyncio.get_running_loop().create_task(self._group_fsync())
+            # shield: si esta request se cancela, el fsync sigue para las demás
+            await asyncio.shield(self._sync_task)
+        return key
+
+    async def _group_fsync(self):
+        target = self._written
+        try:
+            await asyncio.to_thread(self._fsync)
+        finally:
+            self._sync_task = None
+        self._synced = max(self._synced, target)
+
+    def _fsync(self):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.fsyncs += 1
+
+    def inode(self) -> Optional[int]:
+        """Identidad del log actual (cambia con cada compactación)"""
+        try:
+            return os.stat(self.path).st_ino
+        except OSError:
+            return None
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def read_from(self, offset: int, limit: int) -> List[OutboxEntry]:
+        """Lee hasta `limit` entradas completas a partir del offset (ignora una última línea a medio escribir)"""
+        entries: List[OutboxEntry] = []
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return entries
+        with f:
+            f.seek(offset)
+            position = offset
+            while len(entries) < limit:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                start, position = position, position + len(line)
+                try:
+                    data = json.loads(line)
+                    entries.append(OutboxEntry(start, position, data["key"], data["kind"],
+                                               data["record"], data.get("ts", "")))
+                except (ValueError, KeyError) as e:
+                    # Línea corrupta (corte de energía a mitad de escritura): se entrega vacía
+                    # para que el worker la descarte y el cursor pueda avanzar
+                    logger.error(f"❌ Entrada inválida en el outbox (offset {start}): {e}")
+                    entries.append(OutboxEntry(start, position, f"invalida-{start}", "", {}, ""))
+        return entries
+
+    def next_offset(self, offset: int) -> int:
+        """Primer inicio de línea en o después de `offset` (para reprocesos con offsets aproximados)"""
+        if offset <= 0:
+            return 0
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset - 1)
+                if f.read(1) == b"\n":
+                    return offset
+                f.readline()
+                return f.tell()
+        except FileNotFoundError:
+            return 0
+
+    # --- Entradas fallidas ---
+
+    def dead_letter(self, entry: OutboxEntry, reason: str):
+        """Aparta una entrada que no se puede entregar (el cursor puede seguir avanzando)"""
+        line = json.dumps({
+            "key": entry.key,
+            "kind": entry.kind,
+            "ts": entry.timestamp,
+            "record": entry.record,
+            "reason": reason,
+            "failed_at": datetime.now().isoformat()
+        }, default=str, ensure_ascii=False) + "\n"
+        fd = os.open(self.dead_letter_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def read_dead_letters(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.dead_letter_path, "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def requeue_dead_letters(self) -> int:
+        """Vuelve a encolar las fallidas (con clave nueva) y vacía el archivo; retorna cuántas"""
+        dead = self.read_dead_letters()
+        for item in dead:
+            self.append(item["kind"], item["record"])
+        atomic_write_bytes(self.dead_letter_path, b"")
+        return len(dead)
+
+    # --- Cursor de entrega ---
+
+    def load_cursor(self) -> Tuple[int, Set[str]]:
+        """Offset confirmado y claves ya entregadas más adelante (entregas fuera de orden)"""
+        try:
+            with open(self.cursor_path, "r") as f:
+                data = json.load(f)
+            offset = int(data.get("offset", 0))
+            inode = data.get("inode")
+            if offset and inode is not None and inode != self.inode():
+                # El log se compactó después de guardar el cursor: lo pendiente quedó al principio
+                logger.warning("Cursor del outbox de un log anterior a la compactación: se lee desde el inicio")
+                offset = 0
+            return offset, set(data.get("delivered", []))
+        except FileNotFoundError:
+            return 0, set()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cursor del outbox inválido, se reenvía desde el inicio: {e}")
+            return 0, set()
+
+    def save_cursor(self, offset: int, delivered: Set[str]):
+        atomic_write_json(self.cursor_path, {
+            "offset": offset,
+            "inode": self.inode(),
+            "delivered": sorted(delivered),
+            "updated_at": datetime.now().isoformat()
+        })
+
+    # --- Compactación ---
+
+    def compact(self, offset: int, delivered: Set[str]) -> int:
+        """Descarta lo ya entregado cuando el cursor pasó un segmento; retorna el nuevo offset
+
+        Solo lo llama el worker líder del outbox. Las altas de todos los workers esperan (lock
+        exclusivo) mientras se copia lo pendiente a un log nuevo.
+        """
+        if offset < self.segment_bytes or os.path.exists(self.replay_path):
+            return offset
+        with self._append_lock(exclusive=True):
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                pending = f.read()
+            # Log nuevo primero: si se corta antes de guardar el cursor, el inodo distinto
+            # hace que se lea desde el inicio (lo pendiente), nunca que se salteen altas
+            atomic_write_bytes(self.path, pending)
+            self.save_cursor(0, delivered)
+        self.compactions += 1
+        logger.info(f"🗜️ Outbox compactado: {offset} bytes entregados descartados, {len(pending)} pendientes")
+        return 0
+
+    # --- Reproceso ---
+
+    def request_replay(self, offset: int) -> int:
+        """Pide al worker que vuelva a enviar todo desde `offset`; retorna el offset efectivo"""
+        offset = self.next_offset(offset)
+        atomic_write_json(self.replay_path, {"offset": offset, "requested_at": datetime.now().isoformat()})
+        return offset
+
+    def take_replay_request(self) -> Optional[int]:
+        """Consume un pedido de reproceso pendiente, si lo hay"""
+        try:
+            with open(self.replay_path, "r") as f:
+                offset = int(json.load(f)["offset"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Pedido de reproceso inválido, se descarta: {e}")
+            offset = None
+        try:
+            os.unlink(self.replay_path)
+        except OSError:
+            pass
+        return offset
+
+    def status(self) -> Dict[str, Any]:
+        offset, delivered = self.load_cursor()
+        size = self.size()
+        return {
+            "path": self.path,
+            "size_bytes": size,
+            "offset": offset,
+            "pending_bytes": max(size - offset, 0),
+            "delivered_ahead": len(delivered),
+            "segment_bytes": self.segment_bytes,
+            "dead_letters": len(self.read_dead_letters()),
+            "fsyncs": self.fsyncs,
+            "compactions": self.compactions
+        }
+
+
+# Instancia global del outbox
+outbox = Outbox(settings.NOCODB_OUTBOX_PATH)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.outbox", description="Administración del outbox de NocoDB")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("estado", help="Offset confirmado y bytes pendientes")
+    listar = commands.add_parser("listar", help="Lista entradas con su offset")
+    listar.add_argument("--desde", type=int, default=None, help="Offset inicial (por defecto, el cursor)")
+    listar.add_argument("--limite", type=int, default=20)
+    reprocesar = commands.add_parser("reprocesar", help="Reenvía a NocoDB todo desde un offset")
+    reprocesar.add_argument("--desde", type=int, required=True, help="Offset en bytes (se alinea al inicio de línea)")
+    fallidas = commands.add_parser("fallidas", help="Lista las entradas apartadas por rechazo o reintentos agotados")
+    fallidas.add_argument("--limite", type=int, default=20)
+    commands.add_parser("reencolar", help="Vuelve a encolar todas las entradas fallidas")
+    args = parser.parse_args()
+
+    if args.command == "estado":
+        print(json.dumps(outbox.status(), indent=2))
+    elif args.command == "listar":
+        cursor, delivered = outbox.load_cursor()
+        start = cursor if args.desde is None else outbox.next_offset(args.desde)
+        for entry in outbox.read_from(start, args.limite):
+            estado = "entregada" if entry.end <= cursor or entry.key in delivered else "pendiente"
+            print(f"{entry.offset}\t{entry.timestamp}\t{entry.kind}\t{entry.key}\t{estado}")
+    elif args.command == "reprocesar":
+        offset = outbox.request_replay(args.desde)
+        print(f"Reproceso pedido desde el offset {offset}; el worker líder lo aplica en su próxima pasada")
+    elif args.command == "fallidas":
+        for item in outbox.read_dead_letters()[-args.limite:]:
+            print(f"{item['failed_at']}\t{item['kind']}\t{item['key']}\t{item['reason']}")
+    elif args.command == "reencolar":
+        print(f"{outbox.requeue_dead_letters()} entrada(s) reencolada(s)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -60,11 +60,10 @@ class PDFService:
         Retorna la ruta del archivo PDF generado
         """
         try:
-            # Crear archivo temporal
-            temp_dir = tempfile.gettempdir()
+            # Crear archivo temporal (nombre único: hay envíos concurrentes en el mismo segundo)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"cotizacion_{timestamp}.pdf"
-            filepath = os.path.join(temp_dir, filename)
+            fd, filepath = tempfile.mkstemp(prefix=f"cotizacion_{timestamp}_", suffix=".pdf")
+            os.close(fd)
             
             # Crear documento PDF
             doc = SimpleDocTemplate(filepath, pagesize=A4)
@@ -175,6 +174,15 @@ class PDFService:
         ]))
         
         story.append(costs_table)
+        
+        transport = quote_data.get('transport')
+        if transport:
+            story.append(Spacer(1, 6))
+            story.append(Paragraph(
+                f"Transporte desde {transport.get('plant')} hasta {transport.get('destination')}: "
+                f"{transport.get('distance_km')} km por ruta, {transport.get('trucks')} camión/es",
+                self.styles['Normal']
+            ))
         story.append(Spacer(1, 20))
     
     def _add_materials_list(self, story: List, quote_data: Dict[str, Any]):
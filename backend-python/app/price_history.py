@@ -0,0 +1,203 @@
+"""
+Historial local de precios y tipo de cambio
+Series de tiempo append-only en archivos columnares de registros de ancho fijo,
+leídos mediante memory-mapping para consultas por rango rápidas
+"""
+
+import logging
+import mmap
+import os
+import re
+import struct
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from .config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, las escrituras no se coordinan entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Cada serie usa dos columnas: timestamps (int64, epoch en segundos) y valores (float64)
+_TS_FORMAT = "<q"
+_VALUE_FORMAT = "<d"
+_RECORD_SIZE = 8
+
+_SERIES_NAME_RE = re.compile(r"^[a-z0-9_.\-]{1,80}$")
+
+
+class PriceHistoryStore:
+    """Almacén append-only de series de tiempo de precios"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.PRICE_HISTORY_DIR
+        self._last_ts: Dict[str, int] = {}
+        # Puntos de cada serie según la última escritura de este proceso
+        self._lengths: Dict[str, int] = {}
+
+    def _paths(self, series: str) -> Tuple[str, str]:
+        if not _SERIES_NAME_RE.match(series):
+            raise ValueError(f"Nombre de serie inválido: {series}")
+        base = os.path.join(self.directory, series)
+        return f"{base}.ts", f"{base}.val"
+
+    @contextmanager
+    def _series_lock(self, series: str) -> Iterator[None]:
+        """Lock exclusivo entre procesos sobre la serie (archivo .lock al lado de las columnas)"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, f"{series}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def append(self, series: str, value: float, timestamp: Optional[datetime] = None):
+        """Agrega un punto a la serie (los timestamps nunca retroceden)"""
+        ts_path, value_path = self._paths(series)
+        ts = int((timestamp or datetime.now()).timestamp())
+
+        # Con varios workers escribiendo, ambas columnas se escriben bajo el mismo lock
+        with self._series_lock(series):
+            with open(value_path, "ab") as value_file, open(ts_path, "ab") as ts_file:
+                # Un corte entre ambas escrituras pudo dejar un valor huérfano: se descarta
+                # para que las columnas sigan alineadas (al leer se usa la longitud mínima)
+                length = min(os.fstat(value_file.fileno()).st_size, os.fstat(ts_file.fileno()).st_size)
+                length -= length % _RECORD_SIZE
+                for f in (value_file, ts_file):
+                    if os.fstat(f.fileno()).st_size != length:
+                        f.truncate(length)
+
+                # Otro worker pudo agregar puntos: el último timestamp se relee del archivo
+                last_ts = self._last_ts.get(series)
+                if last_ts is None or length // _RECORD_SIZE != self._lengths.get(series):
+                    last_ts = self._read_last_ts(series)
+                ts = max(ts, last_ts) if last_ts is not None else ts
+
+                value_file.write(struct.pack(_VALUE_FORMAT, float(value)))
+                value_file.flush()
+                ts_file.write(struct.pack(_TS_FORMAT, ts))
+        self._last_ts[series] = ts
+        self._lengths[series] = length // _RECORD_SIZE + 1
+
+    def append_many(self, values: Dict[str, float], timestamp: Optional[datetime] = None):
+        """Agrega un punto a varias series con el mismo timestamp"""
+        timestamp = timestamp or datetime.now()
+        for series, value in values.items():
+            try:
+                self.append(series, value, timestamp)
+            except Exception as e:
+                logger.error(f"Error guardando historial de {series}: {e}")
+
+    def list_series(self) -> List[str]:
+        """Lista las series disponibles"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[:-3] for name in os.listdir(self.directory) if name.endswith(".ts")
+        )
+
+    @contextmanager
+    def _columns(self, series: str) -> Iterator[Tuple[memoryview, memoryview]]:
+        """Mapea las columnas de una serie como vistas int64/float64 de solo lectura"""
+        ts_path, value_path = self._paths(series)
+        if not os.path.exists(ts_path) or not os.path.exists(value_path):
+            raise KeyError(series)
+
+        with open(ts_path, "rb") as ts_file, open(value_path, "rb") as value_file:
+            length = min(os.fstat(ts_file.fileno()).st_size, os.fstat(value_file.fileno()).st_size)
+            length -= length % _RECORD_SIZE
+            if length == 0:
+                yield memoryview(b"").cast("q"), memoryview(b"").cast("d")
+                return
+
+            with mmap.mmap(ts_file.fileno(), length, access=mmap.ACCESS_READ) as ts_map, \
+                    mmap.mmap(value_file.fileno(), length, access=mmap.ACCESS_READ) as value_map:
+                ts_view = memoryview(ts_map).cast("q")
+                value_view = memoryview(value_map).cast("d")
+                try:
+                    yield ts_view, value_view
+                finally:
+                    ts_view.release()
+                    value_view.release()
+
+    def _read_last_ts(self, series: str) -> Optional[int]:
+        try:
+            with self._columns(series) as (timestamps, _):
+                return timestamps[-1] if len(timestamps) else None
+        except KeyError:
+            return None
+
+    def query(self, series: str, start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> List[Tuple[int, float]]:
+        """Retorna los puntos (timestamp, valor) dentro del rango [start, end]"""
+        with self._columns(series) as (timestamps, values):
+            lo, hi = self._range(timestamps, start, end)
+            return list(zip(timestamps[lo:hi].tolist(), values[lo:hi].tolist()))
+
+    @staticmethod
+    def _range(timestamps: memoryview, start: Optional[datetime],
+               end: Optional[datetime]) -> Tuple[int, int]:
+        """Búsqueda binaria de los índices del rango sobre la columna de timestamps"""
+        lo = bisect_left(timestamps, int(start.timestamp())) if start else 0
+        hi = bisect_right(timestamps, int(end.timestamp())) if end else len(timestamps)
+        return lo, max(lo, hi)
+
+    def trend(self, series: str, start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> Dict[str, Any]:
+        """Resumen de tendencia de la serie en el rango"""
+        with self._columns(series) as (timestamps, values):
+            lo, hi = self._range(timestamps, start, end)
+            # Copia del rango: las vistas sobre el mmap no pueden sobrevivir al bloque
+            window = values[lo:hi].tolist()
+            count = len(window)
+            if count == 0:
+                return {"serie": series, "puntos": 0}
+
+            first, last = window[0], window[-1]
+            return {
+                "serie": series,
+                "puntos": count,
+                "desde": datetime.fromtimestamp(timestamps[lo]).isoformat(),
+                "hasta": datetime.fromtimestamp(timestamps[hi - 1]).isoformat(),
+                "inicial": first,
+                "final": last,
+                "minimo": min(window),
+                "maximo": max(window),
+                "promedio": sum(window) / count,
+                "variacion_porcentual": ((last - first) / first * 100) if first else None
+            }
+
+    def moving_average(self, series: str, window_seconds: int,
+                       start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> List[Tuple[int, float]]:
+        """Media móvil por ventana de tiempo (incluye los puntos previos al rango que caen en la ventana)"""
+        if window_seconds <= 0:
+            raise ValueError("La ventana debe ser mayor a 0")
+
+        with self._columns(series) as (timestamps, values):
+            lo, hi = self._range(timestamps, start, end)
+            if lo >= hi:
+                return []
+
+            # Ventana deslizante con suma acumulada: O(n) sobre el rango
+            tail = bisect_left(timestamps, timestamps[lo] - window_seconds + 1)
+            window_sum = sum(values[tail:lo])
+            result = []
+            for i in range(lo, hi):
+                window_sum += values[i]
+                while timestamps[tail] <= timestamps[i] - window_seconds:
+                    window_sum -= values[tail]
+                    tail += 1
+                result.append((timestamps[i], window_sum / (i - tail + 1)))
+            return result
+
+
+# Instancia global del historial
+price_history = PriceHistoryStore()
@@ -5,6 +5,8 @@ Integra con APIs de Argentina para mantener precios actualizados
 
 import asyncio
 import logging
+import math
+import struct
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 import json
@@ -12,11 +14,43 @@ import os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from .argentina_apis import ArgentinaAPIService, get_current_prices, get_current_exchange_rate
+from .argentina_apis import (
+    ArgentinaAPIService, argentina_api_service, get_current_prices, get_current_exchange_rate,
+    MARKET_PRICE_SOURCES
+)
+from .cost_index import cost_index
+from .price_history import price_history
+from .events import price_events, TOPIC_PRICES, TOPIC_EXCHANGE
+from .leader import FileLeaderLock
+from .shared_tables import shared_tables
+from .file_utils import atomic_write_checksummed, read_checksummed
+from .config import settings
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# La elección de líder corre cada pocos segundos: no registrar cada ejecución de job
+logging.getLogger("apscheduler.executors.default").setLevel(logging.WARNING)
+
+# Snapshot binario: timestamps (última actualización, precios, tipo de cambio), los seis
+# precios, el tipo de cambio y la fuente en UTF-8 con prefijo de largo (NaN = sin dato),
+# seguidos del origen de los precios con su propio prefijo de largo (ausente en snapshots viejos)
+_SNAPSHOT_MAGIC = b"CTZSNP01"
+_SNAPSHOT_BODY = struct.Struct("<3d6d2dH")
+_SNAPSHOT_STR_LEN = struct.Struct("<H")
+_PRICE_FIELDS = ('steel_frame_m2', 'industrial_m2', 'container_m2', 'materials_m2', 'labor_m2', 'finishes_m2')
+# Archivos JSON/texto anteriores al snapshot binario (solo lectura, para migrar)
+_LEGACY_PRICES_CACHE = "prices_cache.json"
+_LEGACY_EXCHANGE_CACHE = "exchange_cache.json"
+_LEGACY_LAST_UPDATE = "last_update.txt"
+
+
+def _to_ts(value: Optional[datetime]) -> float:
+    return value.timestamp() if value else math.nan
+
+
+def _from_ts(value: float) -> Optional[datetime]:
+    return None if math.isnan(value) else datetime.fromtimestamp(value)
 
 class PriceUpdaterService:
     """Servicio de actualización automática de precios"""
@@ -25,36 +59,123 @@ class PriceUpdaterService:
         self.scheduler = AsyncIOScheduler()
         self.last_update: Optional[datetime] = None
         self.update_interval = timedelta(hours=12)
-        self.prices_cache_file = "prices_cache.json"
-        self.exchange_cache_file = "exchange_cache.json"
+        self.snapshot_file = settings.PRICE_SNAPSHOT_PATH
+        
+        # Últimos precios y tipo de cambio conocidos (se persisten en el snapshot)
+        self.cached_prices: Dict[str, float] = {}
+        self.prices_source = ""
+        self.prices_timestamp: Optional[datetime] = None
+        self.cached_exchange: Dict[str, float] = {}
+        self.exchange_source = ""
+        self.exchange_timestamp: Optional[datetime] = None
+        
+        # Solo el worker líder ejecuta los jobs; el resto consume el snapshot publicado
+        self.leader_lock = FileLeaderLock(settings.SCHEDULER_LOCK_PATH)
+        # Seguidores: espera bloqueante del lock para tomar el liderazgo apenas se libera
+        self._leader_wait: Optional[asyncio.Task] = None
+        self._snapshot_mtime: Optional[float] = None
+        self._published_mtime: Optional[float] = None
+        self._published_seq = 0
         
         # Inicializar
-        self._load_last_update()
+        self._load_snapshot()
         self._setup_scheduler()
     
-    def _load_last_update(self):
-        """Cargar última actualización desde archivo"""
+    def _load_snapshot(self):
+        """Cargar el último snapshot válido; si falta o está corrupto, migrar los caches JSON"""
         try:
-            if os.path.exists("last_update.txt"):
-                with open("last_update.txt", "r") as f:
-                    timestamp_str = f.read().strip()
-                    self.last_update = datetime.fromisoformat(timestamp_str)
-                    logger.info(f"Última actualización cargada: {self.last_update}")
+            self._snapshot_mtime = os.path.getmtime(self.snapshot_file)
+            payload = read_checksummed(self.snapshot_file, _SNAPSHOT_MAGIC)
+            fields = _SNAPSHOT_BODY.unpack_from(payload, 0)
+            source_end = _SNAPSHOT_BODY.size + fields[-1]
+            source = payload[_SNAPSHOT_BODY.size:source_end].decode("utf-8")
+            prices_source = ""
+            if len(payload) >= source_end + _SNAPSHOT_STR_LEN.size:
+                (length,) = _SNAPSHOT_STR_LEN.unpack_from(payload, source_end)
+                start = source_end + _SNAPSHOT_STR_LEN.size
+                prices_source = payload[start:start + length].decode("utf-8")
+        except FileNotFoundError:
+            self._snapshot_mtime = None
+            self._load_legacy_cache()
+            return
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Snapshot de precios inválido, se usan los caches anteriores: {e}")
+            self._load_legacy_cache()
+            return
+        
+        last_update, prices_ts, exchange_ts = fields[0:3]
+        self.last_update = _from_ts(last_update)
+        self.prices_timestamp = _from_ts(prices_ts)
+        self.cached_prices = {
+            name: value for name, value in zip(_PRICE_FIELDS, fields[3:9]) if not math.isnan(value)
+        }
+        self.prices_source = prices_source
+        ars_usd, usd_ars = fields[9:11]
+        self.cached_exchange = {} if math.isnan(ars_usd) else {'ars_usd': ars_usd, 'usd_ars': usd_ars}
+        self.exchange_source = source
+        self.exchange_timestamp = _from_ts(exchange_ts)
+        logger.info(f"Snapshot de precios cargado (última actualización: {self.last_update})")
+    
+    def _load_legacy_cache(self):
+        """Leer los archivos JSON/texto que usaban las versiones anteriores"""
+        try:
+            if os.path.exists(_LEGACY_LAST_UPDATE):
+                with open(_LEGACY_LAST_UPDATE, "r") as f:
+                    self.last_update = datetime.fromisoformat(f.read().strip())
+            if os.path.exists(_LEGACY_PRICES_CACHE):
+                with open(_LEGACY_PRICES_CACHE, "r") as f:
+                    cache_data = json.load(f)
+                self.cached_prices = {k: float(v) for k, v in cache_data['prices'].items()}
+                self.prices_timestamp = datetime.fromisoformat(cache_data['timestamp'])
+            if os.path.exists(_LEGACY_EXCHANGE_CACHE):
+                with open(_LEGACY_EXCHANGE_CACHE, "r") as f:
+                    cache_data = json.load(f)
+                exchange = cache_data['exchange_rate']
+                self.cached_exchange = {'ars_usd': float(exchange['ars_usd']), 'usd_ars': float(exchange['usd_ars'])}
+                self.exchange_source = exchange.get('source', '')
+                self.exchange_timestamp = datetime.fromisoformat(cache_data['timestamp'])
+            if self.last_update:
+                logger.info(f"Última actualización cargada desde caches anteriores: {self.last_update}")
         except Exception as e:
-            logger.warning(f"Error cargando última actualización: {e}")
-            self.last_update = None
+            logger.warning(f"Error cargando caches anteriores: {e}")
     
-    def _save_last_update(self):
-        """Guardar última actualización en archivo"""
+    def _save_snapshot(self):
+        """Guardar precios, tipo de cambio y última actualización en un único archivo atómico"""
         try:
-            with open("last_update.txt", "w") as f:
-                f.write(datetime.now().isoformat())
-            logger.info("Última actualización guardada")
+            prices = [self.cached_prices.get(name, math.nan) for name in _PRICE_FIELDS]
+            source = self.exchange_source.encode("utf-8")[:0xFFFF]
+            prices_source = self.prices_source.encode("utf-8")[:0xFFFF]
+            payload = _SNAPSHOT_BODY.pack(
+                _to_ts(self.last_update), _to_ts(self.prices_timestamp), _to_ts(self.exchange_timestamp),
+                *prices,
+                self.cached_exchange.get('ars_usd', math.nan), self.cached_exchange.get('usd_ars', math.nan),
+                len(source)
+            ) + source + _SNAPSHOT_STR_LEN.pack(len(prices_source)) + prices_source
+            atomic_write_checksummed(self.snapshot_file, _SNAPSHOT_MAGIC, payload)
+            logger.info("Snapshot de precios guardado exitosamente")
         except Exception as e:
-            logger.error(f"Error guardando última actualización: {e}")
+            logger.error(f"Error guardando snapshot de precios: {e}")
     
     def _setup_scheduler(self):
         """Configurar programador de tareas"""
+        try:
+            # Todos los workers compiten periódicamente por el liderazgo (failover automático)
+            self.scheduler.add_job(
+                self.leader_election_job,
+                'interval',
+                seconds=settings.SCHEDULER_LEADER_POLL_SECONDS,
+                id="leader_election",
+                name="Elección de líder",
+                replace_existing=True
+            )
+            
+            logger.info("Programador de tareas configurado exitosamente")
+            
+        except Exception as e:
+            logger.error(f"Error configurando programador: {e}")
+    
+    def _setup_update_jobs(self):
+        """Agregar los jobs de actualización (solo en el worker líder)"""
         try:
             # Actualizar precios cada 12 horas (6:00 AM y 6:00 PM)
             self.scheduler.add_job(
@@ -85,10 +206,77 @@ class PriceUpdaterService:
                     name="Actualización inicial"
                 )
             
-            logger.info("Programador de tareas configurado exitosamente")
+            logger.info("Jobs de actualización programados en el worker líder")
             
         except Exception as e:
-            logger.error(f"Error configurando programador: {e}")
+            logger.error(f"Error programando jobs de actualización: {e}")
+    
+    async def leader_election_job(self):
+        """Tarea periódica de elección de líder"""
+        self._check_leadership()
+    
+    def _become_leader(self):
+        self._load_snapshot()
+        self._publish_cached_prices()
+        self._setup_update_jobs()
+    
+    def _start_leader_wait(self):
+        """Seguidor: espera el lock en segundo plano para no depender del próximo sondeo"""
+        if self._leader_wait is not None and not self._leader_wait.done():
+            return
+        try:
+            self._leader_wait = asyncio.get_running_loop().create_task(self._wait_for_leadership())
+        except RuntimeError:
+            # Sin event loop: solo queda el sondeo periódico
+            self._leader_wait = None
+    
+    async def _wait_for_leadership(self):
+        try:
+            if await self.leader_lock.wait_acquire():
+                logger.info("👑 Liderazgo tomado al liberarse el lock del líder anterior")
+                self._become_leader()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error esperando el liderazgo: {e}")
+    
+    def _check_leadership(self):
+        """Toma el liderazgo si está libre; si no, consume el snapshot publicado por el líder"""
+        if self.leader_lock.is_leader:
+            return
+        # Con la espera bloqueante activa, el lock lo toma ese hilo (otro flock del mismo
+        # proceso quedaría esperando el propio lock)
+        if self._leader_wait is None or self._leader_wait.done():
+            try:
+                if self.leader_lock.try_acquire():
+                    self._become_leader()
+                    return
+            except Exception as e:
+                logger.error(f"Error en elección de líder: {e}")
+            self._start_leader_wait()
+        
+        # Seguidor con tablas compartidas: leer el snapshot del líder sin tocar disco
+        if shared_tables.attached:
+            if shared_tables.snapshot_seq() != self._published_seq:
+                snapshot = shared_tables.read_snapshot()
+                if snapshot is not None:
+                    self._published_seq, values, factors, timestamp = snapshot
+                    price_events.publish(TOPIC_PRICES, values, factores=factors,
+                                         fuente="memoria_compartida", timestamp=timestamp)
+                    self._load_snapshot()
+                    return
+            if self._published_seq:
+                return
+        
+        # Seguidor sin tablas compartidas: publicar el snapshot cuando el líder reescribe el archivo
+        try:
+            mtime = os.path.getmtime(self.snapshot_file)
+        except OSError:
+            return
+        if mtime != self._published_mtime:
+            if mtime != self._snapshot_mtime:
+                self._load_snapshot()
+            self._publish_cached_prices()
     
     async def update_prices_job(self):
         """Tarea programada para actualizar precios"""
@@ -96,14 +284,15 @@ class PriceUpdaterService:
             logger.info("🔄 Iniciando actualización programada de precios...")
             
             # Actualizar precios de construcción
-            prices = await get_current_prices()
-            
-            # Guardar en cache
-            self._save_prices_cache(prices)
+            prices = await get_current_prices(force_refresh=True)
             
-            # Actualizar timestamp
+            # Guardar en el snapshot e historial
+            self.cached_prices = self._prices_to_dict(prices)
+            self.prices_source = prices.source
+            self.prices_timestamp = prices.last_updated
             self.last_update = datetime.now()
-            self._save_last_update()
+            self._save_snapshot()
+            self._append_prices_history(prices)
             
             logger.info(f"✅ Precios actualizados exitosamente: {prices}")
             
@@ -121,74 +310,101 @@ class PriceUpdaterService:
             # Actualizar tipo de cambio
             exchange_rate = await get_current_exchange_rate()
             
-            # Guardar en cache
-            self._save_exchange_cache(exchange_rate)
+            # Guardar en el snapshot e historial
+            self.cached_exchange = {'ars_usd': exchange_rate.ars_usd, 'usd_ars': exchange_rate.usd_ars}
+            self.exchange_source = exchange_rate.source
+            self.exchange_timestamp = exchange_rate.last_updated
+            self._save_snapshot()
+            self._append_exchange_history(exchange_rate)
             
             logger.info(f"✅ Tipo de cambio actualizado: {exchange_rate.ars_usd:.6f} ARS/USD")
             
+            price_events.publish(
+                TOPIC_EXCHANGE,
+                {'ars_usd': exchange_rate.ars_usd, 'usd_ars': exchange_rate.usd_ars},
+                fuente=exchange_rate.source,
+                timestamp=exchange_rate.last_updated
+            )
+            
         except Exception as e:
             logger.error(f"❌ Error en actualización programada de tipo de cambio: {e}")
     
-    def _save_prices_cache(self, prices):
-        """Guardar precios en cache"""
-        try:
-            cache_data = {
-                'timestamp': datetime.now().isoformat(),
-                'prices': {
-                    'steel_frame_m2': prices.steel_frame_m2,
-                    'industrial_m2': prices.industrial_m2,
-                    'container_m2': prices.container_m2,
-                    'materials_m2': prices.materials_m2,
-                    'labor_m2': prices.labor_m2,
-                    'finishes_m2': prices.finishes_m2
-                }
-            }
-            
-            with open(self.prices_cache_file, 'w') as f:
-                json.dump(cache_data, f, default=str)
-            
-            logger.info("Cache de precios guardado exitosamente")
-            
-        except Exception as e:
-            logger.error(f"Error guardando cache de precios: {e}")
+    def _append_prices_history(self, prices):
+        """Agregar los precios obtenidos al historial"""
+        price_history.append_many({
+            f'precio.{name}': value for name, value in self._prices_to_dict(prices).items()
+        }, prices.last_updated)
     
-    def _save_exchange_cache(self, exchange_rate):
-        """Guardar tipo de cambio en cache"""
-        try:
-            cache_data = {
-                'timestamp': datetime.now().isoformat(),
-                'exchange_rate': {
-                    'ars_usd': exchange_rate.ars_usd,
-                    'usd_ars': exchange_rate.usd_ars,
-                    'source': exchange_rate.source
-                }
-            }
-            
-            with open(self.exchange_cache_file, 'w') as f:
-                json.dump(cache_data, f, default=str)
-            
-            logger.info("Cache de tipo de cambio guardado exitosamente")
-            
-        except Exception as e:
-            logger.error(f"Error guardando cache de tipo de cambio: {e}")
+    def _append_exchange_history(self, exchange_rate):
+        """Agregar el tipo de cambio obtenido al historial"""
+        price_history.append_many({
+            'tipo_cambio.usd_ars': exchange_rate.usd_ars,
+            'tipo_cambio.ars_usd': exchange_rate.ars_usd
+        }, exchange_rate.last_updated)
     
     async def _notify_price_update(self, prices):
-        """Notificar a otros servicios sobre actualización de precios"""
+        """Publicar el nuevo snapshot de precios a los servicios suscriptos"""
         try:
-            # Aquí podrías implementar notificaciones a otros servicios
-            # Por ejemplo, WebSocket, Redis pub/sub, etc.
-            logger.info("📢 Notificando actualización de precios a otros servicios...")
-            
-            # Por ahora, solo logging
-            # En producción, implementar notificaciones reales
-            
+            self._publish_prices(self._prices_to_dict(prices), "actualizador", prices.last_updated)
         except Exception as e:
             logger.warning(f"Error notificando actualización: {e}")
     
+    def _publish_prices(self, values: Dict[str, float], fuente: str, timestamp: datetime):
+        """Publicar en el bus local y, si este worker es el líder, en las tablas compartidas"""
+        # Solo un relevamiento de mercado real corrige las cotizaciones; el resto publica sin factores
+        factors = self._market_factors(values) if self.prices_source in MARKET_PRICE_SOURCES else {}
+        price_events.publish(TOPIC_PRICES, values, factores=factors, fuente=fuente, timestamp=timestamp)
+        if self.leader_lock.is_leader:
+            shared_tables.write_snapshot(values, factors, timestamp)
+            self._published_seq = shared_tables.snapshot_seq()
+    
+    @staticmethod
+    def _prices_to_dict(prices) -> Dict[str, float]:
+        return {
+            'steel_frame_m2': prices.steel_frame_m2,
+            'industrial_m2': prices.industrial_m2,
+            'container_m2': prices.container_m2,
+            'materials_m2': prices.materials_m2,
+            'labor_m2': prices.labor_m2,
+            'finishes_m2': prices.finishes_m2
+        }
+    
+    @staticmethod
+    def _market_factors(values: Dict[str, float]) -> Dict[str, float]:
+        """Desvío del precio publicado respecto de lo que la calculadora ya cobra (1.0 = sin desvío)
+
+        La calculadora re-cotiza su libro desde CALCULATOR_BASE_PRICES_DATE con el índice de costo:
+        la referencia es el precio base por tipo a esa misma fecha, llevado a hoy con el mismo
+        índice, así el factor solo mide lo que el índice no explica.
+        """
+        base_date = settings.CALCULATOR_BASE_PRICES_DATE
+        book = argentina_api_service.base_price_book.current(base_date)
+        index_growth = cost_index.factor(base_date)
+        factors = {}
+        for tipo in ('steel_frame', 'industrial', 'container'):
+            base = book.get((tipo, 'total'))
+            value = values.get(f'{tipo}_m2')
+            if base and value:
+                factors[tipo] = value / (base * index_growth)
+        return factors
+    
+    def _publish_cached_prices(self):
+        """Publicar el último snapshot cargado (arranque sin esperar al próximo job)"""
+        self._published_mtime = self._snapshot_mtime
+        try:
+            if self.cached_prices:
+                self._publish_prices(self.cached_prices, self.snapshot_file, self.prices_timestamp or datetime.now())
+            if self.cached_exchange:
+                price_events.publish(TOPIC_EXCHANGE, self.cached_exchange,
+                                     fuente=self.exchange_source, timestamp=self.exchange_timestamp)
+        except Exception as e:
+            logger.warning(f"Error publicando snapshot de precios: {e}")
+    
     def start(self):
         """Iniciar el servicio de actualización"""
         try:
             if not self.scheduler.running:
+                self._check_leadership()
                 self.scheduler.start()
                 logger.info("🚀 Servicio de actualización de precios iniciado")
                 
@@ -203,9 +419,18 @@ class PriceUpdaterService:
     def stop(self):
         """Detener el servicio de actualización"""
         try:
+            if self._leader_wait is not None:
+                self._leader_wait.cancel()
+                self._leader_wait = None
             if self.scheduler.running:
                 self.scheduler.shutdown()
                 logger.info("🛑 Servicio de actualización de precios detenido")
+            if self.leader_lock.is_leader:
+                # Los jobs del líder se vuelven a programar si recupera el liderazgo
+                for job_id in ("update_prices", "update_exchange", "initial_update"):
+                    if self.scheduler.get_job(job_id):
+                        self.scheduler.remove_job(job_id)
+                self.leader_lock.release()
         except Exception as e:
             logger.error(f"Error deteniendo servicio de actualización: {e}")
     
@@ -213,6 +438,9 @@ class PriceUpdaterService:
         """Obtener estado del servicio"""
         return {
             'running': self.scheduler.running,
+            'leader': self.leader_lock.is_leader,
+            'leader_pid': self.leader_lock.leader_pid(),
+            'worker_pid': os.getpid(),
             'last_update': self.last_update.isoformat() if self.last_update else None,
             'next_update': self._get_next_update_time(),
             'jobs_count': len(self.scheduler.get_jobs()),
@@ -0,0 +1,137 @@
+"""
+Registro canónico de regiones (provincias) de Argentina
+Resuelve cualquier variante de nombre a un ID entero y alimenta las tablas de multiplicadores
+"""
+
+import csv
+import logging
+import math
+import os
+import re
+import unicodedata
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGIONS_PATH = os.path.join(os.path.dirname(__file__), "data", "regiones.csv")
+
+# Tablas de multiplicadores y su valor por defecto para regiones sin dato
+MULTIPLIER_DEFAULTS = {
+    "cotizacion": 1.0,   # ConstructionCalculator (costo total de obra)
+    "materiales": 1.0,   # PriceService (precios de materiales)
+    "argentina": 0.90,   # ArgentinaAPIService (precios de APIs de Argentina)
+    "factor_vial": 1.25, # Distancia por ruta / distancia en línea recta (costo de transporte)
+}
+
+# Textos distintos resueltos que se recuerdan por registro (alias escritos por los usuarios)
+_RESOLVE_CACHE_MAX_ENTRIES = 4096
+
+_SEPARATORS_RE = re.compile(r"[\s_\-.,/]+")
+_PREFIXES = ("provincia de ", "provincia del ", "pcia de ", "prov de ")
+
+
+def normalize_region_key(text: str) -> str:
+    """Minúsculas, sin acentos, separadores unificados a espacio y sin prefijo 'provincia de'"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = _SEPARATORS_RE.sub(" ", text).strip()
+    for prefix in _PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    return text
+
+
+@dataclass
+class Region:
+    """Región canónica"""
+    id: int
+    slug: str
+    nombre: str
+
+
+class RegionRegistry:
+    """Registro de regiones con índice de alias precalculado (búsqueda O(1))"""
+
+    def __init__(self):
+        self.regions: List[Region] = []
+        self._alias_index: Dict[str, int] = {}
+        self._multipliers: Dict[str, array] = {name: array("d") for name in MULTIPLIER_DEFAULTS}
+        # Cache de resolve() propio de la instancia: se vacía al cambiar las regiones
+        self._resolve_cache: Dict[str, Optional[int]] = {}
+
+    def load_csv(self, path: str):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                aliases = [a for a in (row.get("alias") or "").split("|") if a]
+                multipliers = {
+                    name: float(row[name]) if row.get(name) else None
+                    for name in MULTIPLIER_DEFAULTS
+                }
+                self.add(row["slug"], row["nombre"], aliases, multipliers)
+        self._resolve_cache.clear()
+        logger.info(f"🗺️ Registro de regiones: {len(self.regions)} regiones, {len(self._alias_index)} alias")
+
+    def add(self, slug: str, nombre: str, aliases: List[str], multipliers: Dict[str, Optional[float]]):
+        region = Region(id=len(self.regions), slug=slug, nombre=nombre)
+        self.regions.append(region)
+        for alias in [slug, nombre, *aliases]:
+            key = normalize_region_key(alias)
+            existing = self._alias_index.get(key)
+            if existing is not None and existing != region.id:
+                logger.warning(f"Alias de región duplicado '{alias}' ({self.regions[existing].slug} / {slug})")
+                continue
+            self._alias_index[key] = region.id
+        for name, values in self._multipliers.items():
+            value = multipliers.get(name)
+            values.append(math.nan if value is None else value)
+        self._resolve_cache.clear()
+
+    def resolve(self, text: str) -> Optional[int]:
+        """ID de región para cualquier variante de nombre (None si no se reconoce)"""
+        try:
+            return self._resolve_cache[text]
+        except KeyError:
+            pass
+        if len(self._resolve_cache) >= _RESOLVE_CACHE_MAX_ENTRIES:
+            self._resolve_cache.clear()
+        region_id = self._resolve_cache[text] = self._alias_index.get(normalize_region_key(text))
+        return region_id
+
+    def get(self, region_id: int) -> Region:
+        return self.regions[region_id]
+
+    def find(self, text: str) -> Optional[Region]:
+        region_id = self.resolve(text) if text else None
+        return self.regions[region_id] if region_id is not None else None
+
+    def multiplier(self, table: str, region: Optional[str], default: Optional[float] = None) -> float:
+        """Multiplicador de una tabla para una región (por nombre, slug o alias)"""
+        if default is None:
+            default = MULTIPLIER_DEFAULTS[table]
+        region_id = self.resolve(region) if region else None
+        if region_id is None:
+            return default
+        value = self._multipliers[table][region_id]
+        return default if math.isnan(value) else value
+
+    def multipliers(self, table: str) -> Dict[str, float]:
+        """Tabla completa de multiplicadores por slug (solo regiones con dato)"""
+        values = self._multipliers[table]
+        return {
+            region.slug: values[region.id]
+            for region in self.regions
+            if not math.isnan(values[region.id])
+        }
+
+
+def load_region_registry() -> RegionRegistry:
+    registry = RegionRegistry()
+    registry.load_csv(DEFAULT_REGIONS_PATH)
+    return registry
+
+
+# Instancia global del registro
+region_registry = load_region_registry()
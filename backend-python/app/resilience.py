@@ -0,0 +1,129 @@
+"""
+Control de carga hacia servicios externos
+Limitador de concurrencia adaptativo (AIMD) y circuit breaker, sin dependencias externas
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+
+class AIMDLimiter:
+    """Concurrencia adaptativa: +1 por cada `limit` respuestas sanas, /2 ante sobrecarga"""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float,
+                 backoff_ratio: float = 0.5):
+        self.limit = float(initial)
+        self.min_limit = minimum
+        self.max_limit = maximum
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.inflight = 0
+        self.waiting = 0
+        self.increases = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    async def __aenter__(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.inflight < int(self.limit))
+            finally:
+                self.waiting -= 1
+            self.inflight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.inflight -= 1
+            self._condition.notify_all()
+
+    def record(self, latency: float, overloaded: bool):
+        """Ajusta el límite según el resultado de una llamada (429/5xx, timeout o latencia alta = sobrecarga)"""
+        if overloaded or latency > self.latency_target:
+            now = time.monotonic()
+            # Una sola reducción por ventana: las fallas simultáneas de un mismo pico cuentan una vez
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                self._last_decrease = now
+                self.decreases += 1
+        elif self.limit < self.max_limit:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.increases += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "limit_exact": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "latency_target_ms": round(self.latency_target * 1000)
+        }
+
+
+class CircuitBreaker:
+    """Circuito cerrado → abierto tras N fallas seguidas → semiabierto (una prueba) al vencer la espera"""
+
+    CLOSED = "cerrado"
+    OPEN = "abierto"
+    HALF_OPEN = "semiabierto"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_inflight = False
+
+    def retry_after(self) -> float:
+        """Segundos hasta que el circuito deje pasar una prueba (0 si ya deja pasar llamadas)"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Indica si una llamada puede salir; en semiabierto deja pasar solo una prueba a la vez"""
+        if self.state == self.OPEN and self.retry_after() == 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_inflight:
+            self._probe_inflight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._probe_inflight = False
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_inflight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
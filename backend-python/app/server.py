@@ -0,0 +1,48 @@
+"""
+Lanzador del servidor de producción
+Uno o varios workers de uvicorn; con varios workers crea antes las tablas de precios compartidas
+Uso: python -m app.server
+"""
+
+import logging
+import os
+
+import uvicorn
+
+from .config import settings
+from .material_catalog import material_catalog
+from .shared_tables import shared_tables
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_count() -> int:
+    """Un worker por núcleo disponible para este proceso (respeta cpusets de contenedores)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def main():
+    workers = settings.WEB_CONCURRENCY or default_worker_count()
+    logger.info(f"🚀 Iniciando servidor con {workers} worker(s) en {settings.HOST}:{settings.PORT}")
+
+    if workers > 1:
+        # Los workers se conectan al segmento al iniciar; el lanzador lo elimina al salir
+        shared_tables.create(material_catalog)
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            workers=workers,
+            log_level="info"
+        )
+    finally:
+        shared_tables.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,206 @@
+"""
+Tablas de precios compartidas entre workers (multiprocessing.shared_memory)
+El proceso lanzador crea el segmento una vez; cada worker lo mapea y lee sin copiar
+las columnas de precios del catálogo y el último snapshot de precios publicado.
+Solo se comparten los precios (lo que cambia en caliente y debe verse igual en todos los
+workers); nombres, detalles e índices del catálogo los carga cada worker del CSV
+"""
+
+import hashlib
+import logging
+import math
+import struct
+from datetime import datetime
+from multiprocessing import shared_memory, resource_tracker
+from typing import Dict, List, Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"CTZSHM01"
+# magic, seq del snapshot, timestamp del snapshot, capacidad y filas del catálogo,
+# huella de los IDs del catálogo, versión del catálogo
+_HEADER = struct.Struct("<8sQdQQQQ")
+_HEADER_SIZE = 64
+_SEQ_OFFSET = 8
+_CATALOG_VERSION_OFFSET = 48
+
+# Valores del snapshot de precios, en orden fijo (NaN = sin dato)
+SNAPSHOT_FIELDS = (
+    "steel_frame_m2", "industrial_m2", "container_m2", "materials_m2", "labor_m2", "finishes_m2",
+    "factor.steel_frame", "factor.industrial", "factor.container",
+)
+_SNAPSHOT_OFFSET = _HEADER_SIZE
+_CATALOG_OFFSET = _SNAPSHOT_OFFSET + 8 * len(SNAPSHOT_FIELDS)
+_MAX_READ_RETRIES = 10000
+
+
+def catalog_fingerprint(ids: List[str]) -> int:
+    """Huella del orden de filas del catálogo: los workers solo comparten si coincide"""
+    digest = hashlib.blake2b("\n".join(ids).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class SharedPriceTables:
+    """Segmento de memoria compartida con el snapshot de precios y los precios del catálogo"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._owner = False
+        self._views: List[memoryview] = []
+        self._snapshot: Optional[memoryview] = None
+
+    @property
+    def attached(self) -> bool:
+        return self._shm is not None
+
+    def create(self, catalog) -> "SharedPriceTables":
+        """Crea el segmento con el catálogo actual (lo llama el proceso lanzador antes de los workers)"""
+        ids = catalog.ids()
+        capacity = len(ids)
+        size = _CATALOG_OFFSET + 16 * capacity
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # Segmento huérfano de una ejecución anterior que no terminó limpio
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        self._owner = True
+
+        _HEADER.pack_into(self._shm.buf, 0, _MAGIC, 0, 0.0, capacity, capacity,
+                          catalog_fingerprint(ids), 0)
+        self._map()
+        for i in range(len(SNAPSHOT_FIELDS)):
+            self._snapshot[i] = math.nan
+        ars, usd = self.catalog_columns()
+        for row, material_id in enumerate(ids):
+            precio_ars = catalog.get_price_ars(material_id)
+            precio_usd = catalog.get_price_usd(material_id)
+            ars[row] = math.nan if precio_ars is None else precio_ars
+            usd[row] = math.nan if precio_usd is None else precio_usd
+        logger.info(f"🧠 Tablas compartidas '{self.name}' creadas: {size} bytes, {capacity} materiales")
+        return self
+
+    def attach(self) -> bool:
+        """Mapea un segmento existente; retorna False si no hay (modo de un solo proceso)"""
+        if self._shm is not None:
+            return True
+        # Los workers lanzados por server.py heredan el resource tracker del lanzador, que es
+        # quien elimina el segmento; un proceso ajeno tendría su propio tracker y en Python < 3.13
+        # lo borraría al salir, así que en ese caso se quita el registro
+        inherited_tracker = resource_tracker._resource_tracker._fd is not None
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        if not inherited_tracker:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        if bytes(shm.buf[:len(_MAGIC)]) != _MAGIC:
+            logger.warning(f"Segmento compartido '{self.name}' con formato desconocido: se ignora")
+            shm.close()
+            return False
+        self._shm = shm
+        self._map()
+        logger.info(f"🧠 Worker conectado a las tablas compartidas '{self.name}'")
+        return True
+
+    def _map(self):
+        buf = self._shm.buf
+        self._snapshot = buf[_SNAPSHOT_OFFSET:_CATALOG_OFFSET].cast("d")
+        self._views.append(self._snapshot)
+
+    def _header(self) -> tuple:
+        return _HEADER.unpack_from(self._shm.buf, 0)
+
+    def _seq(self) -> int:
+        return struct.unpack_from("<Q", self._shm.buf, _SEQ_OFFSET)[0]
+
+    # --- Catálogo ---
+
+    def catalog_fingerprint(self) -> int:
+        return self._header()[5]
+
+    def catalog_columns(self) -> Tuple[memoryview, memoryview]:
+        """Vistas float64 (sin copia) de las columnas de precios ARS y USD del catálogo"""
+        _, _, _, capacity, rows, _, _ = self._header()
+        ars = self._shm.buf[_CATALOG_OFFSET:_CATALOG_OFFSET + 8 * rows].cast("d")
+        usd_offset = _CATALOG_OFFSET + 8 * capacity
+        usd = self._shm.buf[usd_offset:usd_offset + 8 * rows].cast("d")
+        self._views.extend((ars, usd))
+        return ars, usd
+
+    def catalog_version(self) -> int:
+        return struct.unpack_from("<Q", self._shm.buf, _CATALOG_VERSION_OFFSET)[0]
+
+    def bump_catalog_version(self):
+        # Incremento no atómico entre procesos: alcanza para invalidar ETags, no para contar
+        struct.pack_into("<Q", self._shm.buf, _CATALOG_VERSION_OFFSET, self.catalog_version() + 1)
+
+    # --- Snapshot de precios (seqlock: seq impar mientras se escribe) ---
+
+    def snapshot_seq(self) -> int:
+        return self._seq() if self._shm is not None else 0
+
+    def write_snapshot(self, values: Dict[str, float], factors: Dict[str, float], timestamp: datetime):
+        """Publica un snapshot para todos los workers (solo lo escribe el líder)"""
+        if self._shm is None:
+            return
+        seq = self._seq() | 1
+        struct.pack_into("<Q", self._shm.buf, _SEQ_OFFSET, seq)
+        for i, field in enumerate(SNAPSHOT_FIELDS):
+            if field.startswith("factor."):
+                value = factors.get(field[len("factor."):])
+            else:
+                value = values.get(field)
+            self._snapshot[i] = math.nan if value is None else float(value)
+        struct.pack_into("<d", self._shm.buf, _SEQ_OFFSET + 8, timestamp.timestamp())
+        struct.pack_into("<Q", self._shm.buf, _SEQ_OFFSET, seq + 1)
+
+    def read_snapshot(self) -> Optional[Tuple[int, Dict[str, float], Dict[str, float], datetime]]:
+        """Lee un snapshot consistente: (seq, valores, factores, timestamp); None si no hay"""
+        if self._shm is None:
+            return None
+        for _ in range(_MAX_READ_RETRIES):
+            seq = self._seq()
+            if seq == 0:
+                return None
+            if seq & 1:
+                continue
+            raw = self._snapshot.tolist()
+            timestamp = struct.unpack_from("<d", self._shm.buf, _SEQ_OFFSET + 8)[0]
+            if self._seq() == seq:
+                break
+        else:
+            # Escritor caído a mitad de una escritura: no hay snapshot consistente
+            return None
+
+        values, factors = {}, {}
+        for field, value in zip(SNAPSHOT_FIELDS, raw):
+            if math.isnan(value):
+                continue
+            if field.startswith("factor."):
+                factors[field[len("factor."):]] = value
+            else:
+                values[field] = value
+        return seq, values, factors, datetime.fromtimestamp(timestamp)
+
+    def close(self):
+        """Libera las vistas y el mapeo; el dueño además elimina el segmento"""
+        if self._shm is None:
+            return
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        self._snapshot = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+        self._shm = None
+
+
+# Instancia global (sin conectar hasta attach/create)
+shared_tables = SharedPriceTables(settings.SHARED_TABLES_NAME)
@@ -0,0 +1,320 @@
+"""
+Servidor SMTP local que acepta y descarta los emails (sink) para pruebas de carga
+Habla lo necesario de SMTP para smtplib (EHLO, AUTH PLAIN/LOGIN, STARTTLS, MAIL, RCPT, DATA),
+con TLS implícito o STARTTLS opcional y latencia, rechazos y cortes de conexión configurables.
+Cuenta conexiones, handshakes TLS y mensajes para medir el costo de conexión por email.
+
+Uso:
+    python -m app.smtp_sink --puerto 2525 --tls ssl --latencia-ms 150 --tasa-fallas 0.02
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_USE_SSL=true python -m app.server
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TLS_MODES = ("none", "starttls", "ssl")
+
+
+@dataclass
+class SmtpSinkConfig:
+    """Comportamiento del sink"""
+    tls: str = "none"
+    cert_file: Optional[str] = None
+    key_file: Optional[str] = None
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    connect_latency_ms: float = 0.0
+    failure_rate: float = 0.0
+    failure_code: int = 451
+    drop_rate: float = 0.0
+    max_message_bytes: int = 25 * 1024 * 1024
+    save_dir: Optional[str] = None
+
+
+def self_signed_context() -> ssl.SSLContext:
+    """Contexto TLS con un certificado autofirmado para localhost (requiere el comando openssl)"""
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    with tempfile.TemporaryDirectory(prefix="smtp_sink_") as directory:
+        cert_file = os.path.join(directory, "cert.pem")
+        key_file = os.path.join(directory, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=localhost", "-keyout", key_file, "-out", cert_file],
+            check=True, capture_output=True
+        )
+        context.load_cert_chain(cert_file, key_file)
+    return context
+
+
+class SmtpSink:
+    """Servidor SMTP asyncio; cada conexión se atiende en su propia corrutina"""
+
+    def __init__(self, config: Optional[SmtpSinkConfig] = None):
+        self.config = config or SmtpSinkConfig()
+        if self.config.tls not in TLS_MODES:
+            raise ValueError(f"Modo TLS inválido: {self.config.tls} (opciones: {', '.join(TLS_MODES)})")
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        if self.config.tls != "none":
+            if self.config.cert_file:
+                self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+                self.ssl_context.load_cert_chain(self.config.cert_file, self.config.key_file)
+            else:
+                self.ssl_context = self_signed_context()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections = 0
+        self.active_connections = 0
+        self.max_active_connections = 0
+        self.tls_handshakes = 0
+        self.auths = 0
+        self.messages_accepted = 0
+        self.messages_rejected = 0
+        self.connections_dropped = 0
+        self.bytes_received = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 2525) -> int:
+        """Empieza a escuchar; retorna el puerto (útil con port=0)"""
+        self.server = await asyncio.start_server(
+            self._handle, host, port,
+            ssl=self.ssl_context if self.config.tls == "ssl" else None
+        )
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "config": {k: v for k, v in asdict(self.config).items() if k not in ("cert_file", "key_file")},
+            "connections": self.connections,
+            "active_connections": self.active_connections,
+            "max_active_connections": self.max_active_connections,
+            "tls_handshakes": self.tls_handshakes,
+            "auths": self.auths,
+            "messages_accepted": self.messages_accepted,
+            "messages_rejected": self.messages_rejected,
+            "connections_dropped": self.connections_dropped,
+            "bytes_received": self.bytes_received,
+            "messages_per_connection": round(self.messages_accepted / self.connections, 2) if self.connections else None
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self.active_connections += 1
+        self.max_active_connections = max(self.max_active_connections, self.active_connections)
+        if self.config.tls == "ssl":
+            self.tls_handshakes += 1
+        try:
+            await self._session(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError) as e:
+            logger.debug(f"Conexión SMTP cerrada: {e}")
+        finally:
+            self.active_connections -= 1
+            writer.close()
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        config = self.config
+
+        async def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        async def read_line() -> str:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionResetError("el cliente cerró la conexión")
+            return line.decode("utf-8", "replace").rstrip("\r\n")
+
+        if config.connect_latency_ms:
+            await asyncio.sleep(config.connect_latency_ms / 1000)
+        await reply("220 localhost ESMTP sink")
+        tls_active = config.tls == "ssl"
+        mail_from: Optional[str] = None
+        recipients = 0
+
+        while True:
+            line = await read_line()
+            command, _, argument = line.partition(" ")
+            command = command.upper()
+
+            if command == "EHLO":
+                capabilities = [f"SIZE {config.max_message_bytes}", "8BITMIME", "AUTH PLAIN LOGIN"]
+                if config.tls == "starttls" and not tls_active:
+                    capabilities.append("STARTTLS")
+                writer.write(b"250-localhost\r\n")
+                for capability in capabilities[:-1]:
+                    writer.write(f"250-{capability}\r\n".encode())
+                await reply(f"250 {capabilities[-1]}")
+            elif command == "HELO":
+                await reply("250 localhost")
+            elif command == "STARTTLS":
+                if config.tls != "starttls" or tls_active:
+                    await reply("503 STARTTLS no disponible")
+                    continue
+                await reply("220 Listo para TLS")
+                await writer.start_tls(self.ssl_context)
+                self.tls_handshakes += 1
+                tls_active = True
+                mail_from, recipients = None, 0
+            elif command == "AUTH":
+                mechanism, _, initial = argument.partition(" ")
+                mechanism = mechanism.upper()
+                if mechanism == "PLAIN":
+                    if not initial:
+                        await reply("334 ")
+                        await read_line()
+                elif mechanism == "LOGIN":
+                    await reply("334 " + base64.b64encode(b"Username:").decode())
+                    await read_line()
+                    await reply("334 " + base64.b64encode(b"Password:").decode())
+                    await read_line()
+                else:
+                    await reply("504 Mecanismo no soportado")
+                    continue
+                self.auths += 1
+                await reply("235 Autenticado")
+            elif command == "MAIL":
+                mail_from, recipients = argument, 0
+                await reply("250 OK")
+            elif command == "RCPT":
+                if mail_from is None:
+                    await reply("503 Falta MAIL FROM")
+                    continue
+                recipients += 1
+                await reply("250 OK")
+            elif command == "DATA":
+                if not recipients:
+                    await reply("503 Falta RCPT TO")
+                    continue
+                await reply("354 Terminar con <CRLF>.<CRLF>")
+                message = await self._read_data(reader)
+                mail_from, recipients = None, 0
+                if not await self._deliver(message, reply):
+                    return
+            elif command == "RSET":
+                mail_from, recipients = None, 0
+                await reply("250 OK")
+            elif command == "NOOP":
+                await reply("250 OK")
+            elif command == "QUIT":
+                await reply("221 Adiós")
+                return
+            else:
+                await reply("502 Comando no implementado")
+
+    async def _read_data(self, reader: asyncio.StreamReader) -> bytes:
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionResetError("conexión cerrada durante DATA")
+            if line in (b".\r\n", b".\n"):
+                break
+            # Dot-stuffing (RFC 5321 4.5.2)
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        message = b"".join(lines)
+        self.bytes_received += len(message)
+        return message
+
+    async def _deliver(self, message: bytes, reply) -> bool:
+        """Responde al fin de DATA según la configuración; False si la conexión se corta"""
+        config = self.config
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if config.drop_rate and random.random() < config.drop_rate:
+            self.connections_dropped += 1
+            return False
+        if len(message) > config.max_message_bytes:
+            self.messages_rejected += 1
+            await reply("552 Mensaje demasiado grande")
+        elif config.failure_rate and random.random() < config.failure_rate:
+            self.messages_rejected += 1
+            await reply(f"{config.failure_code} Falla simulada")
+        else:
+            self.messages_accepted += 1
+            if config.save_dir:
+                path = os.path.join(config.save_dir, f"{self.messages_accepted:06d}.eml")
+                await asyncio.to_thread(self._save, path, message)
+            await reply("250 OK: mensaje aceptado")
+        return True
+
+    @staticmethod
+    def _save(path: str, message: bytes):
+        with open(path, "wb") as f:
+            f.write(message)
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """Opciones de comportamiento compartidas con el benchmark"""
+    parser.add_argument("--tls", choices=TLS_MODES, default="none",
+                        help="ssl = TLS implícito (como el puerto 465), starttls = TLS negociado")
+    parser.add_argument("--cert", default=None, help="Certificado PEM (por defecto se genera uno autofirmado)")
+    parser.add_argument("--key", default=None, help="Clave privada PEM del certificado")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Demora antes de aceptar cada mensaje")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Variación uniforme de la demora (±)")
+    parser.add_argument("--latencia-conexion-ms", type=float, default=0.0, help="Demora del saludo de cada conexión")
+    parser.add_argument("--tasa-fallas", type=float, default=0.0, help="Fracción de mensajes rechazados (0-1)")
+    parser.add_argument("--codigo-falla", type=int, default=451, help="Código SMTP de los rechazos simulados")
+    parser.add_argument("--tasa-cortes", type=float, default=0.0, help="Fracción de mensajes en los que se corta la conexión")
+
+
+def config_from_args(args: argparse.Namespace) -> SmtpSinkConfig:
+    return SmtpSinkConfig(
+        tls=args.tls,
+        cert_file=args.cert,
+        key_file=args.key,
+        latency_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        connect_latency_ms=args.latencia_conexion_ms,
+        failure_rate=args.tasa_fallas,
+        failure_code=args.codigo_falla,
+        drop_rate=args.tasa_cortes
+    )
+
+
+async def serve(sink: SmtpSink, host: str, port: int):
+    port = await sink.start(host, port)
+    logger.info(f"📭 SMTP sink en {host}:{port} (TLS: {sink.config.tls})")
+    try:
+        while True:
+            await asyncio.sleep(30)
+            logger.info(f"📊 {sink.status()}")
+    finally:
+        await sink.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.smtp_sink", description="SMTP local que descarta los emails")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=2525)
+    parser.add_argument("--guardar", default=None, help="Directorio donde guardar los mensajes aceptados (.eml)")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    if args.guardar:
+        os.makedirs(args.guardar, exist_ok=True)
+        config.save_dir = args.guardar
+    try:
+        asyncio.run(serve(SmtpSink(config), args.host, args.puerto))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
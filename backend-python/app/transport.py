@@ -0,0 +1,120 @@
+"""
+Costo de transporte desde las plantas de Sumpetrol
+Matriz de distancias localidad x planta precalculada al iniciar (haversine x factor vial)
+"""
+
+import logging
+import math
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+
+from .config import settings
+from .gazetteer import gazetteer, Gazetteer
+from .regions import region_registry
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+
+@dataclass(frozen=True)
+class Plant:
+    """Planta de fabricación / despacho"""
+    id: str
+    nombre: str
+    direccion: str
+    lat: float
+    lon: float
+
+
+PLANTS = (
+    Plant("lujan-de-cuyo", "Planta Luján de Cuyo", "Acceso Sur - Lateral Este 4585, Luján de Cuyo, Mendoza",
+          -33.005, -68.862),
+    Plant("cipolletti", "Planta Cipolletti", "Vicente Lazaretti 903 - Cipolletti, Río Negro",
+          -38.940, -67.985),
+)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia en línea recta (círculo máximo) en km"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class TransportMatrix:
+    """Distancias por ruta de cada localidad a cada planta, en arreglos compactos"""
+
+    def __init__(self, localities: Gazetteer, plants=PLANTS):
+        self.plants = plants
+        count = len(localities.localities)
+        # Fila por localidad, columna por planta (float32 alcanza para km)
+        self._road_km = array("f", bytes(4 * count * len(plants)))
+        self._nearest = array("B", bytes(count))
+        # Provincia sin localidad: se usa la primera localidad de la provincia en el CSV (su capital)
+        self._region_locality: Dict[int, int] = {}
+
+        for locality in localities.localities:
+            road_factor = region_registry.multiplier("factor_vial", locality.provincia)
+            base = locality.id * len(plants)
+            best = 0
+            for j, plant in enumerate(plants):
+                km = haversine_km(locality.lat, locality.lon, plant.lat, plant.lon) * road_factor
+                self._road_km[base + j] = km
+                if km < self._road_km[base + best]:
+                    best = j
+            self._nearest[locality.id] = best
+            self._region_locality.setdefault(locality.region_id, locality.id)
+
+        logger.info(f"🚚 Matriz de transporte: {count} localidades x {len(plants)} plantas")
+
+    def nearest(self, ciudad: Optional[str], provincia: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Planta más cercana y distancia por ruta (O(1) sobre la matriz)"""
+        locality = gazetteer.resolve(ciudad, provincia)
+        if locality is None:
+            region_id = region_registry.resolve(provincia) if provincia else None
+            locality_id = self._region_locality.get(region_id)
+            if locality_id is None:
+                return None
+            locality = gazetteer.localities[locality_id]
+
+        plant_index = self._nearest[locality.id]
+        return {
+            "planta": self.plants[plant_index],
+            "localidad": locality.nombre,
+            "distancia_km": self._road_km[locality.id * len(self.plants) + plant_index]
+        }
+
+    def estimate(self, ciudad: Optional[str], provincia: Optional[str],
+                 square_meters: float) -> Optional[Dict[str, Any]]:
+        """Línea de transporte de una cotización: camiones necesarios x km x tarifa"""
+        route = self.nearest(ciudad, provincia)
+        if route is None:
+            return None
+        trucks = max(1, math.ceil(square_meters / settings.TRANSPORT_M2_PER_TRUCK))
+        cost = trucks * route["distancia_km"] * settings.TRANSPORT_COST_PER_KM_USD
+        plant: Plant = route["planta"]
+        return {
+            "plant": plant.nombre,
+            "plant_address": plant.direccion,
+            "destination": route["localidad"],
+            "distance_km": round(route["distancia_km"]),
+            "trucks": trucks,
+            "cost": round(cost, 2)
+        }
+
+
+# Instancia global de la matriz de transporte
+transport_matrix = TransportMatrix(gazetteer)
+
+
+def estimate_transport_line(ciudad: Optional[str], provincia: Optional[str],
+                            square_meters: float) -> Tuple[Optional[Dict[str, Any]], float]:
+    """Línea de transporte lista para cotizaciones, PDF y email (costo formateado) y su costo en USD"""
+    transport = transport_matrix.estimate(ciudad, provincia, square_meters)
+    if transport is None:
+        return None, 0.0
+    return {**transport, "cost": f"U$D {transport['cost']:,.0f}"}, transport["cost"]
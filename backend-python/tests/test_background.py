@@ -0,0 +1,97 @@
+"""
+Cola de tareas en segundo plano: pasada la marca de agua alta solo entra el trabajo esencial,
+y la API responde 503 con Retry-After en lugar de acumular trabajo o perder contactos
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import jobs as jobs_module
+from app import main as main_module
+from app.background import BackgroundJobRunner, BackgroundQueueFullError
+from app.config import settings
+
+CONTACTO = {"nombre": "Ana", "email": "ana@example.com", "telefono": "11 1234 5678", "mensaje": "Hola"}
+
+
+def test_runner_sheds_non_essential_work_at_the_high_water_mark():
+    runner = BackgroundJobRunner(max_concurrency=1, default_timeout=5, high_water_mark=2, max_queued=3)
+
+    async def run():
+        release = asyncio.Event()
+        for _ in range(2):
+            runner.submit(release.wait)
+        with pytest.raises(BackgroundQueueFullError):
+            runner.submit(release.wait)
+        # Lo esencial entra hasta el máximo absoluto
+        runner.submit(release.wait, essential=True)
+        with pytest.raises(BackgroundQueueFullError):
+            runner.submit(release.wait, essential=True)
+        stats = runner.stats()
+
+        release.set()
+        await runner.shutdown(grace=1)
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["shedding"]
+    assert stats["rejected"] == 2
+    assert stats["submitted"] == 3
+    assert runner.completed == 3
+    assert runner.accepting()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    saved = []
+
+    async def save_data_to_nocodb(data_type, data):
+        saved.append((data_type, data))
+        return True
+
+    monkeypatch.setattr(main_module, "save_data_to_nocodb", save_data_to_nocodb)
+    client = TestClient(main_module.app)
+    client.saved = saved
+    return client
+
+
+def use_runner(monkeypatch, high_water_mark: int, max_queued: int) -> BackgroundJobRunner:
+    runner = BackgroundJobRunner(1, 5, high_water_mark, max_queued)
+    monkeypatch.setattr(main_module, "background_jobs", runner)
+    monkeypatch.setattr(jobs_module, "background_jobs", runner)
+    return runner
+
+
+def test_contact_is_accepted_but_the_email_gets_503_above_the_high_water_mark(client, monkeypatch):
+    runner = use_runner(monkeypatch, high_water_mark=0, max_queued=1)
+
+    response = client.post("/contacto/enviar", json=CONTACTO)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.BACKGROUND_RETRY_AFTER_SECONDS)
+    assert runner.submitted == 1
+    assert runner.rejected == 1
+
+
+def test_contact_is_saved_inline_when_the_queue_is_full(client, monkeypatch):
+    use_runner(monkeypatch, high_water_mark=0, max_queued=0)
+
+    response = client.post("/contacto/enviar", json=CONTACTO)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.BACKGROUND_RETRY_AFTER_SECONDS)
+    assert [(kind, data["email"]) for kind, data in client.saved] == [("contact", "ana@example.com")]
+
+
+def test_quote_email_job_is_rejected_with_retry_after(client, monkeypatch):
+    use_runner(monkeypatch, high_water_mark=0, max_queued=0)
+    created = jobs_module.job_store.created
+
+    response = client.post("/cotizar/enviar-email", json={"nombre": "Ana", "email": "ana@example.com"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.BACKGROUND_RETRY_AFTER_SECONDS)
+    # El trabajo rechazado no queda registrado
+    assert jobs_module.job_store.created == created
@@ -0,0 +1,101 @@
+"""
+Deduplicación de contactos: un cliente que vuelve antes de que su alta llegue a NocoDB
+(incluso desde otro worker) actualiza esa alta pendiente en lugar de crear otra fila
+"""
+
+import asyncio
+
+import pytest
+
+from app import nocodb_service as nocodb_service_module
+from app.config import settings
+from app.customer_index import PENDING_INSERT_FIELD, normalize_phone
+from app.nocodb_service import NocodbService
+from app.outbox import Outbox
+
+
+class FakeWriter:
+    """Reemplaza al BulkWriteBatcher: registra los registros enviados y asigna Ids correlativos"""
+
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def add(self, record):
+        self.sent.append(record)
+        return {"Id": 100 + len(self.sent)}
+
+
+@pytest.fixture
+def log(tmp_path):
+    return Outbox(str(tmp_path / "outbox.jsonl"), segment_bytes=10 ** 9)
+
+
+@pytest.fixture
+def make_service(monkeypatch, tmp_path, log):
+    monkeypatch.setattr(settings, "NOCODB_REPLICA_DIR", str(tmp_path / "replica"))
+    monkeypatch.setattr(settings, "NOCODB_IDEMPOTENCY_FIELD", None)
+    monkeypatch.setattr(nocodb_service_module, "outbox", log)
+    return NocodbService
+
+
+def save(service: NocodbService, **customer) -> bool:
+    return asyncio.run(service.save_customer_data({"nombre": "Ana", **customer}))
+
+
+def deliver(service: NocodbService, sent: list):
+    writer = FakeWriter(sent)
+    service._writers = {"contactos": writer, "contactos_actualizacion": writer}
+    try:
+        asyncio.run(service._process_outbox())
+    finally:
+        service.outbox_lock.release()
+
+
+def test_phone_formats_share_one_key():
+    keys = {normalize_phone(phone) for phone in ("011 15 1234-5678", "+54 9 11 1234 5678", "11 1234 5678")}
+    assert keys == {"+5491112345678"}
+
+
+def test_returning_customer_updates_the_pending_insert(make_service, log):
+    first_worker, second_worker = make_service(), make_service()
+
+    assert save(first_worker, email="ana@example.com", observaciones="Galpón 200 m²")
+    # Otro worker, el mismo email escrito distinto
+    assert save(second_worker, email=" ANA@example.com", whatsapp="11 1234 5678",
+                observaciones="Vivienda 80 m²")
+
+    insert, update = log.read_from(0, 10)
+    assert insert.kind == "contactos"
+    assert update.kind == "contactos_actualizacion"
+    assert update.record[PENDING_INSERT_FIELD] == insert.key
+    assert update.record["mensaje_consulta"] == "Galpón 200 m²\n---\nVivienda 80 m²"
+    assert "email_cliente" not in update.record
+    assert second_worker.customer_index.status()["pending"] == 1
+
+
+def test_pending_update_is_delivered_with_the_new_row_id(make_service, log):
+    service = make_service()
+    save(service, email="ana@example.com", observaciones="Galpón")
+    save(service, email="ana@example.com", observaciones="Vivienda")
+    insert_key = log.read_from(0, 10)[0].key
+
+    sent = []
+    deliver(service, sent)
+
+    assert len(sent) == 2
+    assert sent[1]["Id"] == 101
+    assert PENDING_INSERT_FIELD not in sent[1]
+    assert service.customer_index.inserted_ids[insert_key] == 101
+    assert service.customer_index.lookup("ana@example.com", None) == 101
+
+    # Una tercera consulta ya apunta a la fila por su Id
+    save(service, email="ana@example.com", observaciones="Quincho")
+    assert log.read_from(0, 10)[-1].record["Id"] == 101
+
+
+def test_different_customers_are_not_merged(make_service, log):
+    service = make_service()
+    save(service, email="ana@example.com", whatsapp="11 1234 5678")
+    save(service, email="beto@example.com", whatsapp="11 8765 4321")
+
+    assert [entry.kind for entry in log.read_from(0, 10)] == ["contactos", "contactos"]
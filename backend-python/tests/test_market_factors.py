@@ -0,0 +1,95 @@
+"""
+Cotización antes y después de publicar precios: los factores de mercado solo la corrigen
+con una fuente de mercado real y siempre dentro de la banda admitida
+"""
+
+from datetime import datetime
+
+import pytest
+
+from app.argentina_apis import argentina_api_service
+from app.config import settings
+from app.construction_calculator import ConstructionCalculator
+from app.cost_index import cost_index
+from app.events import price_events
+from app.price_updater import price_updater_service
+
+QUOTE = {
+    'location': 'mendoza',
+    'construction_type': 'steel-frame',
+    'square_meters': 120,
+    'floors': 1,
+    'usage_type': 'residencial',
+    'finish_level': 'estandar'
+}
+
+# Precios simulados del INDEC (ARS/m²) convertidos con el tipo de cambio estimado
+SIMULATED_INDEC_USD = {
+    'steel_frame_m2': 94500.0 * 0.0011,
+    'industrial_m2': 112500.0 * 0.0011,
+    'container_m2': 72000.0 * 0.0011,
+    'materials_m2': 40500.0 * 0.0011,
+    'labor_m2': 31500.0 * 0.0011,
+    'finishes_m2': 22500.0 * 0.0011
+}
+
+
+@pytest.fixture
+def calculator(monkeypatch):
+    # Bus sin snapshots previos y sin los suscriptores de otros módulos
+    monkeypatch.setattr(price_events, "_subscribers", {})
+    monkeypatch.setattr(price_events, "_latest", {})
+    return ConstructionCalculator()
+
+
+def construction_cost(calculator: ConstructionCalculator) -> float:
+    estimate = calculator.calculate_quick_estimate(QUOTE)
+    return calculator._extract_numeric_cost(estimate['construction_cost'])
+
+
+def market_values(deviation: float):
+    """Precios de mercado que se desvían `deviation` de lo que la calculadora ya cobra hoy"""
+    book = argentina_api_service.base_price_book.current(settings.CALCULATOR_BASE_PRICES_DATE)
+    growth = cost_index.factor(settings.CALCULATOR_BASE_PRICES_DATE)
+    values = dict(SIMULATED_INDEC_USD)
+    for tipo in ('steel_frame', 'industrial', 'container'):
+        values[f'{tipo}_m2'] = book[(tipo, 'total')] * growth * deviation
+    return values
+
+
+def publish(monkeypatch, values, source: str):
+    monkeypatch.setattr(price_updater_service, "prices_source", source)
+    price_updater_service._publish_prices(values, "test", datetime.now())
+
+
+def test_simulated_feed_does_not_move_the_quote(calculator, monkeypatch):
+    before = construction_cost(calculator)
+    publish(monkeypatch, SIMULATED_INDEC_USD, "indec_simulado")
+    assert construction_cost(calculator) == before
+    assert set(calculator.market_factors.values()) == {1.0}
+
+
+def test_index_only_prices_do_not_move_the_quote(calculator, monkeypatch):
+    before = construction_cost(calculator)
+    publish(monkeypatch, market_values(0.5), "indice")
+    assert construction_cost(calculator) == before
+
+
+def test_market_feed_in_line_with_index_keeps_the_quote(calculator, monkeypatch):
+    before = construction_cost(calculator)
+    publish(monkeypatch, market_values(1.0), "indec")
+    assert construction_cost(calculator) == pytest.approx(before, abs=1)
+
+
+def test_market_feed_moves_the_quote(calculator, monkeypatch):
+    before = construction_cost(calculator)
+    publish(monkeypatch, market_values(1.10), "indec")
+    assert construction_cost(calculator) == pytest.approx(before * 1.10, abs=1)
+
+
+def test_market_factor_is_clamped(calculator, monkeypatch):
+    before = construction_cost(calculator)
+    publish(monkeypatch, market_values(0.5), "indec")
+    assert construction_cost(calculator) == pytest.approx(before * settings.MARKET_FACTOR_MIN, abs=1)
+    publish(monkeypatch, market_values(3.0), "indec")
+    assert construction_cost(calculator) == pytest.approx(before * settings.MARKET_FACTOR_MAX, abs=1)
@@ -0,0 +1,169 @@
+"""
+Outbox de NocoDB: el cursor avanza solo sobre lo entregado, la compactación conserva lo
+pendiente y, tras un reinicio, el worker retoma desde el cursor persistido
+"""
+
+import asyncio
+
+import pytest
+
+from app import nocodb_service as nocodb_service_module
+from app.config import settings
+from app.nocodb_service import NocodbRejectedError, NocodbService
+from app.outbox import Outbox
+
+
+class FakeWriter:
+    """Reemplaza al BulkWriteBatcher: registra los envíos y falla para los nombres indicados"""
+
+    def __init__(self, fail=(), reject=()):
+        self.sent = []
+        self.fail = set(fail)
+        self.reject = set(reject)
+
+    async def add(self, record):
+        nombre = record.get("nombre")
+        if nombre in self.reject:
+            raise NocodbRejectedError(422, "campo inválido")
+        if nombre in self.fail:
+            return False
+        self.sent.append(nombre)
+        return {"Id": len(self.sent)}
+
+
+@pytest.fixture
+def log(tmp_path):
+    return Outbox(str(tmp_path / "outbox.jsonl"), segment_bytes=1)
+
+
+@pytest.fixture
+def make_service(monkeypatch, tmp_path, log):
+    monkeypatch.setattr(settings, "NOCODB_REPLICA_DIR", str(tmp_path / "replica"))
+    monkeypatch.setattr(nocodb_service_module, "outbox", log)
+
+    def make(writer: FakeWriter) -> NocodbService:
+        service = NocodbService()
+        service._writers = {"cotizaciones": writer}
+        return service
+
+    return make
+
+
+def append(log: Outbox, *nombres):
+    return [log.append("cotizaciones", {"nombre": nombre}) for nombre in nombres]
+
+
+def process(service: NocodbService) -> float:
+    try:
+        return asyncio.run(service._process_outbox())
+    finally:
+        service.outbox_lock.release()
+
+
+def test_cursor_stops_at_the_first_undelivered_entry(make_service, log):
+    log.segment_bytes = 10 ** 9
+    keys = append(log, "a", "b", "c")
+    writer = FakeWriter(fail={"a"})
+    service = make_service(writer)
+
+    process(service)
+
+    offset, delivered = log.load_cursor()
+    assert writer.sent == ["b", "c"]
+    assert offset == 0
+    assert delivered == set(keys[1:])
+
+    # Entregada la primera, el cursor pasa todo el prefijo y olvida las claves
+    writer.fail.clear()
+    service._outbox_retry_at.clear()
+    process(service)
+
+    assert writer.sent == ["b", "c", "a"]
+    assert log.load_cursor() == (log.size(), set())
+
+
+def test_compaction_keeps_only_pending_entries(log):
+    keys = append(log, "a", "b", "c")
+    entries = log.read_from(0, 10)
+    old_inode = log.inode()
+
+    offset = log.compact(entries[1].end, {keys[2]})
+
+    assert offset == 0
+    assert log.inode() != old_inode
+    assert [e.key for e in log.read_from(0, 10)] == [keys[2]]
+    assert log.load_cursor() == (0, {keys[2]})
+
+
+def test_cursor_from_before_compaction_reads_from_the_start(log):
+    append(log, "a", "b", "c")
+    entries = log.read_from(0, 10)
+    log.save_cursor(entries[0].end, set())
+    # Corte después de reescribir el log y antes de guardar el cursor
+    log.save_cursor = lambda offset, delivered: None
+    log.compact(entries[0].end, set())
+
+    offset, _ = log.load_cursor()
+    assert offset == 0
+    assert [e.record["nombre"] for e in log.read_from(offset, 10)] == ["b", "c"]
+
+
+def test_restart_resumes_from_the_persisted_cursor(make_service, log):
+    log.segment_bytes = 10 ** 9
+    append(log, "a", "b")
+    first = FakeWriter()
+    process(make_service(first))
+    append(log, "c")
+
+    # Worker nuevo (reinicio): solo reenvía lo que el cursor no confirmó
+    second = FakeWriter()
+    process(make_service(second))
+
+    assert first.sent == ["a", "b"]
+    assert second.sent == ["c"]
+
+
+def test_restart_after_compaction_delivers_the_pending_tail(make_service, log):
+    append(log, "a", "b")
+    first = FakeWriter(fail={"b"})
+    process(make_service(first))
+    assert [e.record["nombre"] for e in log.read_from(0, 10)] == ["b"]
+
+    second = FakeWriter()
+    process(make_service(second))
+
+    assert first.sent == ["a"]
+    assert second.sent == ["b"]
+    assert log.load_cursor() == (0, set())
+
+
+def test_replay_request_resends_from_the_offset(make_service, log):
+    log.segment_bytes = 10 ** 9
+    append(log, "a", "b", "c")
+    writer = FakeWriter()
+    service = make_service(writer)
+    process(service)
+
+    log.request_replay(log.read_from(0, 10)[1].offset)
+    process(service)
+
+    assert writer.sent == ["a", "b", "c", "b", "c"]
+    assert not log.take_replay_request()
+
+
+def test_rejected_entry_is_dead_lettered_and_the_cursor_moves_on(make_service, log):
+    log.segment_bytes = 10 ** 9
+    keys = append(log, "a", "malo", "c")
+    writer = FakeWriter(reject={"malo"})
+    service = make_service(writer)
+
+    process(service)
+
+    assert writer.sent == ["a", "c"]
+    assert log.load_cursor() == (log.size(), set())
+    assert [item["key"] for item in log.read_dead_letters()] == [keys[1]]
+    assert service.dead_letters == 1
+
+    assert log.requeue_dead_letters() == 1
+    assert log.read_dead_letters() == []
+    assert log.read_from(log.load_cursor()[0], 10)[0].record == {"nombre": "malo"}
@@ -0,0 +1,131 @@
+"""
+Cache de precios: una sola consulta a las fuentes por material aunque lleguen varias
+solicitudes juntas, y los precios vencidos se sirven mientras se refrescan en segundo plano
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import price_service as price_service_module
+from app.events import price_events
+from app.models import PrecioMaterial
+from app.price_service import PriceService
+
+MATERIAL = "acero_estructural"
+
+
+def precio(valor: float, fuente: str = "indec") -> PrecioMaterial:
+    return PrecioMaterial(
+        material=MATERIAL,
+        precio_por_m2=valor,
+        moneda="ARS",
+        fecha_actualizacion=datetime.now().isoformat(),
+        fuente=fuente
+    )
+
+
+class SlowSource:
+    """Fuente que tarda `delay` segundos y cuenta las consultas recibidas"""
+
+    def __init__(self, valor: float, delay: float = 0.05):
+        self.valor = valor
+        self.delay = delay
+        self.calls = []
+
+    async def __call__(self, material: str):
+        self.calls.append(material)
+        await asyncio.sleep(self.delay)
+        return precio(self.valor)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(price_events, "_subscribers", {})
+    monkeypatch.setattr(price_events, "_latest", {})
+    monkeypatch.setattr(price_service_module.price_history, "append", lambda *args, **kwargs: None)
+    service = PriceService()
+    service.hedge_enabled = False
+    return service
+
+
+def use_source(monkeypatch, service: PriceService, source: SlowSource):
+    monkeypatch.setattr(service, "_get_sources", lambda: {"indec": source})
+
+
+def test_concurrent_requests_share_one_fetch(service, monkeypatch):
+    source = SlowSource(1000)
+    use_source(monkeypatch, service, source)
+
+    async def run():
+        return await asyncio.gather(*(service.get_material_price(MATERIAL) for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert source.calls == [MATERIAL]
+    assert {r.precio_por_m2 for r in results} == {1000}
+
+
+def test_batch_and_single_requests_share_one_fetch(service, monkeypatch):
+    source = SlowSource(1000)
+    use_source(monkeypatch, service, source)
+
+    async def run():
+        return await asyncio.gather(
+            service.get_material_prices([MATERIAL, MATERIAL]),
+            service.get_material_price(MATERIAL)
+        )
+
+    batch, single = asyncio.run(run())
+    assert source.calls == [MATERIAL]
+    assert batch[MATERIAL]["precio"].precio_por_m2 == single.precio_por_m2 == 1000
+    assert batch[MATERIAL]["frescura"] == "vigente"
+
+
+def test_expired_entry_is_served_while_refreshing(service, monkeypatch):
+    source = SlowSource(2000)
+    use_source(monkeypatch, service, source)
+    service._cache_set(MATERIAL, precio(1000))
+    service.cache[MATERIAL].expires_at = datetime.now() - timedelta(seconds=1)
+
+    async def run():
+        stale = await service.get_material_price(MATERIAL)
+        again = await service.get_material_price(MATERIAL)
+        # Un solo refresco en curso para las dos lecturas
+        assert list(service._refreshing) == [MATERIAL]
+        await service._refreshing[MATERIAL]
+        return stale, again, await service.get_material_price(MATERIAL)
+
+    stale, again, fresh = asyncio.run(run())
+    assert stale.precio_por_m2 == again.precio_por_m2 == 1000
+    assert fresh.precio_por_m2 == 2000
+    assert source.calls == [MATERIAL]
+    assert service.cache[MATERIAL].is_fresh
+
+
+def test_batch_deadline_keeps_the_stale_price(service, monkeypatch):
+    source = SlowSource(2000, delay=1)
+    use_source(monkeypatch, service, source)
+    service.batch_deadline = 0.05
+    service._cache_set(MATERIAL, precio(1000))
+    service.cache[MATERIAL].expires_at = datetime.now() - timedelta(seconds=1)
+
+    async def run():
+        service._schedule_batch_refresh([MATERIAL])
+        return await service._refreshing[MATERIAL]
+
+    entry = asyncio.run(run())
+    assert entry.precio.precio_por_m2 == 1000
+    assert not entry.is_fresh
+    assert service.deadline_cancellations["indec"] == 1
+
+
+def test_batch_deadline_falls_back_to_base_price(service, monkeypatch):
+    source = SlowSource(2000, delay=1)
+    use_source(monkeypatch, service, source)
+    service.batch_deadline = 0.05
+
+    results = asyncio.run(service.get_material_prices([MATERIAL]))
+    assert results[MATERIAL]["frescura"] == "precio_base"
+    # Sin respuesta no se cachea un negativo: la próxima solicitud vuelve a consultar
+    assert MATERIAL not in service.cache
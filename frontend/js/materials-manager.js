@@ -45,6 +45,7 @@ class MaterialsManager {
                 category: material.categoria || material.category || "general",
                 description: material.descripcion || material.description || "Descripción no disponible",
                 price: material.precio || material.price || 0,
+                currency: material.moneda || material.currency || "USD",
                 unit: material.unidad || material.unit || "unidad"
             }));
         }
@@ -90,13 +91,19 @@ class MaterialsManager {
                 </div>
                 <div class="material-description">${material.description}</div>
                 <div class="material-price">
-                    <span class="price-value">U$D ${material.price.toFixed(2)}</span>
+                    <span class="price-value">${this.formatPrice(material)}</span>
                     <span class="price-unit">por ${material.unit}</span>
                 </div>
             </div>
         `).join("");
     }
 
+    formatPrice(material) {
+        // El catálogo mezcla materiales con precio en USD y en ARS (campo "moneda")
+        const symbol = material.currency === "ARS" ? "$" : "U$D";
+        return `${symbol} ${Number(material.price).toFixed(2)}`;
+    }
+
     formatCategory(category) {
         const categories = {
             "estructura": "Estructura",